@@ -1,9 +1,13 @@
+import json
 import random
+import time
 import numpy as np
-import numba
+
+from Chess.ChessEvaluation import BATCH_TABLES, encodeChildBoards, exchangeScore, scoreBoards, scoreMaterial, scorePosition
 
 CHECKMATE = np.inf
 STALEMATE = -1
+evaluatePosition = scorePosition  # Leaf evaluation of the search, one of ChessEvaluation.EVALUATIONS
 
 '''
 Picks and return a random move.
@@ -31,7 +35,7 @@ def findMinMaxGreedyMoveOneStep(gs, validMoves): #Minimize the opponents next ma
             elif gs.staleMate:
                 score = -turnMultiplier * STALEMATE
             else:
-                score = -turnMultiplier * scoreMaterial(gs.board)
+                score = -turnMultiplier * evaluatePosition(gs)
             if score > opponentMaxScore:
                 opponentMaxScore = score
             gs.undoMove()
@@ -41,155 +45,708 @@ def findMinMaxGreedyMoveOneStep(gs, validMoves): #Minimize the opponents next ma
         gs.undoMove()
     return bestPlayerMove
 
-def findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove, depth, alpha, beta):
+'''
+Transposition table: remembers the result of every searched position by its Zobrist key, so positions reached again by
+another move order (or in the next search) are not searched from scratch. The size is fixed in MB, each slot holds
+one position and a new position only replaces a deeper one if that one is left over from an older search.
+'''
+TRANSPOSITION_TABLE_MB = 64
+EXACT, LOWERBOUND, UPPERBOUND = 0, 1, 2  # Type of the stored score
+ENTRY_BYTES = 160  # Approximate memory of one slot (key, entry tuple and its fields)
+
+class TranspositionTable():
+    def __init__(self, sizeMB=TRANSPOSITION_TABLE_MB):
+        entries = max(1, int(sizeMB * 2 ** 20) // ENTRY_BYTES)
+        self.size = 1 << (entries.bit_length() - 1)  # Power of two, so the slot is key & mask
+        self.mask = self.size - 1
+        self.clear()
+
+    def clear(self):
+        self.keys = [None] * self.size
+        self.entries = [None] * self.size  # (depth, score, flag, move, age)
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+        self.rejected = 0
+
+    '''
+    Called once per root search, entries of older searches are replaced first
+    '''
+
+    def newSearch(self):
+        self.age += 1
+
+    '''
+    Return (depth, score, flag, move) stored for the key or None
+    '''
+
+    def probe(self, key):
+        index = key & self.mask
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.entries[index]
+        self.misses += 1
+        return None
+
+    '''
+    Same as probe without counting, for looking at the table outside of the search
+    '''
+
+    def getEntry(self, key):
+        index = key & self.mask
+        return self.entries[index] if self.keys[index] == key else None
+
+    def store(self, key, depth, score, flag, move):
+        index = key & self.mask
+        storedKey = self.keys[index]
+        if storedKey is not None and storedKey != key:
+            storedEntry = self.entries[index]
+            if storedEntry[4] == self.age and storedEntry[0] > depth:  # Keep the deeper result of this search
+                self.rejected += 1
+                return
+            self.overwrites += 1
+        self.keys[index] = key
+        self.entries[index] = (depth, score, flag, move, self.age)
+        self.stores += 1
+
+    def getStats(self):
+        used = self.size - self.keys.count(None)
+        return {"size": self.size, "used": used, "hits": self.hits, "misses": self.misses, "stores": self.stores,
+                "overwrites": self.overwrites, "rejected": self.rejected}
+
+transpositionTable = TranspositionTable()
+
+'''
+Move ordering: the move of the transposition table first, then captures by most valuable victim / least valuable
+attacker (MVV-LVA), then the killer moves of the ply (quiet moves that caused a beta cutoff in a sibling node), then
+the other quiet moves by their history score (how often a piece moving to a square caused a cutoff).
+'''
+MOVE_ORDERING = True  # Switch off to compare the number of searched nodes
+orderingValue = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 10}
+killerMoves = {}  # Ply (GameState.ply) -> the last two quiet moves causing a cutoff
+historyTable = {piece: [0] * 64 for piece in ['wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK']}
+
+def orderMoves(gs, validMoves, hashMove):
+    killers = killerMoves.get(gs.ply, ())
+
+    def moveOrderingScore(move):
+        if hashMove is not None and move == hashMove:
+            return 3000000
+        if move.pieceCaptured != "--":
+            return 2000000 + 10 * orderingValue[move.pieceCaptured[1]] - orderingValue[move.pieceMoved[1]]
+        if move.pawnPromotionPiece != False:
+            return 2000000 + orderingValue[move.pawnPromotionPiece]
+        if move in killers:
+            return 1000000
+        return historyTable[move.pieceMoved][move.endRow * 8 + move.endCol]
+
+    validMoves.sort(key=moveOrderingScore, reverse=True)
+
+'''
+Remember a quiet move that caused a beta cutoff as killer move of its ply and in the history table
+'''
+def storeCutoffMove(gs, move, depth):
+    if move.pieceCaptured != "--" or move.pawnPromotionPiece != False:
+        return
+    killers = killerMoves.setdefault(gs.ply, [])
+    if move not in killers:
+        killers.insert(0, move)
+        del killers[2:]
+    historyTable[move.pieceMoved][move.endRow * 8 + move.endCol] += depth * depth
+
+'''
+Counters of a search, reset at the start of every root search. With PROFILE_PHASES the time spent generating moves,
+making/undoing moves and evaluating leaves is measured as well, which costs a few percent of speed.
+'''
+PROFILE_PHASES = False
+
+class SearchStats():
+    def __init__(self):
+        self.nodes = 0
+        self.leaves = 0
+        self.quiescenceNodes = 0  # Part of nodes
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.nullMoveCutoffs = 0
+        self.reSearches = 0  # Reduced or zero window searches repeated at full depth or with the full window
+        self.tablebaseHits = 0
+        self.moveGenerationTime = 0
+        self.makeUndoTime = 0
+        self.evaluationTime = 0
+        self.startTime = time.perf_counter()
+        self.elapsed = 0
+        self.depth = 0  # Deepest completed iteration
+        self.score = 0
+        self.bestMove = None
+        self.principalVariation = []
+        self.iterations = []  # (depth, score, nodes, seconds, best move) of every completed iteration
+
+    def getFirstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0
+
+    def getNodesPerSecond(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0
+
+    '''
+    Record a completed iteration (or the single depth of findBestMove)
+    '''
+
+    def completeIteration(self, gs, depth, score, move):
+        self.elapsed = time.perf_counter() - self.startTime
+        self.depth = depth
+        self.score = score
+        self.bestMove = move
+        self.principalVariation = getPrincipalVariation(gs, depth)
+        self.iterations.append((depth, score, self.nodes, self.elapsed, move))
+
+    '''
+    Plain values for logging, mate scores (infinite) are given as "mate": 1 for white and -1 for black
+    '''
+
+    def asDict(self):
+        mate = 0 if abs(self.score) != CHECKMATE else (1 if self.score > 0 else -1)
+        return {"depth": self.depth, "score": float(self.score) if mate == 0 else None, "mate": mate,
+                "bestMove": moveNotation(self.bestMove) if self.bestMove is not None else None,
+                "pv": [moveNotation(move) for move in self.principalVariation],
+                "nodes": self.nodes, "leaves": self.leaves, "quiescenceNodes": self.quiescenceNodes,
+                "nps": round(self.getNodesPerSecond()), "cutoffs": self.cutoffs,
+                "firstMoveCutoffRate": round(self.getFirstMoveCutoffRate(), 4), "nullMoveCutoffs": self.nullMoveCutoffs,
+                "reSearches": self.reSearches, "tablebaseHits": self.tablebaseHits,
+                "time": round(self.elapsed, 6), "moveGenerationTime": round(self.moveGenerationTime, 6),
+                "makeUndoTime": round(self.makeUndoTime, 6), "evaluationTime": round(self.evaluationTime, 6),
+                "iterations": [[depth, float(score) if abs(score) != CHECKMATE else None, nodes, round(seconds, 6),
+                                moveNotation(move) if move is not None else None]
+                               for depth, score, nodes, seconds, move in self.iterations]}
+
+searchStats = SearchStats()
+
+def moveNotation(move):
+    return move.getChessNotation() + (move.pawnPromotionPiece or "")
+
+'''
+Follow the moves stored in the transposition table from the current position, that is the line the search expects
+to be played. Stops at a missing or illegal entry and at a repeated position.
+'''
+def getPrincipalVariation(gs, maxLength):
+    line = []
+    seenKeys = set()
+    while len(line) < maxLength and gs.zobristKey not in seenKeys:
+        seenKeys.add(gs.zobristKey)
+        entry = transpositionTable.getEntry(gs.zobristKey)
+        if entry is None or entry[3] is None or entry[3] not in gs.getValidMoves():
+            break
+        gs.makeMove(entry[3])
+        line.append(entry[3])
+    for move in line:
+        gs.undoMove()
+    return line
+
+'''
+Profiling hooks are called with the SearchStats of every finished root search, i.e. once per move the engine plays
+'''
+searchHooks = []
+
+def addSearchHook(hook):
+    searchHooks.append(hook)
+
+def removeSearchHook(hook):
+    searchHooks.remove(hook)
+
+def finishSearch():
+    for hook in searchHooks:
+        hook(searchStats)
+
+'''
+Search hook writing the stats of every search as one JSON object per line, e.g.
+ChessAI.addSearchHook(ChessAI.JsonLinesSearchLogger("search.jsonl"))
+'''
+class JsonLinesSearchLogger():
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, stats):
+        with open(self.path, "a") as file:
+            file.write(json.dumps(stats.asDict()) + "\n")
+
+'''
+Prepare the tables for a new root search: age the transposition table, forget the killer moves and halve the history
+scores so that recent cutoffs count more
+'''
+def startSearch():
+    global searchStats
+    transpositionTable.newSearch()
+    killerMoves.clear()
+    for scores in historyTable.values():
+        for i in range(64):
+            scores[i] //= 2
+    searchStats = SearchStats()
+
+'''
+Forget everything learned in earlier searches, so the next search only depends on the position (reproducible results)
+'''
+def clearSearchTables():
+    transpositionTable.clear()
+    killerMoves.clear()
+    for scores in historyTable.values():
+        for i in range(64):
+            scores[i] = 0
+
+'''
+Endgame tablebases (ChessTablebase.Tablebase, set by the caller): positions with at most tablebase.maxPieces pieces
+get their exact result instead of a search. A win scores TABLEBASE_WIN less a hundredth of a pawn per ply of the game
+up to the mate, so shorter mates score higher but still less than a mate seen by the search (CHECKMATE).
+'''
+tablebase = None
+TABLEBASE_WIN = 1000
+
+'''
+Score of the position seen from white by the tablebases, or None if it isn't in them
+'''
+def probeTablebase(gs):
+    if tablebase is None or gs.pieceCount() > tablebase.maxPieces:
+        return None
+    value = tablebase.probe(gs)
+    if value is None:
+        return None
+    searchStats.tablebaseHits += 1
+    if value == 0:
+        return 0
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    if value > 0:
+        return turnMultiplier * (TABLEBASE_WIN - (gs.ply + value) / 100)
+    return -turnMultiplier * (TABLEBASE_WIN - (gs.ply - value - 1) / 100)
+
+'''
+(score, move) of the root position by the tablebases, or None if it isn't in them
+'''
+def findTablebaseMove(gs):
+    if tablebase is None or gs.pieceCount() > tablebase.maxPieces:
+        return None
+    result = tablebase.findBestMove(gs)
+    if result is None:
+        return None
+    return probeTablebase(gs), result[1]
+
+'''
+Search the best move of the current position to the given depth
+'''
+def findBestMove(gs, depth):
+    startSearch()
+    tablebaseResult = findTablebaseMove(gs)
+    if tablebaseResult is not None:
+        score, move = tablebaseResult
+    else:
+        score, move = findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove=None, depth=depth, alpha=-CHECKMATE, beta=CHECKMATE)
+    searchStats.completeIteration(gs, depth, score, move)
+    finishSearch()
+    return move
+
+'''
+Time and node budget of a running search. Once it is used up, or the stopEvent (threading.Event) is set by another
+thread, the search unwinds without storing partial results. A ponder search (ponderhitEvent given) searches without
+time limit until the event is set, from then on the time counts from the start of the search, so a long ponder
+answers at once.
+'''
+class SearchLimits():
+    def __init__(self, maxTime=None, maxNodes=None, stopEvent=None, ponderhitEvent=None):
+        self.deadline = time.perf_counter() + maxTime if maxTime is not None else None
+        self.maxNodes = maxNodes
+        self.stopEvent = stopEvent
+        self.ponderhitEvent = ponderhitEvent
+        self.nodes = 0
+        self.stopped = False
+
+    def isPondering(self):
+        return self.ponderhitEvent is not None and not self.ponderhitEvent.is_set()
+
+    def checkStop(self, nodes=1):
+        self.nodes += nodes
+        if (self.deadline is not None and time.perf_counter() >= self.deadline and not self.isPondering()) or \
+                (self.maxNodes is not None and self.nodes >= self.maxNodes) or \
+                (self.stopEvent is not None and self.stopEvent.is_set()):
+            self.stopped = True
+        return self.stopped
+
+searchLimits = None  # Limits of the iterative deepening search in progress
+
+'''
+Search depth 1, 2, 3, ... until the time (seconds) or node budget is used up and return (score, move) of the deepest
+completed iteration. Each iteration tries the best moves of the previous one first, they are kept in the
+transposition table. A position in the tablebases is answered from them without a search. Depth 1 is always
+completed so there is a move to play. Setting stopEvent ends the search like the budget does, see SearchLimits for
+pondering. The counters of the search are left in searchStats.
+'''
+def findBestMoveIterativeDeepening(gs, maxTime=None, maxNodes=None, maxDepth=64, stopEvent=None, ponderhitEvent=None):
+    global searchLimits
+    startSearch()
+    tablebaseResult = findTablebaseMove(gs)
+    if tablebaseResult is not None:  # Exact result, nothing to search
+        searchStats.completeIteration(gs, 1, *tablebaseResult)
+        finishSearch()
+        return tablebaseResult
+    bestScore, bestMove = findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove=None, depth=1, alpha=-CHECKMATE, beta=CHECKMATE)
+    searchStats.completeIteration(gs, 1, bestScore, bestMove)
+    searchLimits = SearchLimits(maxTime, maxNodes, stopEvent, ponderhitEvent)
+    try:
+        for depth in range(2, maxDepth + 1):
+            if abs(bestScore) == CHECKMATE:  # Forced mate found, deeper searches can't change that
+                break
+            score, move = findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove=None, depth=depth, alpha=-CHECKMATE, beta=CHECKMATE)
+            if searchLimits.stopped:
+                break
+            bestScore, bestMove = score, move
+            searchStats.completeIteration(gs, depth, score, move)
+    finally:
+        searchLimits = None
+    searchStats.elapsed = time.perf_counter() - searchStats.startTime
+    finishSearch()
+    return bestScore, bestMove
+
+'''
+Selective search, every technique can be switched off to compare node counts and times:
+- Null move pruning: let the side to move pass and search the position reduced by NULL_MOVE_REDUCTION with a zero
+  window. If it still fails high the real moves will too and the node is cut. Not in check, and not for a side that
+  has only pawns left, where zugzwang makes passing look better than any move.
+- Late move reductions (LMR): quiet moves ordered late are searched LATE_MOVE_REDUCTION plies shallower, and again at
+  full depth if they turn out better than alpha (beta for black).
+- Principal variation search (PVS): moves after the first are only probed with a zero window around the best score so
+  far, which proves cheaply that they are worse. Only a move that beats it is searched again with the full window.
+'''
+NULL_MOVE_PRUNING = True
+LATE_MOVE_REDUCTIONS = True
+PRINCIPAL_VARIATION_SEARCH = True
+NULL_MOVE_REDUCTION = 2  # One more from depth 6 on
+LATE_MOVE_REDUCTION = 1
+LATE_MOVE_MINIMUM = 3  # Moves searched at full depth before the reductions start
+VERY_LATE_MOVE_MINIMUM = 8  # From this move on the reduction is one ply more, at depth 5 and deeper
+ZERO_WINDOW = 0.001  # Smaller than the smallest score step (a hundredth of a pawn, between tablebase scores)
+
+'''
+Minimax search with alpha-beta pruning. Scores are seen from white, white maximizes and black minimizes.
+'''
+def findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove, depth, alpha, beta, allowNullMove=True):
+    if depth == 0 and QUIESCENCE_SEARCH:
+        return quiescenceSearch(gs, alpha, beta), playerBestMove
+    if searchLimits is not None and searchLimits.checkStop():
+        return 0, None
+    searchStats.nodes += 1
+    alphaOriginal = alpha
+    betaOriginal = beta
+    hashMove = None
+    entry = transpositionTable.probe(gs.zobristKey)
+    if entry is not None:
+        entryDepth, entryScore, entryFlag, hashMove = entry[0], entry[1], entry[2], entry[3]
+        if entryDepth >= depth:
+            if entryFlag == EXACT:
+                return entryScore, hashMove
+            elif entryFlag == LOWERBOUND:
+                alpha = max(alpha, entryScore)
+            else:
+                beta = min(beta, entryScore)
+            if beta <= alpha:
+                return entryScore, hashMove
+
     #Value of last knots
-    if depth == 0 or gs.checkMate or gs.staleMate:
-        turnMultiplier = 1 if gs.whiteToMove else -1
-        if gs.checkMate:
-            score = turnMultiplier*CHECKMATE
-        elif gs.staleMate:
-            score = turnMultiplier*STALEMATE
-        else:
-            score = scoreMaterial(gs.board)
-        return score, playerBestMove
+    if depth == 0:
+        searchStats.leaves += 1
+        if PROFILE_PHASES:
+            startTime = time.perf_counter()
+            score = evaluatePosition(gs)
+            searchStats.evaluationTime += time.perf_counter() - startTime
+            return score, playerBestMove
+        return evaluatePosition(gs), playerBestMove
+
+    #Pass the turn, if that is already good enough the node is cut
+    inCheck = depth >= 3 and (NULL_MOVE_PRUNING or LATE_MOVE_REDUCTIONS) and gs.inCheck()
+    if NULL_MOVE_PRUNING and allowNullMove and depth >= 3 and not inCheck and \
+            gs.hasNonPawnMaterial("w" if gs.whiteToMove else "b"):
+        score = searchNullMove(gs, depth, alpha, beta)
+        if searchLimits is not None and searchLimits.stopped:
+            return 0, None
+        if score is not None and ((score >= beta) if gs.whiteToMove else (score <= alpha)):
+            searchStats.nullMoveCutoffs += 1
+            if abs(score) == CHECKMATE:  # A mate found after passing isn't proven
+                score = beta if gs.whiteToMove else alpha
+            return score, playerBestMove
+
+    if PROFILE_PHASES:
+        startTime = time.perf_counter()
+        validMoves = gs.getValidMoves()
+        searchStats.moveGenerationTime += time.perf_counter() - startTime
+    else:
+        validMoves = gs.getValidMoves()
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    if gs.checkMate:
+        searchStats.leaves += 1
+        return -turnMultiplier*CHECKMATE, None
+    elif gs.staleMate:
+        searchStats.leaves += 1
+        return turnMultiplier*STALEMATE, None
+
+    #Search the most promising moves first
+    if MOVE_ORDERING:
+        orderMoves(gs, validMoves, hashMove)
+    elif hashMove is not None and hashMove in validMoves:
+        validMoves.remove(hashMove)
+        validMoves.insert(0, hashMove)
+    playerBestMove = validMoves[0]
+    reduceLateMoves = LATE_MOVE_REDUCTIONS and depth >= 3 and not inCheck
+    killers = killerMoves.get(gs.ply, ())
+    batchLeaves = depth == 1 and BATCH_LEAF_EVALUATION and not QUIESCENCE_SEARCH and evaluatePosition in BATCH_TABLES \
+        and len(validMoves) > 2 and (tablebase is None or gs.pieceCount() > tablebase.maxPieces + 1)
+    leafScores = None
 
     #Iterative valuation for white
     if gs.whiteToMove:
-        maxEval = -np.inf
-        for playerMove in gs.getValidMoves():
-            gs.makeMove(playerMove)
-            if gs.checkMate:
-                maxEval = CHECKMATE
-                playerBestMove = playerMove
-            elif gs.staleMate:
-                maxEval = -STALEMATE
-                playerBestMove = playerMove
+        bestEval = -np.inf
+        for moveNumber, playerMove in enumerate(validMoves):
+            if batchLeaves and moveNumber == 1:  # The first move didn't cut, the others are scored together
+                leafScores = [None] + evaluateLeafMoves(gs, validMoves[1:])
+            if leafScores is not None:
+                eval = leafScores[moveNumber]
             else:
-                eval = findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove, depth-1, alpha, beta)[0]
-                gs.undoMove()
-                if eval > maxEval:
-                    playerBestMove = playerMove
-                maxEval = max(maxEval, eval)
-                alpha = max(alpha, eval)
-                if beta <= alpha:
-                    break
-        return maxEval, playerBestMove
+                reduction = lateMoveReduction(depth, moveNumber, playerMove, killers) if reduceLateMoves else 0
+                eval = searchMove(gs, playerMove, playerBestMove, depth, alpha, beta, moveNumber, reduction)
+            if searchLimits is not None and searchLimits.stopped:
+                break
+            if eval > bestEval:
+                bestEval = eval
+                playerBestMove = playerMove
+            alpha = max(alpha, eval)
+            if beta <= alpha:
+                searchStats.cutoffs += 1
+                if playerMove is validMoves[0]:
+                    searchStats.firstMoveCutoffs += 1
+                if MOVE_ORDERING:
+                    storeCutoffMove(gs, playerMove, depth)
+                break
 
     #Iterative valuation for black
     else:
-        minEval = np.inf
-        for playerMove in gs.getValidMoves():
-            gs.makeMove(playerMove)
-            if gs.checkMate:
-                minEval = -CHECKMATE
-                playerBestMove = playerMove
-            elif gs.staleMate:
-                minEval = -STALEMATE
-                playerBestMove = playerMove
+        bestEval = np.inf
+        for moveNumber, playerMove in enumerate(validMoves):
+            if batchLeaves and moveNumber == 1:  # The first move didn't cut, the others are scored together
+                leafScores = [None] + evaluateLeafMoves(gs, validMoves[1:])
+            if leafScores is not None:
+                eval = leafScores[moveNumber]
             else:
-                eval = findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove, depth-1, alpha, beta)[0]
-                gs.undoMove()
-                if eval < minEval:
-                    playerBestMove = playerMove
-                minEval = min(minEval, eval)
-                beta = min(beta, eval)
-                if beta <= alpha:
-                    break
-        return minEval, playerBestMove
-
-'''
-Score the board based on material.
-'''
-pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1} #King is equal to zero since they cancel each other out
-
-rookBoardScore = [[4, 3, 4, 4, 4, 4, 3, 4],
-                    [4, 4, 4, 4, 4, 4, 4, 4],
-                    [1, 1, 2, 3, 3, 2, 1, 1],
-                    [1, 2, 3, 4, 4, 3, 2, 1],
-                    [1, 2, 3, 4, 4, 3, 2, 1],
-                    [1, 1, 2, 3, 3, 2, 1, 1],
-                    [4, 4, 4, 4, 4, 4, 4, 4],
-                    [4, 3, 4, 4, 4, 4, 3, 4]]
-
-knightBoardScore = [[1, 1, 1, 1, 1, 1, 1, 1],
-                    [1, 2, 2, 2, 2, 2, 2, 1],
-                    [1, 2, 3, 3, 3, 3, 2, 1],
-                    [1, 2, 3, 4, 4, 3, 2, 1],
-                    [1, 2, 3, 4, 4, 3, 2, 1],
-                    [1, 2, 3, 3, 3, 3, 2, 1],
-                    [1, 2, 2, 2, 2, 2, 2, 1],
-                    [1, 1, 1, 1, 1, 1, 1, 1]]
-
-bishopBoardScore = [[4, 3, 2, 1, 1, 2, 3, 4],
-                    [3, 4, 3, 2, 2, 3, 4, 3],
-                    [2, 3, 4, 3, 3, 4, 3, 2],
-                    [1, 2, 3, 4, 4, 3, 2, 1],
-                    [1, 2, 3, 4, 4, 3, 2, 1],
-                    [2, 3, 4, 3, 3, 4, 3, 2],
-                    [3, 4, 3, 2, 2, 3, 4, 3],
-                    [4, 3, 2, 1, 1, 2, 3, 4]]
-
-queenBoardScore = [[1, 1, 1, 3, 1, 1, 1, 1],
-                    [1, 1, 2, 3, 2, 1, 2, 1],
-                    [1, 4, 3, 3, 3, 4, 2, 1],
-                    [1, 2, 3, 3, 3, 2, 2, 1],
-                    [1, 2, 3, 3, 3, 2, 2, 1],
-                    [1, 4, 3, 3, 3, 4, 2, 1],
-                    [1, 1, 2, 3, 2, 1, 2, 1],
-                    [1, 1, 1, 3, 1, 1, 1, 1]]
-
-kingBoardScore = [[0, 0, 0, 0, 0, 0, 0, 0],
-                    [0, 0, 0, 0, 0, 0, 0, 0],
-                    [0, 0, 0, 0, 0, 0, 0, 0],
-                    [0, 0, 0, 0, 0, 0, 0, 0],
-                    [0, 0, 0, 0, 0, 0, 0, 0],
-                    [0, 0, 0, 0, 0, 0, 0, 0],
-                    [0, 0, 0, 0, 0, 0, 0, 0],
-                    [0, 0, 0, 0, 0, 0, 0, 0]]
-
-whitePawnBoardScore = [[8, 8, 8, 8, 8, 8, 8, 8],
-                        [8, 8, 8, 8, 8, 8, 8, 8],
-                        [5, 6, 6, 7, 7, 6, 6, 5],
-                        [2, 3, 3, 5, 5, 3, 3, 2],
-                        [1, 2, 3, 4, 4, 3, 2, 1],
-                        [1, 1, 2, 3, 3, 2, 1, 1],
-                        [1, 1, 1, 0, 0, 1, 1, 1],
-                        [0, 0, 0, 0, 0, 0, 0, 0]]
-
-blackPawnBoardScore = [[0, 0, 0, 0, 0, 0, 0, 0],
-                        [1, 1, 1, 0, 0, 1, 1, 1],
-                        [1, 1, 2, 3, 3, 2, 1, 1],
-                        [1, 2, 3, 4, 4, 3, 2, 1],
-                        [2, 3, 3, 5, 5, 3, 3, 2],
-                        [5, 6, 6, 7, 7, 6, 6, 5],
-                        [8, 8, 8, 8, 8, 8, 8, 8],
-                        [8, 8, 8, 8, 8, 8, 8, 8]]
-
-piecePositionScores = {"R": rookBoardScore, "N": knightBoardScore, "B": bishopBoardScore, "Q": queenBoardScore, "K": kingBoardScore, "wp": whitePawnBoardScore, "bp": blackPawnBoardScore}
-
-def scoreMaterial(board):
-    score = 0
-    for row in range(len(board)):
-        for col in range(len(board[row])):
-            square = board[row][col]
-
-            if square != "--":
-                piecePositionScore = 0
-
-                if square == "wp":
-                    piecePositionScore = piecePositionScores["wp"][row][col]
-
-                elif square == "bp":
-                    piecePositionScore = piecePositionScores["bp"][row][col]
-
-                elif square[1] != "p":
-                    piecePositionScore = piecePositionScores[square[1]][row][col]
-
-                if square[0] == "w":
-                    score += pieceScore[square[1]] + piecePositionScore * .1
-                elif square[0] == "b":
-                    score -= pieceScore[square[1]] + piecePositionScore * .1
+                reduction = lateMoveReduction(depth, moveNumber, playerMove, killers) if reduceLateMoves else 0
+                eval = searchMove(gs, playerMove, playerBestMove, depth, alpha, beta, moveNumber, reduction)
+            if searchLimits is not None and searchLimits.stopped:
+                break
+            if eval < bestEval:
+                bestEval = eval
+                playerBestMove = playerMove
+            beta = min(beta, eval)
+            if beta <= alpha:
+                searchStats.cutoffs += 1
+                if playerMove is validMoves[0]:
+                    searchStats.firstMoveCutoffs += 1
+                if MOVE_ORDERING:
+                    storeCutoffMove(gs, playerMove, depth)
+                break
+
+    if searchLimits is not None and searchLimits.stopped:  # Unfinished, don't store
+        return bestEval, playerBestMove
+    if bestEval <= alphaOriginal:
+        flag = UPPERBOUND
+    elif bestEval >= betaOriginal:
+        flag = LOWERBOUND
+    else:
+        flag = EXACT
+    transpositionTable.store(gs.zobristKey, depth, bestEval, flag, playerBestMove)
+    return bestEval, playerBestMove
+
+'''
+Batch evaluation at the frontier: when the replies of a node are leaves that are evaluated statically (depth 1
+without quiescence search) and the first move doesn't cause a cutoff, the positions after all other moves are built as
+one array and scored in one call of ChessEvaluation.scoreBoards, instead of making, evaluating and undoing every move.
+Returns the scores in move order. QUIESCENCE_SEARCH is on by default, so this only runs once it is switched off.
+'''
+BATCH_LEAF_EVALUATION = True
+
+def evaluateLeafMoves(gs, validMoves):
+    searchStats.nodes += len(validMoves)
+    searchStats.leaves += len(validMoves)
+    if searchLimits is not None:
+        searchLimits.checkStop(len(validMoves))
+    startTime = time.perf_counter() if PROFILE_PHASES else None
+    scores = scoreBoards(encodeChildBoards(gs.board, validMoves), BATCH_TABLES[evaluatePosition]).tolist()
+    if PROFILE_PHASES:
+        searchStats.evaluationTime += time.perf_counter() - startTime
+    return scores
+
+def isQuietMove(move):
+    return move.pieceCaptured == "--" and move.pawnPromotionPiece == False
+
+def lateMoveReduction(depth, moveNumber, move, killers):
+    if moveNumber < LATE_MOVE_MINIMUM or not isQuietMove(move) or move in killers:
+        return 0
+    if moveNumber >= VERY_LATE_MOVE_MINIMUM and depth >= 5:
+        return LATE_MOVE_REDUCTION + 1
+    return LATE_MOVE_REDUCTION
 
+'''
+Zero window (windowAlpha, windowBeta) just above alpha (atAlpha) or just below beta. None while that bound is still a
+mate score: around +-CHECKMATE (infinite) the window would be empty, such searches need the full window.
+'''
+def zeroWindow(alpha, beta, atAlpha):
+    if atAlpha:
+        return (alpha, alpha + ZERO_WINDOW) if -CHECKMATE < alpha < CHECKMATE else None
+    return (beta - ZERO_WINDOW, beta) if -CHECKMATE < beta < CHECKMATE else None
+
+'''
+Search the position after passing the turn with a zero window at beta for white (at alpha for black). Returns None
+without searching while that bound is a mate score.
+'''
+def searchNullMove(gs, depth, alpha, beta):
+    window = zeroWindow(alpha, beta, not gs.whiteToMove)
+    if window is None:
+        return None
+    windowAlpha, windowBeta = window
+    gs.makeNullMove()
+    reduction = NULL_MOVE_REDUCTION + (depth >= 6)
+    score = findMinMaxGreedyMoveMultipleSteps(gs, None, depth-1-reduction, windowAlpha, windowBeta,
+                                              allowNullMove=False)[0]
+    gs.undoNullMove()
     return score
 
+'''
+Make the move, search it and undo it. With PVS every move after the first only gets a zero window probe (unless the
+best score so far is a mate score, see zeroWindow) and with a reduction it is searched shallower first, it is searched
+again (at full depth, then with the full window) when the result beats the best score so far. A move into a position
+of the tablebases isn't searched, it gets their score. With PROFILE_PHASES the time of makeMove and undoMove is
+measured.
+'''
+def searchMove(gs, move, playerBestMove, depth, alpha, beta, moveNumber, reduction):
+    whiteToMove = gs.whiteToMove
+    if PROFILE_PHASES:
+        startTime = time.perf_counter()
+        gs.makeMove(move)
+        searchStats.makeUndoTime += time.perf_counter() - startTime
+    else:
+        gs.makeMove(move)
+    eval = probeTablebase(gs)
+    if eval is None:
+        if reduction and gs.inCheck():  # Checking moves are never reduced
+            reduction = 0
+        window = zeroWindow(alpha, beta, whiteToMove) if PRINCIPAL_VARIATION_SEARCH and moveNumber > 0 else None
+        windowAlpha, windowBeta = window if window is not None else (alpha, beta)
+        eval = findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove, depth-1-reduction, windowAlpha, windowBeta)[0]
+        if reduction and ((eval > alpha) if whiteToMove else (eval < beta)):
+            searchStats.reSearches += 1
+            eval = findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove, depth-1, windowAlpha, windowBeta)[0]
+        if windowBeta - windowAlpha < beta - alpha and alpha < eval < beta:
+            searchStats.reSearches += 1
+            eval = findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove, depth-1, alpha, beta)[0]
+    if PROFILE_PHASES:
+        startTime = time.perf_counter()
+        gs.undoMove()
+        searchStats.makeUndoTime += time.perf_counter() - startTime
+    else:
+        gs.undoMove()
+    return eval
+
+'''
+Quiescence search at the leaves: instead of evaluating a position in the middle of an exchange, only captures and
+queen promotions are searched further until the position is quiet. The side to move may also stand pat (keep the
+static evaluation), since it doesn't have to capture. Captures that can't lift the score to alpha even with a margin
+(delta pruning) and captures losing material by static exchange evaluation are skipped without being searched. In
+check every move is searched, standing pat is not allowed there. Returns the score seen from white.
+'''
+QUIESCENCE_SEARCH = True  # Switch off to evaluate the leaves directly
+DELTA_MARGIN = 2  # Pawns a capture may gain on top of the captured piece by placement
+
+def quiescenceSearch(gs, alpha, beta):
+    if searchLimits is not None and searchLimits.checkStop():
+        return 0
+    searchStats.nodes += 1
+    searchStats.quiescenceNodes += 1
+    whiteToMove = gs.whiteToMove
+    inCheck = gs.inCheck()
+    standPat = None
+    if not inCheck:
+        if PROFILE_PHASES:
+            startTime = time.perf_counter()
+            standPat = evaluatePosition(gs)
+            searchStats.evaluationTime += time.perf_counter() - startTime
+        else:
+            standPat = evaluatePosition(gs)
+        if whiteToMove:
+            if standPat >= beta:
+                searchStats.leaves += 1
+                return standPat
+            alpha = max(alpha, standPat)
+        else:
+            if standPat <= alpha:
+                searchStats.leaves += 1
+                return standPat
+            beta = min(beta, standPat)
+    if PROFILE_PHASES:
+        startTime = time.perf_counter()
+        validMoves = gs.getValidMoves()
+        searchStats.moveGenerationTime += time.perf_counter() - startTime
+    else:
+        validMoves = gs.getValidMoves()
+    if gs.checkMate:
+        searchStats.leaves += 1
+        return -CHECKMATE if whiteToMove else CHECKMATE
+    elif gs.staleMate:
+        searchStats.leaves += 1
+        return STALEMATE if whiteToMove else -STALEMATE
 
+    if not inCheck:
+        moves = []
+        for move in validMoves:
+            if move.pieceCaptured == "--" and move.pawnPromotionPiece != "Q":
+                continue
+            gain = exchangeScore[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 0
+            if move.pawnPromotionPiece != False:
+                gain += exchangeScore[move.pawnPromotionPiece] - exchangeScore["p"]
+            if (standPat + gain + DELTA_MARGIN <= alpha) if whiteToMove else (standPat - gain - DELTA_MARGIN >= beta):
+                continue  # Delta pruning
+            if move.pieceCaptured != "--" and move.pawnPromotionPiece == False and \
+                    exchangeScore[move.pieceMoved[1]] > exchangeScore[move.pieceCaptured[1]] and \
+                    gs.staticExchangeEvaluation(move) < 0:
+                continue  # Losing capture
+            moves.append(move)
+        validMoves = moves
+        if not validMoves:
+            searchStats.leaves += 1
+            return standPat
+    validMoves.sort(key=lambda move: 10 * orderingValue[move.pieceCaptured[1]] - orderingValue[move.pieceMoved[1]]
+                    if move.pieceCaptured != "--" else (9 if move.pawnPromotionPiece != False else -100), reverse=True)
+
+    bestEval = standPat if standPat is not None else (-CHECKMATE if whiteToMove else CHECKMATE)
+    for move in validMoves:
+        if PROFILE_PHASES:
+            startTime = time.perf_counter()
+            gs.makeMove(move)
+            searchStats.makeUndoTime += time.perf_counter() - startTime
+        else:
+            gs.makeMove(move)
+        eval = quiescenceSearch(gs, alpha, beta)
+        if PROFILE_PHASES:
+            startTime = time.perf_counter()
+            gs.undoMove()
+            searchStats.makeUndoTime += time.perf_counter() - startTime
+        else:
+            gs.undoMove()
+        if searchLimits is not None and searchLimits.stopped:
+            break
+        if whiteToMove:
+            if eval > bestEval:
+                bestEval = eval
+            alpha = max(alpha, eval)
+        else:
+            if eval < bestEval:
+                bestEval = eval
+            beta = min(beta, eval)
+        if beta <= alpha:
+            searchStats.cutoffs += 1
+            if move is validMoves[0]:
+                searchStats.firstMoveCutoffs += 1
+            break
+    return bestEval
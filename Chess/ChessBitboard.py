@@ -0,0 +1,380 @@
+"""
+Bitboard backed version of the GameState. Every piece type of each color is stored as a 64-bit integer in which bit
+(row * 8 + col) is set if such a piece stands on the square (row, col). Knight, king and pawn attacks are looked up in
+precomputed tables and sliding pieces are resolved with precomputed rays, so the move generator never walks the board
+square by square. The string board of ChessEngine.GameState is still kept up to date for the GUI and the Move objects.
+"""
+
+from Chess import ChessEngine
+from Chess.ChessEvaluation import exchangeScore
+
+PIECES = ['wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK']
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)]  # Maps a square index to (row, col)
+ALL_SQUARES = (1 << 64) - 1
+EXCHANGE_ORDER = ['p', 'N', 'B', 'R', 'Q', 'K']  # Least valuable attacker first
+
+'''
+Return the bitboard of all squares reached from every square by the given (row, col) steps
+'''
+def stepAttackTable(steps):
+    table = []
+    for row, col in SQUARES:
+        attacks = 0
+        for dRow, dCol in steps:
+            if 0 <= row + dRow <= 7 and 0 <= col + dCol <= 7:
+                attacks |= 1 << ((row + dRow) * 8 + col + dCol)
+        table.append(attacks)
+    return table
+
+'''
+Return the bitboard of all squares on the ray from every square in the given direction (excluding the square itself)
+'''
+def rayTable(direction):
+    table = []
+    for row, col in SQUARES:
+        ray = 0
+        endRow, endCol = row + direction[0], col + direction[1]
+        while 0 <= endRow <= 7 and 0 <= endCol <= 7:
+            ray |= 1 << (endRow * 8 + endCol)
+            endRow, endCol = endRow + direction[0], endCol + direction[1]
+        table.append(ray)
+    return table
+
+KNIGHT_ATTACKS = stepAttackTable(((-1, -2), (-2, -1), (-2, 1), (-1, 2), (1, -2), (2, -1), (2, 1), (1, 2)))
+KING_ATTACKS = stepAttackTable(((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1)))
+PAWN_ATTACKS = {'w': stepAttackTable(((-1, -1), (-1, 1))), 'b': stepAttackTable(((1, -1), (1, 1)))}
+
+# Opposite directions are two entries apart. Each ray is stored with a flag telling if it runs towards higher square
+# indices (the nearest blocker is then the lowest set bit) or towards lower ones (then it is the highest set bit)
+ROOK_RAYS = [(rayTable(direction), direction[0] * 8 + direction[1] > 0) for direction in ((-1, 0), (0, -1), (1, 0), (0, 1))]
+BISHOP_RAYS = [(rayTable(direction), direction[0] * 8 + direction[1] > 0) for direction in ((-1, -1), (-1, 1), (1, 1), (1, -1))]
+ROOK_MASKS = [ROOK_RAYS[0][0][sq] | ROOK_RAYS[1][0][sq] | ROOK_RAYS[2][0][sq] | ROOK_RAYS[3][0][sq] for sq in range(64)]
+BISHOP_MASKS = [BISHOP_RAYS[0][0][sq] | BISHOP_RAYS[1][0][sq] | BISHOP_RAYS[2][0][sq] | BISHOP_RAYS[3][0][sq] for sq in range(64)]
+
+'''
+Return the squares attacked from sq along the given rays, stopping at (and including) the first occupied square
+'''
+def slidingAttacks(sq, occupied, rays):
+    attacks = 0
+    for ray, positive in rays:
+        mask = ray[sq]
+        blockers = mask & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            mask ^= ray[blocker]
+        attacks |= mask
+    return attacks
+
+def rookAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, ROOK_RAYS)
+
+def bishopAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, BISHOP_RAYS)
+
+'''
+BETWEEN[a][b] holds the squares strictly between a and b and LINE[a][b] the full line through both, if they share a
+rank, file or diagonal (0 otherwise). Used to restrict checks evasions and pinned pieces.
+'''
+def betweenAndLineTables():
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for allRays in (ROOK_RAYS, BISHOP_RAYS):
+        for index, (ray, positive) in enumerate(allRays):
+            opposite = allRays[(index + 2) % 4][0]
+            for a in range(64):
+                squares = ray[a]
+                while squares:
+                    bit = squares & -squares
+                    squares ^= bit
+                    b = bit.bit_length() - 1
+                    between[a][b] = ray[a] & opposite[b]
+                    line[a][b] = ray[a] | opposite[a] | (1 << a)
+    return between, line
+
+BETWEEN, LINE = betweenAndLineTables()
+
+
+class GameState(ChessEngine.GameState):
+    def __init__(self):
+        super().__init__()
+        self.initBitboards()
+
+    def loadFEN(self, fen):
+        super().loadFEN(fen)
+        self.initBitboards()
+
+    '''
+    Build the bitboards from the string board
+    '''
+
+    def initBitboards(self):
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.occupancy = {'w': 0, 'b': 0}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    self.bitboards[piece] |= 1 << (row * 8 + col)
+                    self.occupancy[piece[0]] |= 1 << (row * 8 + col)
+
+    '''
+    Execute the move on the string board and on the bitboards
+    '''
+
+    def makeMove(self, move):
+        super().makeMove(move)
+        self.toggleMove(move)
+
+    '''
+    Undo the last move made. Toggling the squares of a move is its own inverse, so the bitboards are restored the same way
+    they were changed.
+    '''
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            super().undoMove()
+            self.toggleMove(move)
+
+    '''
+    Flip all bits of the bitboards that change with the move
+    '''
+
+    def toggleMove(self, move):
+        color = move.pieceMoved[0]
+        startBit = 1 << (move.startRow * 8 + move.startCol)
+        endBit = 1 << (move.endRow * 8 + move.endCol)
+        self.bitboards[move.pieceMoved] ^= startBit
+        if move.pawnPromotionPiece != False:
+            self.bitboards[color + move.pawnPromotionPiece] ^= endBit
+        else:
+            self.bitboards[move.pieceMoved] ^= endBit
+        self.occupancy[color] ^= startBit | endBit
+        if move.pieceCaptured != "--":
+            if move.isEnpassantMove:
+                captureBit = 1 << (move.startRow * 8 + move.endCol)
+            else:
+                captureBit = endBit
+            self.bitboards[move.pieceCaptured] ^= captureBit
+            self.occupancy[move.pieceCaptured[0]] ^= captureBit
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2:  # King side castle move
+                rookBits = (1 << (move.endRow * 8 + move.endCol + 1)) | (1 << (move.endRow * 8 + move.endCol - 1))
+            else:  # Queen side castle move
+                rookBits = (1 << (move.endRow * 8 + move.endCol - 2)) | (1 << (move.endRow * 8 + move.endCol + 1))
+            self.bitboards[color + 'R'] ^= rookBits
+            self.occupancy[color] ^= rookBits
+
+    '''
+    Return a bitboard of all pieces of the given color attacking sq, with occupied as the blocking pieces
+    '''
+
+    def attackersTo(self, sq, color, occupied):
+        bitboards = self.bitboards
+        queens = bitboards[color + 'Q']
+        return ((KNIGHT_ATTACKS[sq] & bitboards[color + 'N'])
+                | (KING_ATTACKS[sq] & bitboards[color + 'K'])
+                | (PAWN_ATTACKS['b' if color == 'w' else 'w'][sq] & bitboards[color + 'p'])
+                | (rookAttacks(sq, occupied) & (bitboards[color + 'R'] | queens))
+                | (bishopAttacks(sq, occupied) & (bitboards[color + 'B'] | queens)))
+
+    '''
+    Determine if the enemy can attack the square (row, col)
+    '''
+
+    def squareUnderAttack(self, row, col):
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        return self.attackersTo(row * 8 + col, enemyColor, self.occupancy['w'] | self.occupancy['b']) != 0
+
+    '''
+    Return the squares (row, col) of all pieces of the given color attacking the square (row, col)
+    '''
+
+    def attackersOfSquare(self, row, col, color, stopAtFirst=False):
+        attackers = []
+        bits = self.attackersTo(row * 8 + col, color, self.occupancy['w'] | self.occupancy['b'])
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            attackers.append(SQUARES[bit.bit_length() - 1])
+        return attackers
+
+    def hasNonPawnMaterial(self, color):
+        bitboards = self.bitboards
+        return (bitboards[color + 'N'] | bitboards[color + 'B'] | bitboards[color + 'R'] | bitboards[color + 'Q']) != 0
+
+    def pieceCount(self):
+        return bin(self.occupancy['w'] | self.occupancy['b']).count("1")
+
+    '''
+    Static exchange evaluation like ChessEngine.GameState.staticExchangeEvaluation, the capturing pieces are removed
+    from the occupancy instead of the board so the sliders behind them are found by the attack lookups
+    '''
+
+    def staticExchangeEvaluation(self, move):
+        bitboards = self.bitboards
+        sq = move.endRow * 8 + move.endCol
+        occupied = (self.occupancy['w'] | self.occupancy['b']) ^ (1 << (move.startRow * 8 + move.startCol))
+        if move.isEnpassantMove:
+            occupied ^= 1 << (move.startRow * 8 + move.endCol)
+        gains = [exchangeScore[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 0]
+        pieceOnSquare = move.pawnPromotionPiece or move.pieceMoved[1]
+        color = 'b' if move.pieceMoved[0] == 'w' else 'w'
+        while True:
+            attackers = self.attackersTo(sq, color, occupied) & occupied
+            if not attackers:
+                break
+            for pieceType in EXCHANGE_ORDER:
+                bits = attackers & bitboards[color + pieceType]
+                if bits:
+                    break
+            gains.append(exchangeScore[pieceOnSquare] - gains[-1])
+            pieceOnSquare = pieceType
+            occupied ^= bits & -bits
+            color = 'b' if color == 'w' else 'w'
+        return ChessEngine.resolveExchange(gains)
+
+    def inCheck(self):
+        color = 'w' if self.whiteToMove else 'b'
+        kingSq = self.bitboards[color + 'K'].bit_length() - 1
+        return self.squareUnderAttack(kingSq // 8, kingSq % 8)
+
+    '''
+    All legal moves. The checking pieces and the pinned pieces are found once from the king's square, every other move is
+    then legal by construction. Only en passant needs a full test since it removes two pieces from a rank.
+    '''
+
+    def generateValidMoves(self):
+        moves = []
+        board = self.board
+        bitboards = self.bitboards
+        color, enemyColor = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        own = self.occupancy[color]
+        enemy = self.occupancy[enemyColor]
+        occupied = own | enemy
+        kingBit = bitboards[color + 'K']
+        kingSq = kingBit.bit_length() - 1
+        kingStart = SQUARES[kingSq]
+
+        # King moves: the king itself must not block a slider checking it along the line
+        targets = KING_ATTACKS[kingSq] & ~own
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            to = bit.bit_length() - 1
+            if not self.attackersTo(to, enemyColor, occupied ^ kingBit):
+                moves.append(ChessEngine.Move(kingStart, SQUARES[to], board))
+
+        checkers = self.attackersTo(kingSq, enemyColor, occupied)
+        if checkers & (checkers - 1):  # Double check, only the king can move
+            return moves
+        if checkers:
+            checkerSq = checkers.bit_length() - 1
+            evasionMask = checkers | BETWEEN[kingSq][checkerSq]
+        else:
+            evasionMask = ALL_SQUARES
+            self.getBitboardCastleMoves(kingSq, occupied, moves)
+
+        # Pinned pieces may only move along the line between the king and the pinning piece
+        pinLines = {}
+        enemyQueens = bitboards[enemyColor + 'Q']
+        snipers = ((ROOK_MASKS[kingSq] & (bitboards[enemyColor + 'R'] | enemyQueens))
+                   | (BISHOP_MASKS[kingSq] & (bitboards[enemyColor + 'B'] | enemyQueens)))
+        while snipers:
+            bit = snipers & -snipers
+            snipers ^= bit
+            sniperSq = bit.bit_length() - 1
+            blockers = BETWEEN[kingSq][sniperSq] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinLines[blockers.bit_length() - 1] = LINE[kingSq][sniperSq]
+
+        targetMask = ~own & evasionMask
+        for pieceType, attackFunction in (('N', None), ('B', bishopAttacks), ('R', rookAttacks), ('Q', None)):
+            pieces = bitboards[color + pieceType]
+            while pieces:
+                bit = pieces & -pieces
+                pieces ^= bit
+                sq = bit.bit_length() - 1
+                if pieceType == 'N':
+                    targets = KNIGHT_ATTACKS[sq]
+                elif pieceType == 'Q':
+                    targets = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+                else:
+                    targets = attackFunction(sq, occupied)
+                targets &= targetMask
+                if sq in pinLines:
+                    targets &= pinLines[sq]
+                start = SQUARES[sq]
+                while targets:
+                    targetBit = targets & -targets
+                    targets ^= targetBit
+                    moves.append(ChessEngine.Move(start, SQUARES[targetBit.bit_length() - 1], board))
+
+        self.getBitboardPawnMoves(color, enemyColor, kingSq, occupied, enemy, evasionMask, pinLines, moves)
+        return moves
+
+    '''
+    Add all legal pawn moves, including promotions and en passant
+    '''
+
+    def getBitboardPawnMoves(self, color, enemyColor, kingSq, occupied, enemy, evasionMask, pinLines, moves):
+        board = self.board
+        forward = -8 if color == 'w' else 8
+        startRow, promotionRow = (6, 0) if color == 'w' else (1, 7)
+        pawnAttacks = PAWN_ATTACKS[color]
+        if self.enpassantPossible != ():
+            enpassantSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+        else:
+            enpassantSq = -1
+        pawns = self.bitboards[color + 'p']
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            sq = bit.bit_length() - 1
+            start = SQUARES[sq]
+            allowed = evasionMask & pinLines.get(sq, ALL_SQUARES)
+            targets = pawnAttacks[sq] & enemy
+            oneStep = sq + forward
+            if 0 <= oneStep < 64 and not occupied >> oneStep & 1:
+                targets |= 1 << oneStep
+                twoStep = oneStep + forward
+                if start[0] == startRow and not occupied >> twoStep & 1:
+                    targets |= 1 << twoStep
+            targets &= allowed
+            while targets:
+                targetBit = targets & -targets
+                targets ^= targetBit
+                end = SQUARES[targetBit.bit_length() - 1]
+                if end[0] == promotionRow:
+                    moves.extend([ChessEngine.Move(start, end, board, pawnPromotionPiece=piece) for piece in ["R", "N", "B", "Q"]])
+                else:
+                    moves.append(ChessEngine.Move(start, end, board))
+            if enpassantSq >= 0 and pawnAttacks[sq] >> enpassantSq & 1:
+                # Test the resulting position directly: both pawns leave the rank at once
+                capturedBit = 1 << (start[0] * 8 + enpassantSq % 8)
+                after = occupied ^ bit ^ capturedBit | (1 << enpassantSq)
+                self.bitboards[enemyColor + 'p'] ^= capturedBit
+                legal = not self.attackersTo(kingSq, enemyColor, after)
+                self.bitboards[enemyColor + 'p'] ^= capturedBit
+                if legal:
+                    moves.append(ChessEngine.Move(start, SQUARES[enpassantSq], board, isEnpassantMove=True))
+
+    '''
+    Add the castle moves for a king that is not in check
+    '''
+
+    def getBitboardCastleMoves(self, kingSq, occupied, moves):
+        if self.whiteToMove:
+            kingSide, queenSide, enemyColor = self.castlingRights & ChessEngine.WKS, self.castlingRights & ChessEngine.WQS, 'b'
+        else:
+            kingSide, queenSide, enemyColor = self.castlingRights & ChessEngine.BKS, self.castlingRights & ChessEngine.BQS, 'w'
+        start = SQUARES[kingSq]
+        if kingSide and not occupied >> (kingSq + 1) & 3:
+            if not self.attackersTo(kingSq + 1, enemyColor, occupied) and not self.attackersTo(kingSq + 2, enemyColor, occupied):
+                moves.append(ChessEngine.Move(start, SQUARES[kingSq + 2], self.board, isCastleMove=True))
+        if queenSide and not occupied >> (kingSq - 3) & 7:
+            if not self.attackersTo(kingSq - 1, enemyColor, occupied) and not self.attackersTo(kingSq - 2, enemyColor, occupied):
+                moves.append(ChessEngine.Move(start, SQUARES[kingSq - 2], self.board, isCastleMove=True))
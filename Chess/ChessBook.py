@@ -0,0 +1,229 @@
+"""
+Opening book: the moves played from known positions with a weight each, so the AI plays the opening instantly instead
+of searching. The book file is a 16 byte header (magic and number of records) followed by fixed 12 byte records
+
+    key (uint64)    Zobrist key of the position (GameState.zobristKey)
+    move (uint16)   Move.moveID
+    weight (uint16) How often the move was played, wins count double
+
+sorted by key, so the moves of a position are found by binary search. The file is read through mmap: nothing is loaded
+up front and all processes reading the book share one copy in the page cache. The keys come from the fixed Zobrist
+tables of ChessEngine, a book has to be rebuilt if they change. Build and look at a book with:
+
+    python -m Chess.ChessBook build games.pgn more.pgn --output book.bin --plies 20 --min-games 2
+    python -m Chess.ChessBook probe --book book.bin --fen "<FEN>"
+"""
+
+import argparse
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+
+from Chess import ChessBitboard
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")  # Built from openings.pgn
+MAGIC = b"CHSBOOK1"
+HEADER = struct.Struct(">8sII")  # Magic, number of records, unused
+RECORD = struct.Struct(">QHH")  # Key, move ID, weight
+MAX_WEIGHT = 65535
+
+'''
+Moves of the book for positions by Zobrist key. Use it as a context manager or close() it:
+
+    with OpeningBook(path) as book:
+        move = book.chooseMove(gs)
+'''
+class OpeningBook():
+    def __init__(self, path=BOOK_PATH):
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self.file.close()
+            raise ValueError("'%s' is not an opening book" % path)
+        magic, self.size, unused = HEADER.unpack_from(self.data, 0) if len(self.data) >= HEADER.size else (b"", 0, 0)
+        if magic != MAGIC or len(self.data) != HEADER.size + self.size * RECORD.size:
+            self.close()
+            raise ValueError("'%s' is not an opening book" % path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    '''
+    Return the (move ID, weight) pairs stored for the key, best weight first
+    '''
+
+    def getEntries(self, key):
+        data = self.data
+        low, high = 0, self.size
+        while low < high:  # First record with a key >= key
+            middle = (low + high) // 2
+            if RECORD.unpack_from(data, HEADER.size + middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.size:
+            recordKey, moveID, weight = RECORD.unpack_from(data, HEADER.size + low * RECORD.size)
+            if recordKey != key:
+                break
+            entries.append((moveID, weight))
+            low += 1
+        return entries
+
+    '''
+    Return the (move, weight) pairs of the book for the position, Move objects of gs.getValidMoves(). Moves that aren't
+    valid in the position (a different position with the same key) are left out.
+    '''
+
+    def getMoves(self, gs):
+        entries = self.getEntries(gs.zobristKey)
+        if not entries:
+            return []
+        checkMate, staleMate = gs.checkMate, gs.staleMate
+        validMoves = {move.moveID: move for move in gs.getValidMoves()}
+        gs.checkMate, gs.staleMate = checkMate, staleMate
+        return [(validMoves[moveID], weight) for moveID, weight in entries if moveID in validMoves]
+
+    '''
+    Pick a book move at random by weight, or return None if the position isn't in the book
+    '''
+
+    def chooseMove(self, gs, rng=random):
+        moves = self.getMoves(gs)
+        if not moves:
+            return None
+        return rng.choices([move for move, weight in moves], weights=[weight for move, weight in moves])[0]
+
+'''
+Open the book at path, or return None (with a message) if there is none
+'''
+def openBook(path=BOOK_PATH):
+    try:
+        return OpeningBook(path)
+    except (OSError, ValueError) as error:
+        print("No opening book: %s" % error)
+        return None
+
+'''
+Read the games of a PGN file, yields (tags, moves in SAN, result) for every game. Comments, variations, move numbers
+and annotation glyphs are skipped.
+'''
+PGN_TOKENS = re.compile(r"\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|\d+\.+|e\.p\.|1-0|0-1|1/2-1/2|\*|[^\s(){};.$]+")
+
+def readPGN(file):
+    tags = {}
+    moveText = []
+    for line in file:
+        line = line.strip()
+        if line.startswith("[") and line.endswith("]"):
+            if moveText:  # Tags of the next game
+                yield parsePGNGame(tags, " ".join(moveText))
+                tags, moveText = {}, []
+            name, separator, value = line[1:-1].partition(" ")
+            tags[name] = value.strip().strip('"')
+        elif line and not line.startswith("%"):
+            moveText.append(line)
+    if moveText or tags:
+        yield parsePGNGame(tags, " ".join(moveText))
+
+def parsePGNGame(tags, moveText):
+    moves = []
+    result = tags.get("Result", "*")
+    variationDepth = 0
+    for token in PGN_TOKENS.findall(moveText):
+        if token == "(":
+            variationDepth += 1
+        elif token == ")":
+            variationDepth -= 1
+        elif variationDepth > 0 or token[0] in "{;$" or token[-1] == ".":
+            continue
+        elif token in ("1-0", "0-1", "1/2-1/2", "*"):
+            result = token
+        else:
+            moves.append(token)
+    return tags, moves, result
+
+'''
+Compile the book from PGN files: the first plies of every game are counted per position. A move gets weight 2 for a win
+of the side playing it, 1 for a draw or unknown result and 0 for a loss, and is kept if it was played in at least
+minGames games with a weight above zero. Returns the number of records written.
+'''
+def buildBook(pgnPaths, bookPath, maxPlies=20, minGames=1, out=sys.stdout):
+    positions = {}  # Key -> {move ID: [games, weight]}
+    games = skipped = 0
+    for pgnPath in pgnPaths:
+        with open(pgnPath, encoding="utf-8", errors="replace") as file:
+            for tags, moves, result in readPGN(file):
+                games += 1
+                gs = ChessBitboard.GameState()
+                gs.moveCache = None
+                if "FEN" in tags:
+                    gs.loadFEN(tags["FEN"])
+                for san in moves[:maxPlies]:
+                    try:
+                        move = gs.parseSAN(san)
+                    except ValueError:
+                        skipped += 1  # The rest of the game can't be followed
+                        break
+                    winner = {"1-0": True, "0-1": False}.get(result)
+                    weight = 1 if winner is None else (2 if winner == gs.whiteToMove else 0)
+                    counts = positions.setdefault(gs.zobristKey, {}).setdefault(move.moveID, [0, 0])
+                    counts[0] += 1
+                    counts[1] += weight
+                    gs.makeMove(move)
+    records = [(key, moveID, weight) for key, moves in positions.items()
+               for moveID, (count, weight) in moves.items() if count >= minGames and weight > 0]
+    scale = max(1, max((weight for key, moveID, weight in records), default=0) / MAX_WEIGHT)
+    records = [(key, moveID, max(1, int(weight / scale))) for key, moveID, weight in records]
+    records.sort(key=lambda record: (record[0], -record[2], record[1]))
+    with open(bookPath, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(records), 0))
+        for record in records:
+            file.write(RECORD.pack(*record))
+    print("%d games (%d with an unreadable move), %d positions, %d book moves written to %s" % (games, skipped,
+          len({record[0] for record in records}), len(records), bookPath), file=out)
+    return len(records)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or look into an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="compile PGN files into a book")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--output", default=BOOK_PATH)
+    build.add_argument("--plies", type=int, default=20, help="moves per game that go into the book")
+    build.add_argument("--min-games", type=int, default=1, help="games a move must be played in to be kept")
+    probe = commands.add_parser("probe", help="print the book moves of a position")
+    probe.add_argument("--book", default=BOOK_PATH)
+    probe.add_argument("--fen", help="position, default the start position")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        buildBook(args.pgn, args.output, args.plies, args.min_games)
+        return
+    gs = ChessBitboard.GameState()
+    if args.fen:
+        gs.loadFEN(args.fen)
+    with OpeningBook(args.book) as book:
+        moves = book.getMoves(gs)
+        total = sum(weight for move, weight in moves)
+        for move, weight in moves:
+            print("%-8s %6d  %5.1f%%" % (gs.getSAN(move), weight, 100 * weight / total))
+        if not moves:
+            print("Position not in the book (%d records)" % len(book))
+
+if __name__ == "__main__":
+    main()
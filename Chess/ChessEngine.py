@@ -3,6 +3,46 @@ This class is responsible for storing all the information about the current stat
 responsible for determining the valid moves at the current state. It will also keep a move log.
 """
 
+import random
+from collections import OrderedDict
+
+from Chess.ChessEvaluation import computeMaterialScore, exchangeScore, materialDelta
+
+'''
+Zobrist keys: a random 64-bit number for every piece on every square, for black to move, for every combination of
+castle rights and for every en passant file (only while the capture is possible). The key of a position is the XOR of
+the numbers of all its features. The seed is fixed so every process computes the same keys for the same position.
+'''
+zobristRandom = random.Random(20240219)
+ZOBRIST_PIECES = {piece: [[zobristRandom.getrandbits(64) for col in range(8)] for row in range(8)]
+                  for piece in ['wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK']}
+ZOBRIST_BLACK_TO_MOVE = zobristRandom.getrandbits(64)
+ZOBRIST_CASTLE_RIGHTS = [zobristRandom.getrandbits(64) for right in range(4)]  # wks, bks, wqs, bqs
+ZOBRIST_CASTLING = [0] * 16  # Indexed by the castle right bits (CastleRights.getIndex())
+for index in range(16):
+    for right in range(4):
+        if index >> right & 1:
+            ZOBRIST_CASTLING[index] ^= ZOBRIST_CASTLE_RIGHTS[right]
+ZOBRIST_ENPASSANT = [zobristRandom.getrandbits(64) for col in range(8)]
+
+'''
+Castle rights are the bits of one number, in the order of CastleRights.getIndex(). CASTLE_RIGHTS_KEPT[row][col] are the
+rights left after a move from or to the square: moving the king or a rook, or capturing a rook at home, removes some.
+'''
+WKS, BKS, WQS, BQS = 1, 2, 4, 8
+ALL_CASTLE_RIGHTS = WKS | BKS | WQS | BQS
+CASTLE_RIGHTS_KEPT = [[ALL_CASTLE_RIGHTS] * 8 for row in range(8)]
+CASTLE_RIGHTS_KEPT[7][4] = ALL_CASTLE_RIGHTS & ~(WKS | WQS)
+CASTLE_RIGHTS_KEPT[7][7] = ALL_CASTLE_RIGHTS & ~WKS
+CASTLE_RIGHTS_KEPT[7][0] = ALL_CASTLE_RIGHTS & ~WQS
+CASTLE_RIGHTS_KEPT[0][4] = ALL_CASTLE_RIGHTS & ~(BKS | BQS)
+CASTLE_RIGHTS_KEPT[0][7] = ALL_CASTLE_RIGHTS & ~BKS
+CASTLE_RIGHTS_KEPT[0][0] = ALL_CASTLE_RIGHTS & ~BQS
+
+SQUARE_TUPLES = [[(row, col) for col in range(8)] for row in range(8)]  # Shared (row, col) tuples for the king and en passant squares
+STATE_STACK_SIZE = 256  # Plies the state stack holds at first, it doubles when a game gets longer
+MOVE_CACHE_SIZE = 10000  # Positions whose valid moves each GameState remembers (None switches the cache off)
+
 
 class GameState():
     def __init__(self):
@@ -24,21 +64,187 @@ class GameState():
         self.moveFunctions = {'p': self.getPawnMoves, 'R': self.getRookMoves, 'N': self.getKnightMoves,
                               'B': self.getBishopMoves, 'Q': self.getQueenMoves, 'K': self.getKingMoves}
         self.whiteToMove = True
-        self.moveLog = []
         self.whiteKingLocation = (7, 4)
         self.blackKingLocation = (0, 4)
+        self.enpassantPossible = ()  # (row,col) for the square where en passant is possible
+        self.castlingRights = ALL_CASTLE_RIGHTS  # Bits WKS, BKS, WQS, BQS
+        self.halfmoveClock = 0  # Moves since the last capture or pawn move
+        self.fullmoveOffset = 0  # Plies played before the history starts, see getFullmoveNumber
+        self.moveCache = MoveCache() if MOVE_CACHE_SIZE else None
+        self.resetHistory()
+
+    '''
+    Start a new move history at the current position
+    '''
+
+    def resetHistory(self):
+        self.moveLog = []
         self.checkMate = False
         self.staleMate = False
-        self.enpassantPossible = ()  # (row,col) for the square where en passant is possible
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        # State stack: the irreversible state of every position of the game, indexed by the ply (number of moves made).
+        # The lists are preallocated and overwritten, so making and undoing a move only stores and reads entries.
+        self.ply = 0
+        self.castlingStack = [0] * STATE_STACK_SIZE
+        self.enpassantStack = [()] * STATE_STACK_SIZE
+        self.halfmoveClockStack = [0] * STATE_STACK_SIZE
+        self.zobristLog = [0] * STATE_STACK_SIZE  # Keys of all positions of the game, up to index ply
+        self.zobristKey = self.computeZobristKey()
+        self.castlingStack[0] = self.castlingRights
+        self.enpassantStack[0] = self.enpassantPossible
+        self.halfmoveClockStack[0] = self.halfmoveClock
+        self.zobristLog[0] = self.zobristKey
+        self.materialScore = computeMaterialScore(self.board)  # Running evaluation in tenths of a pawn (white positive)
+
+    '''
+    Double the size of the state stack
+    '''
+
+    def growStateStack(self):
+        self.castlingStack.extend([0] * len(self.castlingStack))
+        self.enpassantStack.extend([()] * len(self.enpassantStack))
+        self.halfmoveClockStack.extend([0] * len(self.halfmoveClockStack))
+        self.zobristLog.extend([0] * len(self.zobristLog))
+
+    '''
+    Castle rights as a CastleRights object (a copy, the state itself is the number castlingRights)
+    '''
+
+    @property
+    def currentCastlingRight(self):
+        rights = self.castlingRights
+        return CastleRights(bool(rights & WKS), bool(rights & BKS), bool(rights & WQS), bool(rights & BQS))
+
+    '''
+    Set up the position given in Forsyth-Edwards Notation: piece placement, side to move, castle rights, en passant
+    square, halfmove clock and fullmove number. Missing fields at the end take the values of a new game. Raises
+    ValueError for an invalid FEN. The move history starts over.
+    '''
+
+    def loadFEN(self, fen):
+        fields = fen.split()
+        board = []
+        for rankText in fields[0].split("/") if fields else []:
+            row = []
+            for char in rankText:
+                if char.isdigit():
+                    row.extend(["--"] * int(char))
+                elif char in "pnbrqkPNBRQK":
+                    row.append(("w" if char.isupper() else "b") + ("p" if char in "pP" else char.upper()))
+                else:
+                    raise ValueError("Invalid piece '%s' in FEN: %s" % (char, fen))
+            board.append(row)
+        if len(board) != 8 or any(len(row) != 8 for row in board):
+            raise ValueError("Invalid piece placement in FEN: " + fen)
+        side = fields[1] if len(fields) > 1 else "w"
+        castling = fields[2] if len(fields) > 2 else "-"
+        enpassant = fields[3] if len(fields) > 3 else "-"
+        if side not in ("w", "b") or (castling != "-" and any(char not in "KQkq" for char in castling)) \
+                or (enpassant != "-" and (len(enpassant) != 2 or enpassant[0] not in Move.filesToCols or
+                                          enpassant[1] not in "36")):
+            raise ValueError("Invalid side to move, castle rights or en passant square in FEN: " + fen)
+        try:
+            halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("Invalid move counters in FEN: " + fen)
+        self.board = board
+        self.whiteToMove = side == "w"
+        self.castlingRights = ("K" in castling) * WKS | ("k" in castling) * BKS | ("Q" in castling) * WQS | \
+                              ("q" in castling) * BQS
+        if enpassant == "-":
+            self.enpassantPossible = ()
+        else:
+            self.enpassantPossible = (Move.ranksToRows[enpassant[1]], Move.filesToCols[enpassant[0]])
+        self.halfmoveClock = halfmoveClock
+        self.fullmoveOffset = 2 * (max(fullmoveNumber, 1) - 1) + (not self.whiteToMove)
+        for row in range(8):
+            for col in range(8):
+                if board[row][col] == "wK":
+                    self.whiteKingLocation = (row, col)
+                elif board[row][col] == "bK":
+                    self.blackKingLocation = (row, col)
+        self.resetHistory()
+
+    '''
+    The position in Forsyth-Edwards Notation, loadFEN reads it back
+    '''
+
+    def getFEN(self):
+        ranks = []
+        for row in self.board:
+            rankText = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rankText += str(empty)
+                    empty = 0
+                letter = "P" if piece[1] == "p" else piece[1]
+                rankText += letter if piece[0] == "w" else letter.lower()
+            ranks.append(rankText + (str(empty) if empty else ""))
+        rights = self.castlingRights
+        castling = "K" * bool(rights & WKS) + "Q" * bool(rights & WQS) + "k" * bool(rights & BKS) + "q" * bool(rights & BQS)
+        if self.enpassantPossible != ():
+            row, col = self.enpassantPossible
+            enpassant = Move.colsToFiles[col] + Move.rowsToRanks[row]
+        else:
+            enpassant = "-"
+        return "%s %s %s %s %d %d" % ("/".join(ranks), "w" if self.whiteToMove else "b", castling or "-", enpassant,
+                                      self.halfmoveClock, self.getFullmoveNumber())
+
+    '''
+    Number of the move in progress, starting at 1 and counted up after every move of black
+    '''
+
+    def getFullmoveNumber(self):
+        return (self.ply + self.fullmoveOffset) // 2 + 1
+
+    '''
+    Compute the Zobrist key of the current position from scratch
+    '''
+
+    def computeZobristKey(self):
+        key = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    key ^= ZOBRIST_PIECES[piece][row][col]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING[self.castlingRights]
+        return key ^ self.getEnpassantKey()
+
+    '''
+    Zobrist key of the en passant file, only hashed when a pawn of the side to move stands next to the pawn that just
+    advanced two squares. Otherwise the capture isn't possible and the position keeps the key it has without the push.
+    '''
+
+    def getEnpassantKey(self):
+        if self.enpassantPossible == ():
+            return 0
+        row, col = self.enpassantPossible
+        pawnRow, capturingPawn = (row + 1, "wp") if self.whiteToMove else (row - 1, "bp")
+        if (col > 0 and self.board[pawnRow][col - 1] == capturingPawn) or \
+                (col < 7 and self.board[pawnRow][col + 1] == capturingPawn):
+            return ZOBRIST_ENPASSANT[col]
+        return 0
 
     '''
     Takes a Move as a parameter and executes it (this will not work for castling, pawn promotion, and en-passant).
     '''
 
     def makeMove(self, move):
+        ply = self.ply + 1
+        if ply == len(self.zobristLog):
+            self.growStateStack()
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_CASTLING[self.castlingRights]
+        if self.enpassantPossible != ():
+            key ^= self.getEnpassantKey()
+        key ^= ZOBRIST_PIECES[move.pieceMoved][move.startRow][move.startCol]
+        self.materialScore += materialDelta(move)
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move)  # Log the move
@@ -46,9 +252,9 @@ class GameState():
 
         # Update the King's location if moved
         if move.pieceMoved == 'wK':
-            self.whiteKingLocation = (move.endRow, move.endCol)
+            self.whiteKingLocation = SQUARE_TUPLES[move.endRow][move.endCol]
         elif move.pieceMoved == 'bK':
-            self.blackKingLocation = (move.endRow, move.endCol)
+            self.blackKingLocation = SQUARE_TUPLES[move.endRow][move.endCol]
 
         # Pawn promotion
         if move.pawnPromotionPiece != False:
@@ -57,10 +263,15 @@ class GameState():
         # En passant move
         if move.isEnpassantMove:
             self.board[move.startRow][move.endCol] = "--"  # Capture pawn
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.startRow][move.endCol]
+        elif move.pieceCaptured != "--":
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.endRow][move.endCol]
+        key ^= ZOBRIST_PIECES[self.board[move.endRow][move.endCol]][move.endRow][move.endCol]
 
         # Capture en passant
         if move.pieceMoved[1] == "p" and abs(move.startRow - move.endRow) == 2:  # Only on 2 square pawn advances
-            self.enpassantPossible = ((move.startRow + move.endRow) // 2, move.endCol)
+            self.enpassantPossible = SQUARE_TUPLES[(move.startRow + move.endRow) // 2][move.endCol]
+            key ^= self.getEnpassantKey()
         else:
             self.enpassantPossible = ()  # Reset enpassant square
 
@@ -70,15 +281,31 @@ class GameState():
                 self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][
                     move.endCol + 1]  # Copy rook to new square
                 self.board[move.endRow][move.endCol + 1] = "--"  # Erase old rook
+                rookKeys = ZOBRIST_PIECES[self.board[move.endRow][move.endCol - 1]][move.endRow]
+                key ^= rookKeys[move.endCol + 1] ^ rookKeys[move.endCol - 1]
             else:  # Queen side castle move
                 self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][
                     move.endCol - 2]  # Copy rook to new square
                 self.board[move.endRow][move.endCol - 2] = "--"  # Erase old rook
+                rookKeys = ZOBRIST_PIECES[self.board[move.endRow][move.endCol + 1]][move.endRow]
+                key ^= rookKeys[move.endCol - 2] ^ rookKeys[move.endCol + 1]
 
         # Update castling rights - whenever it is a rook or a king move
         self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                                 self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+
+        # Halfmove clock, reset by captures and pawn moves
+        if move.pieceMoved[1] == "p" or move.pieceCaptured != "--":
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+
+        # Update the position key incrementally and push the new state
+        self.zobristKey = key ^ ZOBRIST_CASTLING[self.castlingRights]
+        self.castlingStack[ply] = self.castlingRights
+        self.enpassantStack[ply] = self.enpassantPossible
+        self.halfmoveClockStack[ply] = self.halfmoveClock
+        self.zobristLog[ply] = self.zobristKey
+        self.ply = ply
 
     '''
     Undo the last move made.
@@ -87,34 +314,18 @@ class GameState():
     def undoMove(self):
         if len(self.moveLog) != 0:
             move = self.moveLog.pop()
-            if len(self.moveLog) != 0:
-                previousMove = self.moveLog[-1]
             self.board[move.startRow][move.startCol] = move.pieceMoved
             self.board[move.endRow][move.endCol] = move.pieceCaptured
             self.whiteToMove = not self.whiteToMove  # switch turn back
             # Update the King's location if needed
             if move.pieceMoved == 'wK':
-                self.whiteKingLocation = (move.startRow, move.startCol)
+                self.whiteKingLocation = SQUARE_TUPLES[move.startRow][move.startCol]
             elif move.pieceMoved == 'bK':
-                self.blackKingLocation = (move.startRow, move.startCol)
-            # Undo a 2 square pawn advance
-            if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
-                self.enpassantPossible = ()
+                self.blackKingLocation = SQUARE_TUPLES[move.startRow][move.startCol]
             # Undo en passant
             if move.isEnpassantMove:
                 self.board[move.endRow][move.endCol] = "--"  # Leave landing square blank
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow, move.endCol)
-            # Update en passant possible
-            if len(self.moveLog) != 0:
-                if previousMove.pieceMoved[1] == "p" and abs(previousMove.startRow - previousMove.endRow) == 2:
-                    self.enpassantPossible = ((previousMove.startRow + previousMove.endRow) // 2,
-                                              previousMove.endCol)  # Restore the deleted possible en passant move
-            # Undo castling rights
-            self.castleRightsLog.pop()  # Get rid of the new castle rights from the move we are undoing
-            newCastleRights = self.castleRightsLog[-1]
-            self.currentCastlingRight = CastleRights(newCastleRights.wks, newCastleRights.bks, newCastleRights.wqs,
-                                                     newCastleRights.bqs)  # Set the current castle rights to the last one in the list
             # Undo castle move
             if move.isCastleMove:
                 if move.endCol - move.startCol == 2:  # King side castle move
@@ -124,74 +335,201 @@ class GameState():
                     self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
                     self.board[move.endRow][move.endCol + 1] = "--"
 
+            # Pop the state: castle rights, en passant square, halfmove clock and position key of the previous position
+            ply = self.ply - 1
+            self.castlingRights = self.castlingStack[ply]
+            self.enpassantPossible = self.enpassantStack[ply]
+            self.halfmoveClock = self.halfmoveClockStack[ply]
+            self.zobristKey = self.zobristLog[ply]
+            self.ply = ply
+            self.materialScore -= materialDelta(move)
+
             # Undo check mate and stale mate
             self.checkMate = False
             self.staleMate = False
 
+    '''
+    Pass the turn without moving, for null move pruning in the search. Only the side to move, the en passant square
+    and the position key change. The halfmove clock starts over so repetitions aren't counted across the null move.
+    '''
+
+    def makeNullMove(self):
+        ply = self.ply + 1
+        if ply == len(self.zobristLog):
+            self.growStateStack()
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE
+        if self.enpassantPossible != ():
+            key ^= self.getEnpassantKey()
+            self.enpassantPossible = ()
+        self.whiteToMove = not self.whiteToMove
+        self.halfmoveClock = 0
+        self.zobristKey = key
+        self.castlingStack[ply] = self.castlingRights
+        self.enpassantStack[ply] = self.enpassantPossible
+        self.halfmoveClockStack[ply] = self.halfmoveClock
+        self.zobristLog[ply] = key
+        self.ply = ply
+
+    def undoNullMove(self):
+        ply = self.ply - 1
+        self.enpassantPossible = self.enpassantStack[ply]
+        self.halfmoveClock = self.halfmoveClockStack[ply]
+        self.zobristKey = self.zobristLog[ply]
+        self.whiteToMove = not self.whiteToMove
+        self.ply = ply
+        self.checkMate = False
+        self.staleMate = False
+
     '''
     Update the castle rights given the move
     '''
 
     def updateCastleRights(self, move):
-        if move.pieceMoved == "wK":
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == "bK":
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
-        elif move.pieceMoved == "wR":
-            if move.startRow == 7:
-                if move.startCol == 0:  # Left rook
-                    self.currentCastlingRight.wqs = False
-                elif move.startCol == 7:  # Right rook
-                    self.currentCastlingRight.wks = False
-        elif move.pieceMoved == "bR":
-            if move.startRow == 0:
-                if move.startCol == 0:  # Left rook
-                    self.currentCastlingRight.bqs = False
-                elif move.startCol == 7:  # Right rook
-                    self.currentCastlingRight.bks = False
-
-    '''
-    All moves considering checks:
+        self.castlingRights &= CASTLE_RIGHTS_KEPT[move.startRow][move.startCol] & CASTLE_RIGHTS_KEPT[move.endRow][move.endCol]
+
+    '''
+    All moves considering checks. The moves of a position seen recently come from the move cache, the list returned is
+    always a new one so the caller may reorder it.
     '''
 
     def getValidMoves(self):
-        tempEnpassantPossible = self.enpassantPossible  # Safe copy of en passant move
-        tempCastleRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                        self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)
-        # 1.) generate all possible moves
-        moves = self.getAllPossibleMoves()
-        if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
+        if self.moveCache is not None:
+            moves = self.moveCache.get(self.zobristKey)
+            if moves is None:
+                moves = self.generateValidMoves()
+                self.moveCache.store(self.zobristKey, moves)
+            moves = list(moves)
         else:
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
-        # 2.) for each move, make the move
-        for i in range(len(moves) - 1, -1, -1):  # When removing from a list go backwards through the list
-            self.makeMove(moves[i])
-            self.whiteToMove = not self.whiteToMove  # Correct the switch due to call of makeMove()
-            # 3.) generate all opponent's moves
-            # 4.) for each of your opponent's moves, see if they attack your king
-            # 5.) if they do attack your king, not a valid move
-            if self.inCheck():
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
+            moves = self.generateValidMoves()
+        self.updateGameOverFlags(moves)
+        return moves
+
+    '''
+    Generate all moves considering checks. The checking pieces and the pinned pieces are found once by scanning outward
+    from the king, so each pseudo legal move can be accepted or rejected directly without making it on the board:
+    '''
+
+    def generateValidMoves(self):
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        moves = []
+        if len(checks) > 1:  # Double check, only the king can move
+            pseudoMoves = []
+            self.getKingMoves(kingRow, kingCol, pseudoMoves)
+        else:
+            pseudoMoves = self.getAllPossibleMoves()
+        validSquares = None
+        if len(checks) == 1:  # Single check: capture the checking piece or block the line to the king
+            checkRow, checkCol, direction = checks[0]
+            if self.board[checkRow][checkCol][1] == "N":
+                validSquares = {(checkRow, checkCol)}
+            else:
+                validSquares = set()
+                for i in range(1, 8):
+                    validSquare = (kingRow + direction[0] * i, kingCol + direction[1] * i)
+                    validSquares.add(validSquare)
+                    if validSquare == (checkRow, checkCol):
+                        break
+        for move in pseudoMoves:
+            if move.pieceMoved[1] == "K":
+                if len(self.checkForPinsAndChecks(move.endRow, move.endCol)[1]) == 0:  # Landing square not attacked
+                    moves.append(move)
+            elif move.isEnpassantMove:
+                if self.isEnpassantMoveLegal(move, kingRow, kingCol):
+                    moves.append(move)
+            else:
+                pinDirection = pins.get((move.startRow, move.startCol))
+                if pinDirection is not None and (move.endRow - move.startRow) * pinDirection[1] != (move.endCol - move.startCol) * pinDirection[0]:
+                    continue  # Pinned piece leaves the line between king and pinning piece
+                if validSquares is not None and (move.endRow, move.endCol) not in validSquares:
+                    continue
+                moves.append(move)
+        if len(checks) == 0:
+            self.getCastleMoves(kingRow, kingCol, moves)
+        return moves
+
+    '''
+    Scan outward from the square (row, col) along all lines and knight hops to find the enemy pieces attacking it and the
+    own pieces pinned to it. The own king is skipped, so the square can also be a target square of the king.
+    Returns the pins as {(row, col): direction} and the checks as a list of (row, col, direction).
+    '''
+
+    def checkForPinsAndChecks(self, row, col):
+        pins = {}
+        checks = []
+        allyColor, enemyColor = ("w", "b") if self.whiteToMove else ("b", "w")
+        pawnDirections = ((-1, -1), (-1, 1)) if self.whiteToMove else ((1, -1), (1, 1))  # Enemy pawns attacking from there
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1))
+        for j in range(len(directions)):
+            direction = directions[j]
+            possiblePin = ()
+            for i in range(1, 8):
+                endRow = row + direction[0] * i
+                endCol = col + direction[1] * i
+                if not (0 <= endRow <= 7 and 0 <= endCol <= 7):  # Off board
+                    break
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == allyColor and endPiece[1] != "K":
+                    if possiblePin == ():  # First own piece could be pinned
+                        possiblePin = (endRow, endCol)
+                    else:  # Second own piece, no pin or check in this direction
+                        break
+                elif endPiece[0] == enemyColor:
+                    pieceType = endPiece[1]
+                    if (j <= 3 and pieceType == "R") or (j >= 4 and pieceType == "B") or pieceType == "Q" or \
+                            (i == 1 and pieceType == "K") or (i == 1 and pieceType == "p" and direction in pawnDirections):
+                        if possiblePin == ():
+                            checks.append((endRow, endCol, direction))
+                        else:
+                            pins[possiblePin] = direction
+                    break  # Enemy piece blocks everything behind it
+        for direction in ((-1, -2), (-2, -1), (-2, 1), (-1, 2), (1, -2), (2, -1), (2, 1), (1, 2)):
+            endRow = row + direction[0]
+            endCol = col + direction[1]
+            if 0 <= endRow <= 7 and 0 <= endCol <= 7 and self.board[endRow][endCol] == enemyColor + "N":
+                checks.append((endRow, endCol, direction))
+        return pins, checks
+
+    '''
+    En passant removes two pawns at once, which can uncover a line to the king. Test it by placing the pawns as after the
+    move and scanning from the king again.
+    '''
+
+    def isEnpassantMoveLegal(self, move, kingRow, kingCol):
+        self.board[move.startRow][move.startCol] = "--"
+        self.board[move.startRow][move.endCol] = "--"
+        self.board[move.endRow][move.endCol] = move.pieceMoved
+        legal = len(self.checkForPinsAndChecks(kingRow, kingCol)[1]) == 0
+        self.board[move.endRow][move.endCol] = "--"
+        self.board[move.startRow][move.endCol] = move.pieceCaptured
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        return legal
+
+    '''
+    Set the checkmate and stalemate flags given all valid moves of the current position
+    '''
+
+    def updateGameOverFlags(self, moves):
         if len(moves) == 0: # Either checkmate or stalemate if no possible moves available
             if self.inCheck():
                 self.checkMate = True
             else:
                 self.staleMate = True
-        if len(self.moveLog) >= 6: # stalemate if move repetition
-            if (self.moveLog[-6].moveID == self.moveLog[-2].moveID) and (self.moveLog[-5].moveID == self.moveLog[-1].moveID):
-                self.staleMate = True
+        elif self.isThreefoldRepetition(): # Draw by repetition, treated as stalemate
+            self.staleMate = True
         else:
             self.checkMate = False
             self.staleMate = False
 
-        self.enpassantPossible = tempEnpassantPossible
-        self.currentCastlingRight = tempCastleRights
-        return moves
+    '''
+    Determine if the current position occurred at least three times with the same player to move. Only the positions
+    since the last capture or pawn move can repeat.
+    '''
+
+    def isThreefoldRepetition(self):
+        lowest = self.ply - self.halfmoveClock
+        keys = self.zobristLog[self.ply::-2] if lowest <= 0 else self.zobristLog[self.ply:lowest - 1:-2]
+        return keys.count(self.zobristKey) >= 3
 
     '''
     Determine if the current player is in check
@@ -203,18 +541,179 @@ class GameState():
         else:
             return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
 
+    '''
+    True if the color has a piece other than pawns and the king. Without one, zugzwang is likely and passing the turn
+    is no sign of a good position.
+    '''
+
+    def hasNonPawnMaterial(self, color):
+        for row in self.board:
+            for piece in row:
+                if piece[0] == color and piece[1] in "NBRQ":
+                    return True
+        return False
+
+    '''
+    Number of pieces on the board, kings included
+    '''
+
+    def pieceCount(self):
+        return sum(piece != "--" for row in self.board for piece in row)
+
+    '''
+    Standard algebraic notation (e.g. "Nbd7", "exd5", "e8=Q+", "O-O") of a valid move in the current position
+    '''
+
+    def getSAN(self, move):
+        checkMate, staleMate = self.checkMate, self.staleMate
+        validMoves = self.getValidMoves()
+        if move.isCastleMove:
+            san = "O-O" if move.endCol == 6 else "O-O-O"
+        else:
+            pieceType = move.pieceMoved[1]
+            capture = "x" if move.pieceCaptured != "--" else ""
+            endSquare = move.getRankFile(move.endRow, move.endCol)
+            if pieceType == "p":
+                san = (move.colsToFiles[move.startCol] + capture if capture else "") + endSquare
+                if move.pawnPromotionPiece != False:
+                    san += "=" + move.pawnPromotionPiece
+            else:
+                # Other pieces of the same kind that can move to the same square
+                rivals = [other for other in validMoves if other.pieceMoved == move.pieceMoved and
+                          other.endRow == move.endRow and other.endCol == move.endCol and
+                          (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+                disambiguation = ""
+                if rivals:
+                    if all(other.startCol != move.startCol for other in rivals):
+                        disambiguation = move.colsToFiles[move.startCol]
+                    elif all(other.startRow != move.startRow for other in rivals):
+                        disambiguation = move.rowsToRanks[move.startRow]
+                    else:
+                        disambiguation = move.getRankFile(move.startRow, move.startCol)
+                san = pieceType + disambiguation + capture + endSquare
+        self.makeMove(move)
+        self.getValidMoves()
+        if self.checkMate:
+            san += "#"
+        elif self.inCheck():
+            san += "+"
+        self.undoMove()
+        self.checkMate, self.staleMate = checkMate, staleMate
+        return san
+
+    '''
+    The valid move written in standard algebraic notation, the inverse of getSAN. Also accepts castling with zeros, a
+    promotion without "=" and annotations like "!?" or "e.p.". Raises ValueError for an illegal or ambiguous move.
+    '''
+
+    def parseSAN(self, san):
+        checkMate, staleMate = self.checkMate, self.staleMate
+        validMoves = self.getValidMoves()
+        self.checkMate, self.staleMate = checkMate, staleMate
+        text = san.replace("e.p.", "").rstrip("+#!?").replace("0", "O")
+        if text in ("O-O", "O-O-O"):
+            candidates = [move for move in validMoves if move.isCastleMove and (move.endCol == 6) == (text == "O-O")]
+        else:
+            promotion = False
+            if len(text) > 2 and text[-1] in "QRBN" and (text[-2] == "=" or text[-2] in "18"):
+                promotion = text[-1]
+                text = text[:-2] if text[-2] == "=" else text[:-1]
+            pieceType = "p"
+            if text[:1] in ("K", "Q", "R", "B", "N"):
+                pieceType = text[0]
+                text = text[1:]
+            text = text.replace("x", "").replace("-", "")
+            if len(text) < 2 or text[-2] not in Move.filesToCols or text[-1] not in Move.ranksToRows:
+                raise ValueError("Invalid move '%s'" % san)
+            endRow, endCol = Move.ranksToRows[text[-1]], Move.filesToCols[text[-2]]
+            disambiguation = text[:-2]
+            candidates = [move for move in validMoves if move.pieceMoved[1] == pieceType and move.endRow == endRow and
+                          move.endCol == endCol and move.pawnPromotionPiece == promotion and
+                          all(move.startCol == Move.filesToCols[char] if char in Move.filesToCols else
+                              move.startRow == Move.ranksToRows.get(char) for char in disambiguation)]
+        if len(candidates) != 1:
+            raise ValueError("%s move '%s'" % ("Illegal" if not candidates else "Ambiguous", san))
+        return candidates[0]
+
     '''
     Determine if the enemy can attack the square (row, col)
     '''
 
     def squareUnderAttack(self, row, col):
-        self.whiteToMove = not self.whiteToMove  # Switch to opponents point of view
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove  # Switch to own view back
-        for move in oppMoves:
-            if move.endRow == row and move.endCol == col:  # Square is under attack
-                return True
-        return False
+        return len(self.attackersOfSquare(row, col, "b" if self.whiteToMove else "w", stopAtFirst=True)) > 0
+
+    '''
+    Return the squares (row, col) of all pieces of the given color attacking the square (row, col). Works outward from
+    the square along the lines, knight hops and pawn diagonals, so no moves have to be generated.
+    '''
+
+    def attackersOfSquare(self, row, col, color, stopAtFirst=False):
+        attackers = []
+        board = self.board
+        pawnRow = row + 1 if color == "w" else row - 1  # Row from which a pawn of this color attacks the square
+        if 0 <= pawnRow <= 7:
+            for endCol in (col - 1, col + 1):
+                if 0 <= endCol <= 7 and board[pawnRow][endCol] == color + "p":
+                    attackers.append((pawnRow, endCol))
+        for direction in ((-1, -2), (-2, -1), (-2, 1), (-1, 2), (1, -2), (2, -1), (2, 1), (1, 2)):
+            endRow = row + direction[0]
+            endCol = col + direction[1]
+            if 0 <= endRow <= 7 and 0 <= endCol <= 7 and board[endRow][endCol] == color + "N":
+                attackers.append((endRow, endCol))
+        if stopAtFirst and attackers:
+            return attackers
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1))
+        for j in range(len(directions)):
+            direction = directions[j]
+            for i in range(1, 8):
+                endRow = row + direction[0] * i
+                endCol = col + direction[1] * i
+                if not (0 <= endRow <= 7 and 0 <= endCol <= 7):  # Off board
+                    break
+                endPiece = board[endRow][endCol]
+                if endPiece != "--":
+                    if endPiece[0] == color:
+                        pieceType = endPiece[1]
+                        if (j <= 3 and pieceType == "R") or (j >= 4 and pieceType == "B") or pieceType == "Q" or \
+                                (i == 1 and pieceType == "K"):
+                            attackers.append((endRow, endCol))
+                            if stopAtFirst:
+                                return attackers
+                    break  # First piece blocks the rest of the line
+        return attackers
+
+    '''
+    Static exchange evaluation (SEE): the material in pawns the capture wins when both sides then keep recapturing on the
+    end square with their least valuable attacker, each side stopping once recapturing would lose. Negative for a
+    losing capture. The capturing pieces are lifted off the board, so pieces behind them on the same line join in.
+    '''
+
+    def staticExchangeEvaluation(self, move):
+        board = self.board
+        row, col = move.endRow, move.endCol
+        gains = [exchangeScore[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 0]
+        pieceOnSquare = move.pawnPromotionPiece or move.pieceMoved[1]
+        lifted = [(move.startRow, move.startCol)]
+        if move.isEnpassantMove:
+            lifted.append((move.startRow, move.endCol))
+        liftedPieces = [board[r][c] for r, c in lifted]
+        for r, c in lifted:
+            board[r][c] = "--"
+        color = "b" if move.pieceMoved[0] == "w" else "w"
+        while True:
+            attackers = self.attackersOfSquare(row, col, color)
+            if not attackers:
+                break
+            attackRow, attackCol = min(attackers, key=lambda square: exchangeScore[board[square[0]][square[1]][1]])
+            gains.append(exchangeScore[pieceOnSquare] - gains[-1])
+            pieceOnSquare = board[attackRow][attackCol][1]
+            lifted.append((attackRow, attackCol))
+            liftedPieces.append(board[attackRow][attackCol])
+            board[attackRow][attackCol] = "--"
+            color = "b" if color == "w" else "w"
+        for (r, c), piece in zip(lifted, liftedPieces):
+            board[r][c] = piece
+        return resolveExchange(gains)
 
     '''
     All moves without considering checks
@@ -397,11 +896,9 @@ class GameState():
     def getCastleMoves(self, row, col, moves):
         if self.squareUnderAttack(row, col):
             return  # Can't castle while we are in check
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (
-                not self.whiteToMove and self.currentCastlingRight.bks):
+        if self.castlingRights & (WKS if self.whiteToMove else BKS):
             self.getKingsideCastleMoves(row, col, moves)
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (
-                not self.whiteToMove and self.currentCastlingRight.bqs):
+        if self.castlingRights & (WQS if self.whiteToMove else BQS):
             self.getQueensideCastleMoves(row, col, moves)
 
     def getKingsideCastleMoves(self, row, col, moves):
@@ -414,6 +911,53 @@ class GameState():
             if not self.squareUnderAttack(row, col - 1) and not self.squareUnderAttack(row, col - 2):
                 moves.append(Move((row, col), (row, col - 2), self.board, isCastleMove=True))
 
+'''
+Result of an exchange from the material gained by each capture of the sequence (every entry counts the piece just
+taken minus the previous entry): going backwards, a side only recaptures if that gains more than stopping
+'''
+def resolveExchange(gains):
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+'''
+Least recently used cache of the valid moves of positions, keyed by Zobrist key. The game over flags are not stored,
+repetitions depend on the game history and are checked on every lookup.
+'''
+class MoveCache():
+    def __init__(self, maxSize=MOVE_CACHE_SIZE):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        moves = self.entries.get(key)
+        if moves is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return moves
+
+    def store(self, key, moves):
+        self.entries[key] = tuple(moves)
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def getStats(self):
+        return {"size": len(self.entries), "maxSize": self.maxSize, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+    '''
+    Copies and pickles of a GameState start with an empty cache instead of copying all entries
+    '''
+
+    def __reduce__(self):
+        return MoveCache, (self.maxSize,)
+
 class CastleRights():
     def __init__(self, wks, bks, wqs, bqs):
         self.wks = wks  # White king side
@@ -421,7 +965,20 @@ class CastleRights():
         self.wqs = wqs  # White queen side
         self.bqs = bqs  # Black queen side
 
+    '''
+    Pack the four rights into a number from 0 to 15 (used to index the Zobrist keys)
+    '''
+
+    def getIndex(self):
+        return self.wks | self.bks << 1 | self.wqs << 2 | self.bqs << 3
+
+PROMOTION_CODES = {False: 0, "N": 1, "B": 2, "R": 3, "Q": 4}
+
 class Move():
+    # Fixed attributes instead of a __dict__: smaller and faster to create, the search creates a lot of moves
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "pawnPromotionPiece",
+                 "isEnpassantMove", "isCastleMove", "moveID")
+
     # Maps coordinates like (0,0) to chess notation like a8
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}  # Reversing the dictionary
@@ -429,21 +986,23 @@ class Move():
     colsToFiles = {v: k for k, v in filesToCols.items()}  # Reversing the dictionary
 
     def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False, pawnPromotionPiece=False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        # Pawn promotion:                                                                                                <--------------------------
-        self.pawnPromotionPiece = pawnPromotionPiece
+        startRow, startCol = startSq
+        endRow, endCol = endSq
+        self.startRow = startRow
+        self.startCol = startCol
+        self.endRow = endRow
+        self.endCol = endCol
+        self.pieceMoved = board[startRow][startCol]
         # En passant:
+        self.pieceCaptured = board[endRow][endCol] if not isEnpassantMove else ("wp" if self.pieceMoved == "bp" else "bp")
         self.isEnpassantMove = isEnpassantMove
-        if self.isEnpassantMove:
-            self.pieceCaptured = "wp" if self.pieceMoved == "bp" else "bp"
+        # Pawn promotion:
+        self.pawnPromotionPiece = pawnPromotionPiece
         # Castle move
         self.isCastleMove = isCastleMove
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol  # Generate a move ID
+        # Packed move ID (15 bits): start square, end square and promotion piece. Identifies the move in its position,
+        # en passant and castling follow from the position.
+        self.moveID = (startRow * 8 + startCol) | (endRow * 8 + endCol) << 6 | PROMOTION_CODES[pawnPromotionPiece] << 12
 
     '''
     Overriding the equals method
@@ -451,9 +1010,12 @@ class Move():
 
     def __eq__(self, other):
         if isinstance(other, Move):
-            return (self.moveID == other.moveID) and (self.pawnPromotionPiece == other.pawnPromotionPiece)
+            return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     def getChessNotation(self):
         return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
 
@@ -0,0 +1,237 @@
+"""
+Evaluation of a position by material and piece placement. The running score of GameState (GameState.materialScore) is
+kept up to date by makeMove/undoMove with the squareScores below, scoreMaterial rescans the full board. scoreBoards
+evaluates many encoded boards at once with NumPy. The search of ChessAI only uses it for the leaves of depth 1 nodes
+when ChessAI.QUIESCENCE_SEARCH is switched off: with quiescence search, the default, every leaf is searched further and
+its stand pat score comes from the running score, which costs less than encoding the board.
+"""
+
+import numpy as np
+
+'''
+Score the board based on material.
+'''
+pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1} #King is equal to zero since they cancel each other out
+exchangeScore = dict(pieceScore, K=100)  # For exchanges on a square, losing the king loses everything
+
+rookBoardScore = [[4, 3, 4, 4, 4, 4, 3, 4],
+                    [4, 4, 4, 4, 4, 4, 4, 4],
+                    [1, 1, 2, 3, 3, 2, 1, 1],
+                    [1, 2, 3, 4, 4, 3, 2, 1],
+                    [1, 2, 3, 4, 4, 3, 2, 1],
+                    [1, 1, 2, 3, 3, 2, 1, 1],
+                    [4, 4, 4, 4, 4, 4, 4, 4],
+                    [4, 3, 4, 4, 4, 4, 3, 4]]
+
+knightBoardScore = [[1, 1, 1, 1, 1, 1, 1, 1],
+                    [1, 2, 2, 2, 2, 2, 2, 1],
+                    [1, 2, 3, 3, 3, 3, 2, 1],
+                    [1, 2, 3, 4, 4, 3, 2, 1],
+                    [1, 2, 3, 4, 4, 3, 2, 1],
+                    [1, 2, 3, 3, 3, 3, 2, 1],
+                    [1, 2, 2, 2, 2, 2, 2, 1],
+                    [1, 1, 1, 1, 1, 1, 1, 1]]
+
+bishopBoardScore = [[4, 3, 2, 1, 1, 2, 3, 4],
+                    [3, 4, 3, 2, 2, 3, 4, 3],
+                    [2, 3, 4, 3, 3, 4, 3, 2],
+                    [1, 2, 3, 4, 4, 3, 2, 1],
+                    [1, 2, 3, 4, 4, 3, 2, 1],
+                    [2, 3, 4, 3, 3, 4, 3, 2],
+                    [3, 4, 3, 2, 2, 3, 4, 3],
+                    [4, 3, 2, 1, 1, 2, 3, 4]]
+
+queenBoardScore = [[1, 1, 1, 3, 1, 1, 1, 1],
+                    [1, 1, 2, 3, 2, 1, 2, 1],
+                    [1, 4, 3, 3, 3, 4, 2, 1],
+                    [1, 2, 3, 3, 3, 2, 2, 1],
+                    [1, 2, 3, 3, 3, 2, 2, 1],
+                    [1, 4, 3, 3, 3, 4, 2, 1],
+                    [1, 1, 2, 3, 2, 1, 2, 1],
+                    [1, 1, 1, 3, 1, 1, 1, 1]]
+
+kingBoardScore = [[0, 0, 0, 0, 0, 0, 0, 0],
+                    [0, 0, 0, 0, 0, 0, 0, 0],
+                    [0, 0, 0, 0, 0, 0, 0, 0],
+                    [0, 0, 0, 0, 0, 0, 0, 0],
+                    [0, 0, 0, 0, 0, 0, 0, 0],
+                    [0, 0, 0, 0, 0, 0, 0, 0],
+                    [0, 0, 0, 0, 0, 0, 0, 0],
+                    [0, 0, 0, 0, 0, 0, 0, 0]]
+
+whitePawnBoardScore = [[8, 8, 8, 8, 8, 8, 8, 8],
+                        [8, 8, 8, 8, 8, 8, 8, 8],
+                        [5, 6, 6, 7, 7, 6, 6, 5],
+                        [2, 3, 3, 5, 5, 3, 3, 2],
+                        [1, 2, 3, 4, 4, 3, 2, 1],
+                        [1, 1, 2, 3, 3, 2, 1, 1],
+                        [1, 1, 1, 0, 0, 1, 1, 1],
+                        [0, 0, 0, 0, 0, 0, 0, 0]]
+
+blackPawnBoardScore = [[0, 0, 0, 0, 0, 0, 0, 0],
+                        [1, 1, 1, 0, 0, 1, 1, 1],
+                        [1, 1, 2, 3, 3, 2, 1, 1],
+                        [1, 2, 3, 4, 4, 3, 2, 1],
+                        [2, 3, 3, 5, 5, 3, 3, 2],
+                        [5, 6, 6, 7, 7, 6, 6, 5],
+                        [8, 8, 8, 8, 8, 8, 8, 8],
+                        [8, 8, 8, 8, 8, 8, 8, 8]]
+
+piecePositionScores = {"R": rookBoardScore, "N": knightBoardScore, "B": bishopBoardScore, "Q": queenBoardScore, "K": kingBoardScore, "wp": whitePawnBoardScore, "bp": blackPawnBoardScore}
+
+def scoreMaterial(board):
+    score = 0
+    for row in range(len(board)):
+        for col in range(len(board[row])):
+            square = board[row][col]
+
+            if square != "--":
+                piecePositionScore = 0
+
+                if square == "wp":
+                    piecePositionScore = piecePositionScores["wp"][row][col]
+
+                elif square == "bp":
+                    piecePositionScore = piecePositionScores["bp"][row][col]
+
+                elif square[1] != "p":
+                    piecePositionScore = piecePositionScores[square[1]][row][col]
+
+                if square[0] == "w":
+                    score += pieceScore[square[1]] + piecePositionScore * .1
+                elif square[0] == "b":
+                    score -= pieceScore[square[1]] + piecePositionScore * .1
+
+    return score
+
+'''
+Score of every piece on every square in tenths of a pawn: material plus piece placement, positive for white and
+negative for black. Integers, so the running score of GameState never drifts from a full rescan.
+'''
+squareScores = {}
+for color, sign in (("w", 1), ("b", -1)):
+    for pieceType in pieceScore:
+        positionScores = piecePositionScores[color + "p" if pieceType == "p" else pieceType]
+        squareScores[color + pieceType] = [[sign * (10 * pieceScore[pieceType] + positionScores[row][col]) for col in range(8)]
+                                           for row in range(8)]
+
+'''
+Change of the running score by the move: moved piece (or promoted piece), captured piece and castling rook
+'''
+def materialDelta(move):
+    delta = -squareScores[move.pieceMoved][move.startRow][move.startCol]
+    if move.pawnPromotionPiece != False:
+        delta += squareScores[move.pieceMoved[0] + move.pawnPromotionPiece][move.endRow][move.endCol]
+    else:
+        delta += squareScores[move.pieceMoved][move.endRow][move.endCol]
+    if move.pieceCaptured != "--":
+        captureRow = move.startRow if move.isEnpassantMove else move.endRow
+        delta -= squareScores[move.pieceCaptured][captureRow][move.endCol]
+    if move.isCastleMove:
+        rookScores = squareScores[move.pieceMoved[0] + "R"][move.endRow]
+        if move.endCol - move.startCol == 2:  # King side castle move
+            delta += rookScores[move.endCol - 1] - rookScores[move.endCol + 1]
+        else:  # Queen side castle move
+            delta += rookScores[move.endCol + 1] - rookScores[move.endCol - 2]
+    return delta
+
+'''
+Running score of the board in tenths of a pawn, computed from scratch
+'''
+def computeMaterialScore(board):
+    score = 0
+    for row in range(8):
+        for col in range(8):
+            if board[row][col] != "--":
+                score += squareScores[board[row][col]][row][col]
+    return score
+
+'''
+Score of the position for the search (the running score, O(1)). In debug mode it is checked against a full rescan.
+'''
+DEBUG_INCREMENTAL_EVALUATION = False
+
+def scorePosition(gs):
+    score = gs.materialScore / 10
+    if DEBUG_INCREMENTAL_EVALUATION:
+        fullScore = scoreMaterial(gs.board)
+        assert abs(score - fullScore) < 1e-6, "Running score %s differs from full rescan %s" % (score, fullScore)
+    return score
+
+'''
+Material alone, without the placement tables: a weaker evaluation to measure what the tables are worth in self-play
+'''
+def scorePieceMaterial(gs):
+    score = 0
+    for row in gs.board:
+        for piece in row:
+            if piece != "--":
+                score += pieceScore[piece[1]] if piece[0] == "w" else -pieceScore[piece[1]]
+    return score
+
+EVALUATIONS = {"position": scorePosition, "material": scorePieceMaterial}  # Variants selectable by name
+
+'''
+The scores as NumPy tables, to evaluate many positions in one call. A board is encoded as 64 int8 squares (index
+row * 8 + col) with the piece codes of ChessNumba: 0 for an empty square, 1 - 6 for a white pawn, knight, bishop, rook,
+queen or king and -1 - -6 for the black pieces. TABLE[code + 6, square] is the score of the piece on the square in
+tenths of a pawn, so the score of a board is the sum of its 64 entries.
+'''
+PIECE_CODES = {"--": 0}
+for color, sign in (("w", 1), ("b", -1)):
+    for code, pieceType in enumerate(["p", "N", "B", "R", "Q", "K"], start=1):
+        PIECE_CODES[color + pieceType] = sign * code
+SQUARE_SCORE_TABLE = np.zeros((13, 64), dtype=np.int32)  # Material and placement, like scorePosition
+MATERIAL_SCORE_TABLE = np.zeros((13, 64), dtype=np.int32)  # Material alone, like scorePieceMaterial
+for piece, code in PIECE_CODES.items():
+    if piece != "--":
+        SQUARE_SCORE_TABLE[code + 6] = np.array(squareScores[piece]).ravel()
+        MATERIAL_SCORE_TABLE[code + 6] = (1 if code > 0 else -1) * 10 * pieceScore[piece[1]]
+BATCH_TABLES = {scorePosition: SQUARE_SCORE_TABLE, scorePieceMaterial: MATERIAL_SCORE_TABLE}  # Per evaluation
+SQUARE_OFFSETS = np.arange(64) + 6 * 64  # Flat table index of the squares of piece code 0
+
+def encodeBoard(board):
+    return np.array([PIECE_CODES[piece] for row in board for piece in row], dtype=np.int8)
+
+'''
+Stack the boards (8x8 lists of GameState.board) into an (N, 64) array for scoreBoards
+'''
+def encodeBoards(boards):
+    return np.array([[PIECE_CODES[piece] for row in board for piece in row] for board in boards],
+                    dtype=np.int8).reshape(-1, 64)
+
+'''
+Scores in pawns (white positive) of an (N, 64) array of encoded boards, one vectorized table lookup for all of them.
+With SQUARE_SCORE_TABLE the same as scoreMaterial and scorePosition, with MATERIAL_SCORE_TABLE as scorePieceMaterial.
+'''
+def scoreBoards(boards, table=SQUARE_SCORE_TABLE):
+    boards = np.asarray(boards)
+    return table.ravel()[boards.astype(np.int32) * 64 + SQUARE_OFFSETS].sum(axis=1) / 10
+
+'''
+Encoded boards of the positions after each of the moves (valid moves of the position on board) as an (N, 64) array
+for scoreBoards. The moves are read from their moveID (start, end and promotion, see ChessEngine.Move) and applied to
+copies of the board with vectorized writes, en passant captures and castling rooks included.
+'''
+def encodeChildBoards(board, moves):
+    parent = encodeBoard(board)
+    moveIDs = np.fromiter((move.moveID for move in moves), dtype=np.intp, count=len(moves))
+    start, end, promotion = moveIDs & 63, moveIDs >> 6 & 63, moveIDs >> 12
+    moved = parent[start].astype(np.intp)
+    pieceType = np.abs(moved)
+    piece = np.where(promotion > 0, np.sign(moved) * (promotion + 1), moved)  # Promotion codes 1 - 4 are N, B, R, Q
+    enpassant = (pieceType == 1) & (start % 8 != end % 8) & (parent[end] == 0)
+    captured = np.where(enpassant, start - start % 8 + end % 8, end)
+    boards = np.repeat(parent[np.newaxis], len(moves), axis=0)
+    children = np.arange(len(moves))
+    boards[children, start] = 0
+    boards[children, captured] = 0
+    boards[children, end] = piece
+    castles = children[(pieceType == 6) & (np.abs(end - start) == 2)]
+    if castles.size:
+        kingSide = end[castles] > start[castles]
+        rookStart = np.where(kingSide, end[castles] + 1, end[castles] - 2)
+        rookEnd = np.where(kingSide, end[castles] - 1, end[castles] + 1)
+        boards[castles, rookEnd] = boards[castles, rookStart]
+        boards[castles, rookStart] = 0
+    return boards
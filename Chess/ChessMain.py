@@ -2,6 +2,7 @@
 This is our main driver file. It will be responsible for handling user input and displaying the current GameState object.
 """
 
+import os
 import pygame as p
 import pygame.transform
 import numpy as np
@@ -9,31 +10,56 @@ import keyboard as k
 
 from Chess import ChessEngine
 from Chess import ChessAI
+from Chess import ChessBitboard
+from Chess import ChessBook
+from Chess import ChessWorker
 
 WIDTH = HEIGHT = 512 #400 is another option
 DIMENSION = 8
 SQ_SIZE =HEIGHT // DIMENSION
 MAX_FPS = 15 #for animation
 IMAGES = {}
+AI_THINKING_TIME = 3 #Seconds per AI move
+USE_BITBOARD = True #False plays on the original 8x8 string board engine
+USE_NUMBA_CORE = False #True searches with the compiled core of ChessNumba (imported, and compiled, only then)
+PONDER = True #Search the expected reply while the human thinks (not with the numba core, it has no tables to keep)
+USE_OPENING_BOOK = True #Play the moves of ChessBook.BOOK_PATH while the position is in the book
+openingBook = None #Opened in main
+USE_TABLEBASES = True #Endgames of TABLEBASE_DIRECTORY are played from the tables (generate them first)
+TABLEBASE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases") #ChessTablebase (and ChessNumba) is only imported if it exists
 
 '''
 The main driver for our code. This will handle user input and updating the graphics
 '''
 def main():
+    global openingBook
     p.init()
     screen = p.display.set_mode((WIDTH,WIDTH))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
-    gs = ChessEngine.GameState()
+    gs = newGameState()
     validMoves = gs.getValidMoves()
     moveMade = False #Flag variable for when a move is made
     loadImages() #Only do this once, before the while loop
+    renderer = BoardRenderer() #Repaints only what changed since the last frame
+    if USE_NUMBA_CORE:
+        from Chess import ChessNumba
+        ChessNumba.warmUp() #Compiles once, later starts load the numba cache
+    if USE_OPENING_BOOK:
+        openingBook = ChessBook.openBook()
+    if USE_TABLEBASES and os.path.isdir(TABLEBASE_DIRECTORY):
+        from Chess import ChessTablebase
+        ChessAI.tablebase = ChessTablebase.openTablebase(TABLEBASE_DIRECTORY)
+    elif USE_TABLEBASES:
+        print("No endgame tables in %s, generate them with: python -m Chess.ChessTablebase generate" % TABLEBASE_DIRECTORY)
     sqSelected = () #No square is selected, keep track of the last click of the user (tuple: (row,col))
     playerClicks = [] #Keep track of player click (two tuples: [(x_1,y_1),(x_2,y_2)])
     gameOver = False
     playerSelected = False
     playerWhite = True #True if player is human
     playerBlack = True #Ture if player is human
+    searchWorker = ChessWorker.SearchWorker() #Runs the AI search while the window keeps responding
+    ponderMove = None #Reply of the human expected by the last AI search
     print('Choose a player ("w" for white, "b" for black, "space" for both, "n" for none)')
 
     running = True
@@ -42,6 +68,8 @@ def main():
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
+            elif e.type == p.WINDOWEXPOSED: #Window content was lost (uncovered, restored), paint everything again
+                renderer.invalidate()
             #Mouse handler
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not gameOver and humanTurn and playerSelected:
@@ -64,17 +92,21 @@ def main():
                                 keyPressed = k.read_event(suppress=True).name
                                 if keyPressed in ["1", "2", "3", "4"]:
                                     if keyPressed == "1":
-                                        move.pawnPromotionPiece = "R"
+                                        promotionPiece = "R"
                                     elif keyPressed == "2":
-                                        move.pawnPromotionPiece = "N"
+                                        promotionPiece = "N"
                                     elif keyPressed == "3":
-                                        move.pawnPromotionPiece = "B"
+                                        promotionPiece = "B"
                                     elif keyPressed == "4":
-                                        move.pawnPromotionPiece = "Q"
+                                        promotionPiece = "Q"
                                     break
+                            # The promotion piece is part of the move ID, so it is given when creating the move
+                            move = ChessEngine.Move(startSq=playerClicks[0], endSq=playerClicks[1], board=gs.board,
+                                                    pawnPromotionPiece=promotionPiece)
 
                         for i in range(len(validMoves)):
                             if move == validMoves[i]:
+                                searchWorker.playedMove(validMoves[i]) #Ponder hit or miss
                                 gs.makeMove(validMoves[i])
                                 sqSelected = () #reset user clicks
                                 playerClicks = [] #clear list
@@ -87,12 +119,16 @@ def main():
             #Key handlers
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z: #Undo move when "z" is pressed
+                    searchWorker.cancel()
+                    ponderMove = None
                     gs.undoMove()
                     moveMade = True
                     gameOver = False
                     print("Undo last move")
                 if e.key == p.K_r: #Reset the board when "r" is pressed
-                    gs = ChessEngine.GameState()
+                    searchWorker.cancel()
+                    ponderMove = None
+                    gs = newGameState()
                     validMoves = gs.getValidMoves()
                     sqSelected = ()
                     playerClicks = []
@@ -122,36 +158,74 @@ def main():
 
         #AI move finder
         if not gameOver and not humanTurn:
-
-            #######################   Chess AI   #######################
-            AIMove = ChessAI.findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove=None, depth=4, alpha=-np.inf, beta=np.inf)[1]
-            #AIMove = ChessAI.findMinMaxGreedyMoveOneStep(gs, validMoves)
-            ############################################################
-
-            if AIMove is None:
-                AIMove = ChessAI.findRandomMove(validMoves)
-            gs.makeMove(AIMove)
-            moveMade = True
-            # print(AIMove.getChessNotation())
+            if not searchWorker.isRunning():
+                searchWorker.start(gs, findAIMove)
+            done, result = searchWorker.poll(gs)
+            if done:
+                AIMove, ponderMove = result
+                if AIMove is None:
+                    AIMove = ChessAI.findRandomMove(validMoves)
+                gs.makeMove(validMoves[validMoves.index(AIMove)]) #Move object of this game, not of the searched copy
+                moveMade = True
+                # print(AIMove.getChessNotation())
+        elif searchWorker.isRunning() and not (searchWorker.isPondering() and not gameOver):
+            searchWorker.cancel() #Player changed or game over while the AI was thinking
+        elif PONDER and not USE_NUMBA_CORE and not gameOver and ponderMove is not None and \
+                not (playerBlack if gs.whiteToMove else playerWhite): #The AI plays after the human
+            searchWorker.start(gs, findAIMove, ponderMove)
+            ponderMove = None #Ponder once per move
 
         if moveMade:
             validMoves = gs.getValidMoves() # Generate new list of all valid moves
             moveMade = False
 
-        drawGameState(screen, gs, validMoves, sqSelected)
-
+        texts = []
         if not playerSelected:
-            drawText(screen, 'Choose a player')
+            texts.append('Choose a player')
         if gs.checkMate:
             gameOver = True
-            drawText(screen, 'Checkmate')
+            texts.append('Checkmate')
 
         elif gs.staleMate:
             gameOver = True
-            drawText(screen, 'Stalemate')
+            texts.append('Stalemate')
 
+        dirtyRects = drawGameState(screen, renderer, gs, validMoves, sqSelected, texts)
+        if dirtyRects: #Nothing is sent to the display if nothing changed
+            p.display.update(dirtyRects)
         clock.tick(MAX_FPS)
-        p.display.flip()
+    searchWorker.cancel()
+    if openingBook is not None:
+        openingBook.close()
+
+'''
+Search the AI move, runs in the thread of the SearchWorker on a copy of the game. Returns the move and the expected
+reply of the opponent (second move of the principal variation) to ponder on. Positions of the opening book are not
+searched.
+'''
+def findAIMove(gs, stopEvent, ponderhitEvent):
+    if openingBook is not None:
+        bookMove = openingBook.chooseMove(gs)
+        if bookMove is not None:
+            return bookMove, None
+    #######################   Chess AI   #######################
+    if USE_NUMBA_CORE:
+        from Chess import ChessNumba
+        return ChessNumba.findBestMove(gs, maxDepth=8, maxTime=AI_THINKING_TIME, stopEvent=stopEvent)[1], None
+    move = ChessAI.findBestMoveIterativeDeepening(gs, maxTime=AI_THINKING_TIME, stopEvent=stopEvent,
+                                                  ponderhitEvent=ponderhitEvent)[1]
+    #move = ChessAI.findMinMaxGreedyMoveOneStep(gs, gs.getValidMoves())
+    ############################################################
+    principalVariation = ChessAI.searchStats.principalVariation
+    return move, principalVariation[1] if len(principalVariation) > 1 else None
+
+'''
+Create a new game with the selected engine backend
+'''
+def newGameState():
+    if USE_BITBOARD:
+        return ChessBitboard.GameState()
+    return ChessEngine.GameState()
 
 '''
 Initialize a global dictionary of images. This will be called exactly once in the main
@@ -163,63 +237,107 @@ def loadImages():
     # Note: we can access an image by saying for example 'IMAGES['wp']'
 
 '''
-Highlight square selected and moves for piece selected 
+Squares to highlight: the last move, the selected square and the moves for the piece selected
 '''
-def highlightSquares(screen, gs, sqSelected):
-    s = p.Surface((SQ_SIZE, SQ_SIZE))
-    s.set_alpha(100)  # Transparency value -> 0 transparent; 255 opaque
-    s.fill(p.Color('yellow'))
+def getHighlightedSquares(gs, validMoves, sqSelected):
+    squares = set()
 
     # Highlight last enemy move
     if len(gs.moveLog) > 0:
         lastMove = gs.moveLog[-1]
-        screen.blit(s, (lastMove.startCol * SQ_SIZE, lastMove.startRow * SQ_SIZE))
-        screen.blit(s, (lastMove.endCol * SQ_SIZE, lastMove.endRow * SQ_SIZE))
+        squares.add((lastMove.startRow, lastMove.startCol))
+        squares.add((lastMove.endRow, lastMove.endCol))
 
     if  sqSelected != ():
         row, col = sqSelected
         if gs.board[row][col][0] == ("w" if gs.whiteToMove else "b"): # sqSelected is a piece that can be moved
             # Highlight selected square
-            screen.blit(s, (col*SQ_SIZE, row*SQ_SIZE))
+            squares.add((row, col))
 
             # Highlight moves from the selected square
-            for move in gs.getValidMoves():
+            for move in validMoves:
                 if move.startRow == row and move.startCol == col:
-                    screen.blit(s, (move.endCol*SQ_SIZE, move.endRow*SQ_SIZE))
+                    squares.add((move.endRow, move.endCol))
+    return squares
 
 '''
-Responsible for all the graphics within a current game state.
+Responsible for all the graphics within a current game state. Returns the rectangles of the screen that changed.
 '''
-def drawGameState(screen, gs, validMoves, sqSelected):
-    drawBoard(screen) # Draw squares on the board
-    highlightSquares(screen, gs, sqSelected)
-    drawPieces(screen, gs.board) # Draw pieces on top of those squares
+def drawGameState(screen, renderer, gs, validMoves, sqSelected, texts):
+    return renderer.draw(screen, gs.board, getHighlightedSquares(gs, validMoves, sqSelected), texts)
 
 '''
-Draw the squares on the board. the top left square is always light.
+Draw the squares on the board into a surface, once. The top left square is always light.
 '''
-def drawBoard(screen):
+def createBoardSurface():
+    surface = p.Surface((WIDTH, HEIGHT))
     colors = [p.Color('white'), p.Color('aquamarine4')] # Colors: grey, aquamarine4, seagreen4
     for row in range(DIMENSION):
         for col in range(DIMENSION):
             color = colors[((row+col)%2)]
-            p.draw.rect(screen,color,p.Rect(col*SQ_SIZE,row*SQ_SIZE,SQ_SIZE,SQ_SIZE))
+            p.draw.rect(surface,color,p.Rect(col*SQ_SIZE,row*SQ_SIZE,SQ_SIZE,SQ_SIZE))
+    return surface
 
 '''
-Draw the pieces on the board using the current GameState.board 
+Keeps what every square shows on the screen (piece and highlight) and the texts on top, so a frame only repaints the
+squares that changed. The board, the highlight, the font and the texts are rendered once and reused.
 '''
-def drawPieces(screen, board):
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            piece = board[row][col]
-            if piece != '--': # Not empty square
-                screen.blit(IMAGES[piece], p.Rect(col*SQ_SIZE, row*SQ_SIZE, SQ_SIZE,SQ_SIZE))
-
-def drawText(screen, text):
-    font = p.font.SysFont('Helvitca', 50, True, False)
-    textObject = font.render(text, 0, p.Color("black"))
-    textLocation = p.Rect(0, 0, WIDTH, HEIGHT, ).move(WIDTH / 2 - textObject.get_width() / 2, HEIGHT / 2 - textObject.get_height() / 2)
-    screen.blit(textObject, textLocation)
+class BoardRenderer():
+    def __init__(self):
+        self.boardSurface = createBoardSurface()
+        self.highlightSurface = p.Surface((SQ_SIZE, SQ_SIZE))
+        self.highlightSurface.set_alpha(100)  # Transparency value -> 0 transparent; 255 opaque
+        self.highlightSurface.fill(p.Color('yellow'))
+        self.font = p.font.SysFont('Helvitca', 50, True, False)
+        self.textSurfaces = {}
+        self.invalidate()
+
+    '''
+    Forget what is on the screen, the next frame paints everything
+    '''
+
+    def invalidate(self):
+        self.drawnSquares = [None] * (DIMENSION * DIMENSION)  # (piece, highlighted) shown on every square
+        self.drawnTexts = None
+
+    def getText(self, text):
+        if text not in self.textSurfaces:
+            textObject = self.font.render(text, 0, p.Color("black"))
+            textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH / 2 - textObject.get_width() / 2, HEIGHT / 2 - textObject.get_height() / 2)
+            self.textSurfaces[text] = (textObject, p.Rect(textLocation.topleft, textObject.get_size()))
+        return self.textSurfaces[text]
+
+    def draw(self, screen, board, highlightedSquares, texts):
+        texts = tuple(texts)
+        textsChanged = texts != self.drawnTexts
+        if textsChanged and self.drawnTexts:  # Repaint the squares under the texts that are removed
+            for text in self.drawnTexts:
+                rect = self.getText(text)[1]
+                for row in range(max(rect.top // SQ_SIZE, 0), min((rect.bottom - 1) // SQ_SIZE, DIMENSION - 1) + 1):
+                    for col in range(max(rect.left // SQ_SIZE, 0), min((rect.right - 1) // SQ_SIZE, DIMENSION - 1) + 1):
+                        self.drawnSquares[row * DIMENSION + col] = None
+
+        dirtyRects = []
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                square = (board[row][col], (row, col) in highlightedSquares)
+                if square != self.drawnSquares[row * DIMENSION + col]:
+                    rect = p.Rect(col*SQ_SIZE, row*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+                    screen.blit(self.boardSurface, rect, rect)
+                    if square[1]:
+                        screen.blit(self.highlightSurface, rect)
+                    if square[0] != '--': # Not empty square
+                        screen.blit(IMAGES[square[0]], rect)
+                    self.drawnSquares[row * DIMENSION + col] = square
+                    dirtyRects.append(rect)
+
+        for text in texts: # Texts on top, again if a square below them was repainted
+            textObject, rect = self.getText(text)
+            if textsChanged or rect.collidelist(dirtyRects) != -1:
+                screen.blit(textObject, rect)
+                dirtyRects.append(rect)
+        self.drawnTexts = texts
+        return dirtyRects
 
 if __name__ == "__main__":
     main()
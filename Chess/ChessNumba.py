@@ -0,0 +1,466 @@
+"""
+Compiled engine core. The board is a NumPy int8 array of 64 squares (index row * 8 + col) holding 0 for an empty square,
+1 - 6 for a white pawn, knight, bishop, rook, queen or king and -1 - -6 for the black pieces. The irreversible state of
+every ply (castle rights, en passant square, captured piece) is kept in a small int32 array, and moves are packed into
+int32 numbers, so move generation, make/unmake, evaluation and alpha-beta run as numba compiled code without creating
+Python objects. GameState and Move stay the interface for the GUI: findBestMove converts the position, searches it
+here and returns the matching Move of gs.getValidMoves(). The compiled functions release the GIL, so a search in a
+background thread doesn't hold up the GUI, and a stop flag checked at every node ends it within microseconds.
+
+numba is optional. Without it the same functions run as plain Python (correct, but slow).
+"""
+
+import threading
+import time
+import numpy as np
+
+from Chess import ChessEvaluation
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 0, 1, 2, 3, 4, 5, 6
+PIECE_CODES = {"p": PAWN, "N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING}
+PROMOTION_PIECES = {KNIGHT: "N", BISHOP: "B", ROOK: "R", QUEEN: "Q"}
+
+# Move = from | to << 6 | promotion piece << 12 | flag << 15
+NORMAL, ENPASSANT, CASTLE, DOUBLE_PUSH = 0, 1, 2, 3
+# Castle right bits, the same as ChessEngine.WKS, BKS, WQS, BQS
+WKS, BKS, WQS, BQS = 1, 2, 4, 8
+# Columns of the state array
+CASTLING, ENPASSANT_SQUARE, CAPTURED = 0, 1, 2
+
+MAX_PLY = 64
+MAX_MOVES = 256
+MATE = 100000
+NODES, BEST_MOVE, STOP = 0, 1, 2  # Entries of the counters array of the search
+STOP_POLL_INTERVAL = 0.01  # Seconds between the checks of the stop event and the time limit
+STALEMATE = -10  # Same as ChessAI.STALEMATE, in tenths of a pawn for the side to move
+INFINITY = 1000000
+
+'''
+Precomputed tables: the knight and king targets of every square (padded with -1) and the squares along the eight rays
+(orthogonal rays first, then diagonal rays)
+'''
+def buildTables():
+    knightTargets = -np.ones((64, 8), dtype=np.int32)
+    kingTargets = -np.ones((64, 8), dtype=np.int32)
+    rays = -np.ones((64, 8, 7), dtype=np.int32)
+    knightSteps = ((-1, -2), (-2, -1), (-2, 1), (-1, 2), (1, -2), (2, -1), (2, 1), (1, 2))
+    directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1))
+    for sq in range(64):
+        row, col = sq // 8, sq % 8
+        count = 0
+        for dRow, dCol in knightSteps:
+            if 0 <= row + dRow <= 7 and 0 <= col + dCol <= 7:
+                knightTargets[sq, count] = (row + dRow) * 8 + col + dCol
+                count += 1
+        count = 0
+        for d in range(8):
+            dRow, dCol = directions[d]
+            if 0 <= row + dRow <= 7 and 0 <= col + dCol <= 7:
+                kingTargets[sq, count] = (row + dRow) * 8 + col + dCol
+                count += 1
+            for i in range(1, 8):
+                if not (0 <= row + dRow * i <= 7 and 0 <= col + dCol * i <= 7):
+                    break
+                rays[sq, d, i - 1] = (row + dRow * i) * 8 + col + dCol * i
+    castleMask = np.full(64, 15, dtype=np.int32)  # Castle rights kept when a piece moves from or to the square
+    castleMask[7 * 8 + 4] = 15 & ~(WKS | WQS)
+    castleMask[7 * 8 + 0] = 15 & ~WQS
+    castleMask[7 * 8 + 7] = 15 & ~WKS
+    castleMask[0 * 8 + 4] = 15 & ~(BKS | BQS)
+    castleMask[0 * 8 + 0] = 15 & ~BQS
+    castleMask[0 * 8 + 7] = 15 & ~BKS
+    evaluation = ChessEvaluation.SQUARE_SCORE_TABLE.copy()  # Indexed by piece code + 6
+    return knightTargets, kingTargets, rays, castleMask, evaluation
+
+KNIGHT_TARGETS, KING_TARGETS, RAYS, CASTLE_MASK, EVALUATION = buildTables()
+ORDERING_VALUE = np.array([0, 1, 3, 3, 5, 9, 10], dtype=np.int32)  # MVV-LVA value by piece type
+
+# Recursive functions get an explicit signature: literal argument specializations of them don't load from the cache
+BOARD, STATE, MOVES, COUNTERS = "int8[::1]", "int32[:, ::1]", "int32[:, ::1]", "int64[::1]"
+TABLES = "int32[:, ::1], int32[:, ::1], int32[:, :, ::1], int32[::1]"  # Knight and king targets, rays, castle mask
+
+
+@njit(cache=True, nogil=True)
+def isAttacked(board, sq, side, knightTargets, kingTargets, rays):
+    # Pawns of side attack sq from one row behind it (seen from side)
+    pawnRow = sq // 8 + side
+    col = sq % 8
+    if 0 <= pawnRow <= 7:
+        if col > 0 and board[pawnRow * 8 + col - 1] == side * PAWN:
+            return True
+        if col < 7 and board[pawnRow * 8 + col + 1] == side * PAWN:
+            return True
+    for i in range(8):
+        target = knightTargets[sq, i]
+        if target < 0:
+            break
+        if board[target] == side * KNIGHT:
+            return True
+    for i in range(8):
+        target = kingTargets[sq, i]
+        if target < 0:
+            break
+        if board[target] == side * KING:
+            return True
+    for d in range(8):
+        slider = ROOK if d < 4 else BISHOP
+        for i in range(7):
+            target = rays[sq, d, i]
+            if target < 0:
+                break
+            piece = board[target]
+            if piece != EMPTY:
+                if piece == side * slider or piece == side * QUEEN:
+                    return True
+                break
+    return False
+
+
+@njit(cache=True, nogil=True)
+def addMove(moves, count, start, end, promotion, flag):
+    moves[count] = start | end << 6 | promotion << 12 | flag << 15
+    return count + 1
+
+
+'''
+Write all pseudo legal moves of side into moves and return their number
+'''
+@njit(cache=True, nogil=True)
+def generateMoves(board, side, castling, enpassantSquare, moves, knightTargets, kingTargets, rays):
+    count = 0
+    forward = -8 if side == 1 else 8
+    startRow = 6 if side == 1 else 1
+    promotionRow = 0 if side == 1 else 7
+    for sq in range(64):
+        piece = board[sq] * side
+        if piece <= 0:
+            continue
+        if piece == PAWN:
+            end = sq + forward
+            if board[end] == EMPTY:
+                if end // 8 == promotionRow:
+                    for promotion in (ROOK, KNIGHT, BISHOP, QUEEN):
+                        count = addMove(moves, count, sq, end, promotion, NORMAL)
+                else:
+                    count = addMove(moves, count, sq, end, 0, NORMAL)
+                    if sq // 8 == startRow and board[end + forward] == EMPTY:
+                        count = addMove(moves, count, sq, end + forward, 0, DOUBLE_PUSH)
+            for dCol in (-1, 1):
+                col = sq % 8 + dCol
+                if col < 0 or col > 7:
+                    continue
+                end = sq + forward + dCol
+                if board[end] * side < 0:
+                    if end // 8 == promotionRow:
+                        for promotion in (ROOK, KNIGHT, BISHOP, QUEEN):
+                            count = addMove(moves, count, sq, end, promotion, NORMAL)
+                    else:
+                        count = addMove(moves, count, sq, end, 0, NORMAL)
+                elif end == enpassantSquare:
+                    count = addMove(moves, count, sq, end, 0, ENPASSANT)
+        elif piece == KNIGHT or piece == KING:
+            targets = knightTargets if piece == KNIGHT else kingTargets
+            for i in range(8):
+                end = targets[sq, i]
+                if end < 0:
+                    break
+                if board[end] * side <= 0:
+                    count = addMove(moves, count, sq, end, 0, NORMAL)
+        else:
+            first = 4 if piece == BISHOP else 0
+            last = 4 if piece == ROOK else 8
+            for d in range(first, last):
+                for i in range(7):
+                    end = rays[sq, d, i]
+                    if end < 0:
+                        break
+                    target = board[end] * side
+                    if target > 0:
+                        break
+                    count = addMove(moves, count, sq, end, 0, NORMAL)
+                    if target < 0:
+                        break
+    # Castle moves: king and the squares it crosses must not be attacked
+    kingSq = 60 if side == 1 else 4
+    kingSide = WKS if side == 1 else BKS
+    queenSide = WQS if side == 1 else BQS
+    if castling & (kingSide | queenSide) and board[kingSq] == side * KING and \
+            not isAttacked(board, kingSq, -side, knightTargets, kingTargets, rays):
+        if castling & kingSide and board[kingSq + 1] == EMPTY and board[kingSq + 2] == EMPTY and \
+                not isAttacked(board, kingSq + 1, -side, knightTargets, kingTargets, rays) and \
+                not isAttacked(board, kingSq + 2, -side, knightTargets, kingTargets, rays):
+            count = addMove(moves, count, kingSq, kingSq + 2, 0, CASTLE)
+        if castling & queenSide and board[kingSq - 1] == EMPTY and board[kingSq - 2] == EMPTY and \
+                board[kingSq - 3] == EMPTY and \
+                not isAttacked(board, kingSq - 1, -side, knightTargets, kingTargets, rays) and \
+                not isAttacked(board, kingSq - 2, -side, knightTargets, kingTargets, rays):
+            count = addMove(moves, count, kingSq, kingSq - 2, 0, CASTLE)
+    return count
+
+
+'''
+Execute the move and write the irreversible state of the new position into state[ply + 1]
+'''
+@njit(cache=True, nogil=True)
+def makeMove(board, state, ply, move, castleMask):
+    start = move & 63
+    end = move >> 6 & 63
+    promotion = move >> 12 & 7
+    flag = move >> 15
+    piece = board[start]
+    side = 1 if piece > 0 else -1
+    captured = board[end]
+    if flag == ENPASSANT:
+        captureSq = start // 8 * 8 + end % 8
+        captured = board[captureSq]
+        board[captureSq] = EMPTY
+    board[end] = promotion * side if promotion != 0 else piece
+    board[start] = EMPTY
+    if flag == CASTLE:
+        if end > start:  # King side
+            board[end - 1] = board[end + 1]
+            board[end + 1] = EMPTY
+        else:  # Queen side
+            board[end + 1] = board[end - 2]
+            board[end - 2] = EMPTY
+    state[ply + 1, CASTLING] = state[ply, CASTLING] & castleMask[start] & castleMask[end]
+    state[ply + 1, ENPASSANT_SQUARE] = (start + end) // 2 if flag == DOUBLE_PUSH else -1
+    state[ply + 1, CAPTURED] = captured
+
+
+@njit(cache=True, nogil=True)
+def unmakeMove(board, state, ply, move):
+    start = move & 63
+    end = move >> 6 & 63
+    promotion = move >> 12 & 7
+    flag = move >> 15
+    piece = board[end]
+    side = 1 if piece > 0 else -1
+    board[start] = side * PAWN if promotion != 0 else piece
+    if flag == ENPASSANT:
+        board[end] = EMPTY
+        board[start // 8 * 8 + end % 8] = state[ply + 1, CAPTURED]
+    else:
+        board[end] = state[ply + 1, CAPTURED]
+    if flag == CASTLE:
+        if end > start:  # King side
+            board[end + 1] = board[end - 1]
+            board[end - 1] = EMPTY
+        else:  # Queen side
+            board[end - 2] = board[end + 1]
+            board[end + 1] = EMPTY
+
+
+@njit(cache=True, nogil=True)
+def findKing(board, side):
+    for sq in range(64):
+        if board[sq] == side * KING:
+            return sq
+    return -1
+
+
+'''
+Score of the board in tenths of a pawn, positive for white
+'''
+@njit(cache=True, nogil=True)
+def evaluate(board, evaluation):
+    score = 0
+    for sq in range(64):
+        if board[sq] != EMPTY:
+            score += evaluation[board[sq] + 6, sq]
+    return score
+
+
+'''
+Count the leaf nodes of all legal move sequences of the given length
+'''
+@njit("int64(%s, %s, %s, int64, int64, int64, %s)" % (BOARD, STATE, MOVES, TABLES), cache=True, nogil=True)
+def perft(board, state, moves, ply, depth, side, knightTargets, kingTargets, rays, castleMask):
+    count = generateMoves(board, side, state[ply, CASTLING], state[ply, ENPASSANT_SQUARE], moves[ply],
+                          knightTargets, kingTargets, rays)
+    nodes = 0
+    for i in range(count):
+        move = moves[ply, i]
+        makeMove(board, state, ply, move, castleMask)
+        if not isAttacked(board, findKing(board, side), -side, knightTargets, kingTargets, rays):
+            if depth == 1:
+                nodes += 1
+            else:
+                nodes += perft(board, state, moves, ply + 1, depth - 1, -side, knightTargets, kingTargets, rays, castleMask)
+        unmakeMove(board, state, ply, move)
+    return nodes
+
+
+'''
+Negamax alpha-beta search, the score is seen from side. Captures and promotions are searched first (MVV-LVA).
+counters[NODES] counts the visited nodes, counters[BEST_MOVE] receives the best move of the root. Once another thread
+sets counters[STOP] the search returns right away, the scores of the interrupted search are meaningless.
+'''
+@njit("int64(%s, %s, %s, int32[:, ::1], int64, int64, int64, int64, int64, %s, %s, int32[:, ::1], int32[::1])"
+      % (BOARD, STATE, MOVES, COUNTERS, TABLES), cache=True, nogil=True)
+def alphaBeta(board, state, moves, orderScores, ply, depth, alpha, beta, side, counters,
+              knightTargets, kingTargets, rays, castleMask, evaluation, orderingValue):
+    counters[NODES] += 1
+    if counters[STOP] != 0:
+        return 0
+    if depth == 0 or ply >= MAX_PLY - 1:
+        return evaluate(board, evaluation) * side
+    count = generateMoves(board, side, state[ply, CASTLING], state[ply, ENPASSANT_SQUARE], moves[ply],
+                          knightTargets, kingTargets, rays)
+    for i in range(count):
+        move = moves[ply, i]
+        victim = board[move >> 6 & 63]
+        orderScores[ply, i] = 0
+        if victim != EMPTY:
+            orderScores[ply, i] = 100 + 10 * orderingValue[abs(victim)] - orderingValue[abs(board[move & 63])]
+        elif move >> 12 & 7 != 0:
+            orderScores[ply, i] = 100 + orderingValue[move >> 12 & 7]
+    best = -INFINITY
+    legalMoves = 0
+    for i in range(count):
+        # Selection sort on the fly: take the best remaining move
+        bestIndex = i
+        for j in range(i + 1, count):
+            if orderScores[ply, j] > orderScores[ply, bestIndex]:
+                bestIndex = j
+        move = moves[ply, bestIndex]
+        moves[ply, bestIndex] = moves[ply, i]
+        moves[ply, i] = move
+        orderScore = orderScores[ply, bestIndex]
+        orderScores[ply, bestIndex] = orderScores[ply, i]
+        orderScores[ply, i] = orderScore
+
+        makeMove(board, state, ply, move, castleMask)
+        if isAttacked(board, findKing(board, side), -side, knightTargets, kingTargets, rays):
+            unmakeMove(board, state, ply, move)
+            continue
+        legalMoves += 1
+        score = -alphaBeta(board, state, moves, orderScores, ply + 1, depth - 1, -beta, -alpha, -side, counters,
+                           knightTargets, kingTargets, rays, castleMask, evaluation, orderingValue)
+        unmakeMove(board, state, ply, move)
+        if counters[STOP] != 0:
+            return 0
+        if score > best:
+            best = score
+            if ply == 0:
+                counters[BEST_MOVE] = move
+        if score > alpha:
+            alpha = score
+        if alpha >= beta:
+            break
+    if legalMoves == 0:
+        if isAttacked(board, findKing(board, side), -side, knightTargets, kingTargets, rays):
+            return -MATE + ply
+        return STALEMATE
+    return best
+
+
+@njit(cache=True, nogil=True)
+def searchRoot(board, state, moves, orderScores, depth, side, counters,
+               knightTargets, kingTargets, rays, castleMask, evaluation, orderingValue):
+    counters[BEST_MOVE] = 0
+    score = alphaBeta(board, state, moves, orderScores, 0, depth, -INFINITY, INFINITY, side, counters,
+                      knightTargets, kingTargets, rays, castleMask, evaluation, orderingValue)
+    return score, counters[BEST_MOVE]
+
+
+'''
+Convert a GameState into (board, state) arrays of the compiled core
+'''
+def encodePosition(gs):
+    board = np.zeros(64, dtype=np.int8)
+    for row in range(8):
+        for col in range(8):
+            piece = gs.board[row][col]
+            if piece != "--":
+                board[row * 8 + col] = PIECE_CODES[piece[1]] * (1 if piece[0] == "w" else -1)
+    state = np.zeros((MAX_PLY + 1, 3), dtype=np.int32)
+    state[0, CASTLING] = gs.castlingRights
+    state[0, ENPASSANT_SQUARE] = gs.enpassantPossible[0] * 8 + gs.enpassantPossible[1] if gs.enpassantPossible != () else -1
+    return board, state
+
+'''
+Return the Move of validMoves that matches the packed move of the compiled core
+'''
+def decodeMove(packedMove, validMoves):
+    start, end, promotion = packedMove & 63, packedMove >> 6 & 63, packedMove >> 12 & 7
+    for move in validMoves:
+        if move.startRow * 8 + move.startCol == start and move.endRow * 8 + move.endCol == end and \
+                move.pawnPromotionPiece == PROMOTION_PIECES.get(promotion, False):
+            return move
+    return None
+
+def perftGameState(gs, depth):
+    board, state = encodePosition(gs)
+    moves = np.zeros((MAX_PLY, MAX_MOVES), dtype=np.int32)
+    return perft(board, state, moves, 0, depth, 1 if gs.whiteToMove else -1, KNIGHT_TARGETS, KING_TARGETS, RAYS, CASTLE_MASK)
+
+'''
+Compile (or load from the numba cache) all functions by running a tiny search once
+'''
+def warmUp():
+    from Chess import ChessEngine
+    findBestMove(ChessEngine.GameState(), maxDepth=1)
+
+'''
+Set the stop flag of a running search once stopEvent is set or the deadline has passed, until searchDone is set. Runs in
+its own thread, the compiled search can't look at events or clocks.
+'''
+def watchStop(counters, stopEvent, deadline, searchDone):
+    while not searchDone.wait(STOP_POLL_INTERVAL):
+        if (stopEvent is not None and stopEvent.is_set()) or (deadline is not None and time.perf_counter() >= deadline):
+            counters[STOP] = 1
+            return
+
+'''
+Iterative deepening search of the compiled core. Stops after maxDepth or when the next depth would likely exceed the
+remaining time (seconds). An iteration is interrupted once stopEvent (threading.Event) is set or the time is used up,
+then the result of the previous one is returned; depth 1 is always completed. Returns (score seen from white in pawns,
+Move of gs.getValidMoves(), nodes).
+'''
+def findBestMove(gs, maxDepth=6, maxTime=None, stopEvent=None):
+    validMoves = gs.getValidMoves()
+    if len(validMoves) == 0:
+        return 0, None, 0
+    board, state = encodePosition(gs)
+    moves = np.zeros((MAX_PLY, MAX_MOVES), dtype=np.int32)
+    orderScores = np.zeros((MAX_PLY, MAX_MOVES), dtype=np.int32)
+    counters = np.zeros(3, dtype=np.int64)  # Nodes, best root move, stop flag
+    side = 1 if gs.whiteToMove else -1
+    startTime = time.perf_counter()
+    score, bestMove = 0, None
+    searchDone = threading.Event()
+    watcher = None
+    try:
+        for depth in range(1, maxDepth + 1):
+            if depth == 2 and (stopEvent is not None or maxTime is not None):
+                watcher = threading.Thread(target=watchStop, daemon=True, args=(counters, stopEvent,
+                                           startTime + maxTime if maxTime is not None else None, searchDone))
+                watcher.start()
+            iterationStart = time.perf_counter()
+            iterationScore, packedMove = searchRoot(board, state, moves, orderScores, depth, side, counters,
+                                                    KNIGHT_TARGETS, KING_TARGETS, RAYS, CASTLE_MASK, EVALUATION,
+                                                    ORDERING_VALUE)
+            if counters[STOP] != 0:  # Interrupted, the previous iteration stands
+                break
+            score, bestMove = iterationScore, decodeMove(packedMove, validMoves)
+            elapsed = time.perf_counter() - startTime
+            if abs(score) >= MATE - MAX_PLY:  # Forced mate found
+                break
+            if maxTime is not None and elapsed + (time.perf_counter() - iterationStart) * 5 > maxTime:
+                break
+            if stopEvent is not None and stopEvent.is_set():
+                break
+    finally:
+        searchDone.set()
+        if watcher is not None:
+            watcher.join()
+    return score * side / 10, bestMove, int(counters[NODES])
@@ -0,0 +1,162 @@
+"""
+Parallel search on several processes, threads don't help because the search is pure Python and holds the GIL. Every
+depth of the iterative deepening splits the root moves between the processes of a pool: the best move of the previous
+depth is searched first with a full window, then all other root moves at once against its score, like a serial
+alpha-beta search would. Moves scoring below only get a bound, which is cheap. Run the scaling benchmark with:
+
+    python -m Chess.ChessParallel --workers 1 2 4 8 --depth 4
+    python -m Chess.ChessParallel --workers 1 8 --depth 4 --deterministic   # Also checks equal results
+"""
+
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Chess import ChessAI
+from Chess import ChessBitboard
+
+SEED = 20240219
+DETERMINISTIC_TABLE_MB = 4  # The table is cleared for every root move in deterministic mode, a small one clears fast
+
+BENCHMARK_POSITIONS = [
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+]
+
+def initWorker(seed, deterministic):
+    random.seed(seed)
+    if deterministic:
+        ChessAI.transpositionTable = ChessAI.TranspositionTable(DETERMINISTIC_TABLE_MB)
+
+'''
+Runs in a worker process: search the position after the root move to depth - 1. For white (maximizing) the window is
+(bound, inf), for black (-inf, bound). Returns (score, nodes). In deterministic mode the tables of the process are
+cleared first, so the result doesn't depend on which moves the process searched before.
+'''
+def searchRootMove(gs, move, depth, bound, deterministic):
+    if deterministic:
+        ChessAI.clearSearchTables()
+    ChessAI.startSearch()
+    validMoves = gs.getValidMoves()
+    whiteToMove = gs.whiteToMove
+    gs.makeMove(validMoves[validMoves.index(move)])
+    if whiteToMove:
+        alpha, beta = bound, ChessAI.CHECKMATE
+    else:
+        alpha, beta = -ChessAI.CHECKMATE, bound
+    score = ChessAI.findMinMaxGreedyMoveMultipleSteps(gs, playerBestMove=None, depth=depth-1, alpha=alpha, beta=beta)[0]
+    return score, ChessAI.searchStats.nodes
+
+'''
+Pool of search processes, keep it open for several searches (starting the processes takes a moment):
+
+    with ParallelSearch(workers=8) as search:
+        score, move = search.findBestMove(gs, maxDepth=5)
+'''
+class ParallelSearch():
+    def __init__(self, workers=None, deterministic=False, seed=SEED):
+        self.workers = workers or os.cpu_count()
+        self.deterministic = deterministic
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker, initargs=(seed, deterministic))
+        self.nodes = 0
+        self.depthTimes = []  # Seconds from the start of the search until each depth was completed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    '''
+    Iterative deepening like ChessAI.findBestMoveIterativeDeepening, returns (score seen from white, move). A running
+    depth can't be interrupted, so with maxTime the next depth only starts if it will likely finish in time.
+    '''
+
+    def findBestMove(self, gs, maxDepth=64, maxTime=None):
+        self.nodes = 0
+        self.depthTimes = []
+        rootMoves = gs.getValidMoves()
+        if len(rootMoves) == 0:
+            return (-ChessAI.CHECKMATE if gs.whiteToMove else ChessAI.CHECKMATE) if gs.checkMate else 0, None
+        startTime = time.perf_counter()
+        bestScore, bestMove = None, None
+        for depth in range(1, maxDepth + 1):
+            iterationStart = time.perf_counter()
+            bestScore, bestMove, rootMoves = self.searchDepth(gs, rootMoves, depth)
+            self.depthTimes.append(time.perf_counter() - startTime)
+            if abs(bestScore) == ChessAI.CHECKMATE:  # Forced mate found
+                break
+            if maxTime is not None and self.depthTimes[-1] + (time.perf_counter() - iterationStart) * 5 > maxTime:
+                break
+        return bestScore, bestMove
+
+    '''
+    Search the first root move, then all others in parallel to the depth. Returns the best score and move and the root
+    moves sorted from best to worst for the next depth. Equal scores keep the order of the previous depth, so the result
+    is reproducible.
+    '''
+
+    def searchDepth(self, gs, rootMoves, depth):
+        turnMultiplier = 1 if gs.whiteToMove else -1
+        firstScore, nodes = self.executor.submit(searchRootMove, gs, rootMoves[0], depth,
+                                                 -turnMultiplier * ChessAI.CHECKMATE, self.deterministic).result()
+        self.nodes += nodes
+        if turnMultiplier * firstScore == ChessAI.CHECKMATE:  # The first move mates, nothing is better
+            return firstScore, rootMoves[0], rootMoves
+        scores = [firstScore]
+        futures = [self.executor.submit(searchRootMove, gs, move, depth, firstScore, self.deterministic)
+                   for move in rootMoves[1:]]
+        for future in futures:
+            score, nodes = future.result()
+            scores.append(score)
+            self.nodes += nodes
+        order = sorted(range(len(rootMoves)), key=lambda i: -turnMultiplier * scores[i])
+        return scores[order[0]], rootMoves[order[0]], [rootMoves[i] for i in order]
+
+'''
+Time to depth of every worker count over the benchmark positions, with the speedup over one worker
+'''
+def runBenchmark(workerCounts, depth, positions, deterministic=False):
+    results = {}
+    for workers in workerCounts:
+        with ParallelSearch(workers=workers, deterministic=deterministic) as search:
+            search.findBestMove(ChessBitboard.GameState(), maxDepth=1)  # Start the processes before timing
+            totalTime = 0
+            totalNodes = 0
+            moves = []
+            for fen in positions:
+                gs = ChessBitboard.GameState()
+                gs.loadFEN(fen)
+                startTime = time.perf_counter()
+                score, move = search.findBestMove(gs, maxDepth=depth)
+                totalTime += time.perf_counter() - startTime
+                totalNodes += search.nodes
+                moves.append((score, ChessAI.moveNotation(move)))
+        results[workers] = (totalTime, totalNodes, moves)
+        print("%2d workers: %8.2fs  %10d nodes  %8.0f nps  speedup %5.2f  %s" % (workers, totalTime, totalNodes,
+              totalNodes / totalTime, results[workerCounts[0]][0] / totalTime,
+              " ".join("%s(%s)" % (move, score) for score, move in moves)))
+    if deterministic:
+        same = all(results[workers][2] == results[workerCounts[0]][2] for workers in workerCounts)
+        print("Deterministic results: %s" % ("identical for all worker counts" if same else "DIFFERENT"))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the parallel root split search")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fen", action="append", help="position to search (repeatable), default the benchmark set")
+    parser.add_argument("--deterministic", action="store_true", help="clear the tables for every root move")
+    args = parser.parse_args()
+    print("%d CPUs available" % os.cpu_count())
+    runBenchmark(args.workers, args.depth, args.fen or BENCHMARK_POSITIONS, args.deterministic)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Perft: count the leaf nodes of the move generation tree to a fixed depth. The counts of the standard positions below are
+known, so any difference points to a bug in getValidMoves/makeMove/undoMove, and the time taken measures the speed of
+the move generator. Run it with:
+
+    python -m Chess.ChessPerft                      # Verify the suite and report nodes per second
+    python -m Chess.ChessPerft --engine string      # Same for the original 8x8 string board
+    python -m Chess.ChessPerft --fen "<FEN>" --depth 3 --divide
+
+The shallow depths of the suite run on every engine with the tests (python -m pytest, tests/test_perft.py).
+"""
+
+import argparse
+import sys
+import time
+
+from Chess import ChessEngine
+from Chess import ChessBitboard
+
+'''
+Standard test positions with their known node counts for depth 1, 2, 3, ...
+'''
+PERFT_SUITE = [
+    ("Start position", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("Kiwipete (castling, pins, promotions)", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("Rook endgame (en passant discovered checks)", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("Promotions and checks", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("Promotion to the back rank", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("Symmetrical middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+    ("En passant capture available", "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+     [31, 707, 21637, 524138]),
+]
+
+ENGINES = {"string": ChessEngine.GameState, "bitboard": ChessBitboard.GameState}
+
+'''
+Count the leaf nodes to the given depth. The moves of the last ply are counted without being made.
+'''
+def perft(gs, depth):
+    validMoves = gs.getValidMoves()
+    if depth <= 1:
+        return len(validMoves) if depth == 1 else 1
+    nodes = 0
+    for move in validMoves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+'''
+Node counts per root move, to find the move where a wrong count comes from
+'''
+def divide(gs, depth):
+    counts = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts[move.getChessNotation() + (move.pawnPromotionPiece or "")] = perft(gs, depth - 1)
+        gs.undoMove()
+    return counts
+
+'''
+Create the position for an engine: "string", "bitboard" or "numba" (the compiled core counts on its own arrays)
+'''
+def newGameState(engine, fen):
+    gs = ENGINES["bitboard" if engine == "numba" else engine]()
+    gs.moveCache = None  # Measure the move generator, not the cache
+    gs.loadFEN(fen)
+    return gs
+
+def countNodes(gs, depth, engine):
+    if engine == "numba":
+        from Chess import ChessNumba
+        return ChessNumba.perftGameState(gs, depth)
+    return perft(gs, depth)
+
+'''
+Run the suite up to maxNodes leaf nodes per position. Returns True if every count matches.
+'''
+def runSuite(engine="bitboard", maxNodes=200000, out=sys.stdout):
+    if engine == "numba":
+        from Chess import ChessNumba
+        ChessNumba.warmUp()
+    allPassed = True
+    totalNodes = 0
+    totalTime = 0
+    for name, fen, expectedCounts in PERFT_SUITE:
+        for depth, expected in enumerate(expectedCounts, start=1):
+            if expected > maxNodes:
+                break
+            gs = newGameState(engine, fen)
+            startTime = time.perf_counter()
+            nodes = countNodes(gs, depth, engine)
+            elapsed = time.perf_counter() - startTime
+            totalNodes += nodes
+            totalTime += elapsed
+            passed = nodes == expected
+            allPassed = allPassed and passed
+            print("%-45s depth %d  %10d nodes  %8.3fs  %10.0f nps  %s" % (name, depth, nodes, elapsed,
+                  nodes / elapsed if elapsed > 0 else 0, "ok" if passed else "FAILED (expected %d)" % expected), file=out)
+    print("Total: %d nodes in %.2fs, %.0f nodes per second, %s" % (totalNodes, totalTime,
+          totalNodes / totalTime if totalTime > 0 else 0, "all passed" if allPassed else "FAILURES"), file=out)
+    return allPassed
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft move generator test and benchmark")
+    parser.add_argument("--engine", choices=["string", "bitboard", "numba"], default="bitboard")
+    parser.add_argument("--fen", help="count a single position instead of the suite")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--max-nodes", type=int, default=200000, help="deepest suite depth to run, by expected nodes")
+    args = parser.parse_args()
+
+    if args.fen is None:
+        sys.exit(0 if runSuite(args.engine, args.max_nodes) else 1)
+    gs = newGameState(args.engine, args.fen)
+    startTime = time.perf_counter()
+    if args.divide:
+        counts = divide(gs, args.depth)
+        for notation in sorted(counts):
+            print("%s: %d" % (notation, counts[notation]))
+        nodes = sum(counts.values())
+    else:
+        nodes = countNodes(gs, args.depth, args.engine)
+    elapsed = time.perf_counter() - startTime
+    print("Nodes: %d  Time: %.3fs  NPS: %.0f" % (nodes, elapsed, nodes / elapsed if elapsed > 0 else 0))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Headless self-play: plays games between two engine settings on a pool of processes, without pygame or rendering, and
+reports the score, the Elo difference and the games per hour. Every opening (a few random moves) is played twice with
+swapped colors. Engine settings are comma separated key=value pairs:
+
+    name=...         Name in the results (default the settings string)
+    depth=3          Maximum search depth (default 3, or unlimited if time or nodes is given)
+    time=0.5         Seconds per move
+    nodes=20000      Nodes per move
+    eval=position    Evaluation: position (material and placement) or material
+    ordering=1       Move ordering on (1) or off (0)
+    quiescence=1     Quiescence search of captures at the leaves on (1) or off (0)
+    nullmove=1       Null move pruning on (1) or off (0)
+    lmr=1            Late move reductions on (1) or off (0)
+    pvs=1            Principal variation search on (1) or off (0)
+    backend=python   Search of ChessAI (python) or the compiled core of ChessNumba (numba, only depth and time)
+    hash=16          Transposition table size in MB
+
+    python -m Chess.ChessSelfPlay --games 20 --engine1 depth=3 --engine2 depth=3,eval=material --pgn games.pgn
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Chess import ChessAI
+from Chess import ChessBitboard
+from Chess import ChessEngine
+from Chess import ChessEvaluation
+
+BOARDS = {"string": ChessEngine.GameState, "bitboard": ChessBitboard.GameState}
+ENGINE_SETTINGS = ["name", "depth", "time", "nodes", "eval", "ordering", "quiescence", "nullmove", "lmr", "pvs",
+                   "backend", "hash"]
+
+'''
+Parse the settings string of an engine, raises ValueError for unknown or invalid settings
+'''
+def parseEngineSettings(spec):
+    settings = {}
+    for item in spec.split(","):
+        if not item:
+            continue
+        key, separator, value = item.partition("=")
+        if not separator or key not in ENGINE_SETTINGS:
+            raise ValueError("Invalid engine setting '%s', expected key=value with key one of %s" % (item, ENGINE_SETTINGS))
+        settings[key] = value
+    limited = "time" in settings or "nodes" in settings
+    parsed = {"name": settings.get("name", spec),
+              "depth": int(settings.get("depth", 64 if limited else 3)),
+              "time": float(settings["time"]) if "time" in settings else None,
+              "nodes": int(settings["nodes"]) if "nodes" in settings else None,
+              "eval": settings.get("eval", "position"),
+              "ordering": settings.get("ordering", "1") != "0",
+              "quiescence": settings.get("quiescence", "1") != "0",
+              "nullmove": settings.get("nullmove", "1") != "0",
+              "lmr": settings.get("lmr", "1") != "0",
+              "pvs": settings.get("pvs", "1") != "0",
+              "backend": settings.get("backend", "python"),
+              "hash": float(settings.get("hash", 16))}
+    if parsed["eval"] not in ChessEvaluation.EVALUATIONS:
+        raise ValueError("Unknown evaluation '%s', expected one of %s" % (parsed["eval"], list(ChessEvaluation.EVALUATIONS)))
+    if parsed["backend"] not in ("python", "numba"):
+        raise ValueError("Unknown backend '%s', expected python or numba" % parsed["backend"])
+    return parsed
+
+'''
+One player of a game. ChessAI keeps its tables at module level, so every engine has its own transposition and history
+table and puts them (and its settings) in place before each search.
+'''
+class Engine():
+    def __init__(self, spec):
+        self.settings = parseEngineSettings(spec)
+        self.name = self.settings["name"]
+        self.transpositionTable = ChessAI.TranspositionTable(self.settings["hash"])
+        self.historyTable = {piece: [0] * 64 for piece in ChessAI.historyTable}
+        self.nodes = 0
+        if self.settings["backend"] == "numba":
+            from Chess import ChessNumba
+            ChessNumba.warmUp()
+
+    def findMove(self, gs):
+        settings = self.settings
+        if settings["backend"] == "numba":
+            from Chess import ChessNumba
+            score, move, nodes = ChessNumba.findBestMove(gs, maxDepth=settings["depth"], maxTime=settings["time"])
+            self.nodes += nodes
+            return move
+        ChessAI.transpositionTable = self.transpositionTable
+        ChessAI.historyTable = self.historyTable
+        ChessAI.evaluatePosition = ChessEvaluation.EVALUATIONS[settings["eval"]]
+        ChessAI.MOVE_ORDERING = settings["ordering"]
+        ChessAI.QUIESCENCE_SEARCH = settings["quiescence"]
+        ChessAI.NULL_MOVE_PRUNING = settings["nullmove"]
+        ChessAI.LATE_MOVE_REDUCTIONS = settings["lmr"]
+        ChessAI.PRINCIPAL_VARIATION_SEARCH = settings["pvs"]
+        move = ChessAI.findBestMoveIterativeDeepening(gs, maxTime=settings["time"], maxNodes=settings["nodes"],
+                                                      maxDepth=settings["depth"])[1]
+        self.nodes += ChessAI.searchStats.nodes
+        return move
+
+'''
+True if neither side can mate: only kings, or kings and a single knight or bishop
+'''
+def isInsufficientMaterial(board):
+    pieces = [piece[1] for row in board for piece in row if piece != "--" and piece[1] != "K"]
+    return len(pieces) == 0 or (len(pieces) == 1 and pieces[0] in ("N", "B"))
+
+'''
+Play one game, runs in a worker process. The first openingPlies moves are random (from the seed of the opening) so
+the games differ. Returns the game as a dict of plain values.
+'''
+def playGame(gameIndex, whiteSpec, blackSpec, openingSeed, openingPlies, maxPlies, board):
+    gs = BOARDS[board]()
+    engines = {True: Engine(whiteSpec), False: Engine(blackSpec)}
+    openingRandom = random.Random(openingSeed)
+    moves = []
+    result, reason = "1/2-1/2", "move limit"
+    startTime = time.perf_counter()
+    while len(moves) < maxPlies:
+        validMoves = gs.getValidMoves()
+        if gs.checkMate:
+            result, reason = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+            break
+        if gs.staleMate:
+            reason = "stalemate" if len(validMoves) == 0 else "threefold repetition"
+            break
+        if isInsufficientMaterial(gs.board):
+            reason = "insufficient material"
+            break
+        if len(moves) < openingPlies:
+            move = openingRandom.choice(validMoves)
+        else:
+            move = engines[gs.whiteToMove].findMove(gs)
+            if move is None:
+                move = validMoves[0]
+            move = validMoves[validMoves.index(move)]
+        moves.append(gs.getSAN(move))
+        gs.makeMove(move)
+    return {"game": gameIndex, "white": engines[True].name, "black": engines[False].name, "result": result,
+            "reason": reason, "plies": len(moves), "moves": moves, "time": round(time.perf_counter() - startTime, 3),
+            "whiteNodes": engines[True].nodes, "blackNodes": engines[False].nodes}
+
+'''
+Elo difference of a score fraction and its 95% error margin, from the wins, draws and losses of the first engine
+'''
+def eloDifference(wins, draws, losses):
+    games = wins + draws + losses
+    if games == 0:
+        return 0, 0
+    score = (wins + draws / 2) / games
+    def elo(fraction):
+        fraction = min(max(fraction, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / fraction - 1) + 0.0  # No "-0"
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return elo(score), (elo(score + margin) - elo(score - margin)) / 2
+
+def writePGN(file, game, roundNumber):
+    file.write('[Event "Self-play"]\n[Site "?"]\n[Date "%s"]\n[Round "%d"]\n[White "%s"]\n[Black "%s"]\n'
+               '[Result "%s"]\n[Termination "%s"]\n\n' % (time.strftime("%Y.%m.%d"), roundNumber, game["white"],
+                                                           game["black"], game["result"], game["reason"]))
+    tokens = []
+    for ply, san in enumerate(game["moves"]):
+        if ply % 2 == 0:
+            tokens.append("%d." % (ply // 2 + 1))
+        tokens.append(san)
+    tokens.append(game["result"])
+    line = ""
+    for token in tokens:  # PGN lines are at most 80 characters
+        if len(line) + len(token) + 1 > 80:
+            file.write(line + "\n")
+            line = token
+        else:
+            line = line + " " + token if line else token
+    file.write(line + "\n\n")
+
+'''
+Play the match and print the summary. Engine 1 plays white in the even games and black in the odd games.
+'''
+def runMatch(engine1, engine2, games, workers=None, openingPlies=4, maxPlies=300, seed=1, board="bitboard",
+             pgnPath=None, jsonlPath=None, out=sys.stdout):
+    name1 = parseEngineSettings(engine1)["name"]
+    wins = draws = losses = 0
+    pgnFile = open(pgnPath, "w") if pgnPath else None
+    jsonlFile = open(jsonlPath, "w") if jsonlPath else None
+    startTime = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for gameIndex in range(games):
+                white, black = (engine1, engine2) if gameIndex % 2 == 0 else (engine2, engine1)
+                futures.append(executor.submit(playGame, gameIndex, white, black, seed * 100003 + gameIndex // 2,
+                                               openingPlies, maxPlies, board))
+            for future in as_completed(futures):
+                game = future.result()
+                points = {"1-0": 1, "0-1": 0, "1/2-1/2": 0.5}[game["result"]]
+                if game["game"] % 2 == 1:  # Engine 1 played black
+                    points = 1 - points
+                if points == 1:
+                    wins += 1
+                elif points == 0:
+                    losses += 1
+                else:
+                    draws += 1
+                print("Game %3d: %s - %s  %s (%s, %d plies, %.1fs)" % (game["game"] + 1, game["white"], game["black"],
+                      game["result"], game["reason"], game["plies"], game["time"]), file=out)
+                if pgnFile:
+                    writePGN(pgnFile, game, game["game"] + 1)
+                if jsonlFile:
+                    jsonlFile.write(json.dumps(game) + "\n")
+    finally:
+        if pgnFile:
+            pgnFile.close()
+        if jsonlFile:
+            jsonlFile.close()
+    elapsed = time.perf_counter() - startTime
+    elo, margin = eloDifference(wins, draws, losses)
+    print("%s vs %s: +%d =%d -%d, Elo difference %+.0f +/- %.0f" % (name1, parseEngineSettings(engine2)["name"], wins,
+          draws, losses, elo, margin), file=out)
+    print("%d games in %.1fs, %.1f games per hour" % (games, elapsed, games / elapsed * 3600), file=out)
+    return wins, draws, losses
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless self-play between two engine settings")
+    parser.add_argument("--engine1", default="depth=3", help="settings of the first engine, e.g. depth=3,eval=material")
+    parser.add_argument("--engine2", default="depth=3")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--opening-plies", type=int, default=4, help="random moves at the start of every game pair")
+    parser.add_argument("--max-plies", type=int, default=300, help="games reaching it are drawn")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--board", choices=list(BOARDS), default="bitboard")
+    parser.add_argument("--pgn", help="write the games to this PGN file")
+    parser.add_argument("--jsonl", help="write the games as JSON lines")
+    args = parser.parse_args()
+    try:
+        parseEngineSettings(args.engine1)
+        parseEngineSettings(args.engine2)
+    except ValueError as error:
+        parser.error(str(error))
+    runMatch(args.engine1, args.engine2, args.games, args.workers, args.opening_plies, args.max_plies, args.seed,
+             args.board, args.pgn, args.jsonl)
+
+if __name__ == "__main__":
+    main()
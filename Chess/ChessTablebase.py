@@ -0,0 +1,571 @@
+"""
+Endgame tablebases: the exact result of every position of a material set of up to four pieces (kings included), won,
+drawn or lost with the distance to mate, computed offline by retrograde analysis and probed by the search. The moves are
+those of the compiled core of ChessNumba (the rules of ChessEngine, checked by perft). Castling can't occur in these
+endings and en passant captures are left out, so positions with castle rights or a possible en passant capture are
+not probed.
+
+A table holds one int8 per position for the side to move: v > 0 wins with mate in v plies, v < 0 is mated in -v - 1
+plies and 0 is a draw (or an impossible position). The index of a position is computed from the squares of the
+pieces, so a table is a plain array without any keys: a 16 byte header (magic, number of positions, number of pieces,
+pawnless flag) followed by the values, read through a memory map. Symmetry keeps the tables small: without pawns the
+white king is mapped into the triangle a1-d1-d4 (8 symmetries), with pawns onto the files a-d (mirroring).
+
+    python -m Chess.ChessTablebase generate                    # All tables with three pieces
+    python -m Chess.ChessTablebase generate KQvKR KRvKP        # Four pieces take a few minutes per table
+    python -m Chess.ChessTablebase probe --fen "8/8/8/4k3/8/8/8/4K2Q w - - 0 1"
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+import numpy as np
+
+from Chess import ChessNumba
+from Chess.ChessNumba import njit, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, \
+    generateMoves, makeMove, unmakeMove, isAttacked, findKing, KNIGHT_TARGETS, KING_TARGETS, RAYS, CASTLE_MASK
+
+TABLEBASE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+MAX_PIECES = 4
+MAGIC = b"CHSTB001"
+UNRESOLVED, RESOLVED, INVALID = 0, 1, 2  # Status of a position during generation
+HEADER = struct.Struct("<8sIBB2x")  # Magic, number of positions, number of pieces, pawnless
+PIECE_LETTERS = {QUEEN: "Q", ROOK: "R", BISHOP: "B", KNIGHT: "N", PAWN: "P"}
+LETTER_PIECES = {letter: piece for piece, letter in PIECE_LETTERS.items()}
+DEFAULT_TABLES = ["KQvK", "KRvK", "KBvK", "KNvK", "KPvK"]
+
+'''
+Symmetries of the board as square maps: bit 0 mirrors the files, bit 1 the ranks, bit 2 swaps rows and columns. The
+identity comes first and the file mirror second, tables with pawns only use these two. KING_INDEX[pawnless] numbers the
+squares the white king is mapped to (-1 for the others), KING_SQUARES[pawnless] lists them.
+'''
+def buildSymmetryTables():
+    transforms = np.zeros((8, 64), dtype=np.int64)
+    for t in range(8):
+        for sq in range(64):
+            row, col = sq // 8, sq % 8
+            if t & 1:
+                col = 7 - col
+            if t & 2:
+                row = 7 - row
+            if t & 4:
+                row, col = col, row
+            transforms[t, sq] = row * 8 + col
+    kingIndex = -np.ones((2, 64), dtype=np.int64)
+    kingSquares = np.zeros((2, 32), dtype=np.int64)
+    counts = [0, 0]
+    for sq in range(64):
+        row, col = sq // 8, sq % 8
+        rank = 7 - row
+        for pawnless, inside in ((0, col <= 3), (1, col <= 3 and rank <= col)):  # Triangle a1-d1-d4
+            if inside:
+                kingIndex[pawnless, sq] = counts[pawnless]
+                kingSquares[pawnless, counts[pawnless]] = sq
+                counts[pawnless] += 1
+    return transforms, kingIndex, kingSquares, counts
+
+TRANSFORMS, KING_INDEX, KING_SQUARES, KING_COUNTS = buildSymmetryTables()
+MATERIAL_DIGITS = np.zeros(13, dtype=np.int64)  # Material key: base 3 digit per piece (code + 6), kings don't count
+for piece in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN):
+    MATERIAL_DIGITS[piece + 6] = 3 ** (piece - 1)
+    MATERIAL_DIGITS[-piece + 6] = 3 ** (piece + 4)
+MATERIAL_KEYS = 3 ** 10
+
+def tableSize(pieces, pawnless):
+    return KING_COUNTS[pawnless] * 64 ** (pieces - 1) * 2
+
+@njit(cache=True)
+def materialKey(board, materialDigits):
+    key = 0
+    for sq in range(64):
+        key += materialDigits[board[sq] + 6]
+    return key
+
+'''
+Index of the position in its table. With flip the colors are swapped (the table is stored with the other side as
+white), side is 1 for white and -1 for black to move. The pieces are ordered white king, black king, then the other
+white pieces and the other black pieces from queen to pawn, equal pieces by square. Of the symmetries that bring the
+white king into its area the one with the lowest index is taken, so symmetric positions share one index.
+'''
+@njit(cache=True)
+def boardIndex(board, side, flip, pawnless, transforms, kingIndex):
+    ranks = np.empty(4, dtype=np.int64)
+    squares = np.empty(4, dtype=np.int64)
+    keys = np.empty(4, dtype=np.int64)
+    count = 0
+    white = -1 if flip else 1
+    for sq in range(64):
+        piece = board[sq] * white
+        if piece == EMPTY:
+            continue
+        if piece == KING:
+            ranks[count] = 0
+        elif piece == -KING:
+            ranks[count] = 1
+        elif piece > 0:
+            ranks[count] = 2 + QUEEN - piece
+        else:
+            ranks[count] = 7 + QUEEN + piece
+        squares[count] = sq ^ 56 if flip else sq
+        count += 1
+    best = -1
+    for t in range(8 if pawnless else 2):
+        king = -1
+        for i in range(count):
+            keys[i] = ranks[i] * 64 + transforms[t, squares[i]]
+            if ranks[i] == 0:
+                king = kingIndex[pawnless, transforms[t, squares[i]]]
+        if king < 0:
+            continue
+        for i in range(1, count):  # Insertion sort by piece, then square
+            key = keys[i]
+            j = i
+            while j > 0 and keys[j - 1] > key:
+                keys[j] = keys[j - 1]
+                j -= 1
+            keys[j] = key
+        index = king
+        for i in range(1, count):
+            index = index * 64 + keys[i] % 64
+        if best < 0 or index < best:
+            best = index
+    return best * 2 + (0 if side == white else 1)
+
+'''
+Put the position of the index on the empty board. pieces are the piece codes in table order. Returns the side to
+move (1 or -1), or 0 if pieces overlap or a pawn stands on the first or last rank.
+'''
+@njit(cache=True)
+def decodeIndex(index, pieces, count, pawnless, kingSquares, board):
+    side = 1 if index % 2 == 0 else -1
+    index //= 2
+    squares = np.empty(4, dtype=np.int64)
+    for i in range(count - 1, 0, -1):
+        squares[i] = index % 64
+        index //= 64
+    squares[0] = kingSquares[pawnless, index]
+    for i in range(count):
+        sq = squares[i]
+        if board[sq] != EMPTY:
+            return 0
+        if (pieces[i] == PAWN or pieces[i] == -PAWN) and (sq < 8 or sq >= 56):
+            return 0
+        board[sq] = pieces[i]
+    return side
+
+'''
+Value of a position with other material for its side to move, from the smaller table at the offset of the slot of its
+material key in subValues. Kings alone are a draw.
+'''
+@njit(cache=True)
+def subTableValue(board, side, key, subValues, subOffsets, subPawnless, subFlip, subSlot, transforms, kingIndex):
+    if key == 0:
+        return 0
+    slot = subSlot[key]
+    return subValues[subOffsets[slot] + boardIndex(board, side, subFlip[slot], subPawnless[slot], transforms,
+                                                   kingIndex)]
+
+'''
+Add the index of the board with the piece code put back on origin to predecessors, if the side that moves next isn't in
+check there and the index isn't in the list yet. Returns the new number of predecessors.
+'''
+@njit(cache=True)
+def addPredecessor(board, origin, code, side, pawnless, predecessors, count, transforms, kingIndex,
+                   knightTargets, kingTargets, rays):
+    board[origin] = code
+    if not isAttacked(board, findKing(board, side), -side, knightTargets, kingTargets, rays):
+        index = boardIndex(board, -side, False, pawnless, transforms, kingIndex)
+        for i in range(count):
+            if predecessors[i] == index:
+                break
+        else:
+            predecessors[count] = index
+            count += 1
+    board[origin] = EMPTY
+    return count
+
+'''
+Retrograde move generation: the indexes of the positions of the same table the position (side to move) can be reached
+from, by a move of the other side that neither captures nor promotes. Returns their number.
+'''
+@njit(cache=True)
+def findPredecessors(board, side, pawnless, predecessors, transforms, kingIndex, knightTargets, kingTargets, rays):
+    mover = -side
+    count = 0
+    for sq in range(64):
+        piece = board[sq] * mover
+        if piece <= 0:
+            continue
+        code = board[sq]
+        board[sq] = EMPTY
+        if piece == PAWN:
+            origin = sq + 8 * mover  # Pawns move towards row 0 for white
+            if 8 <= origin < 56 and board[origin] == EMPTY:
+                count = addPredecessor(board, origin, code, side, pawnless, predecessors, count, transforms,
+                                       kingIndex, knightTargets, kingTargets, rays)
+                if sq // 8 == (4 if mover == 1 else 3) and board[origin + 8 * mover] == EMPTY:  # Double push
+                    count = addPredecessor(board, origin + 8 * mover, code, side, pawnless, predecessors, count,
+                                           transforms, kingIndex, knightTargets, kingTargets, rays)
+        elif piece == KNIGHT or piece == KING:
+            targets = knightTargets if piece == KNIGHT else kingTargets
+            for i in range(8):
+                origin = targets[sq, i]
+                if origin < 0:
+                    break
+                if board[origin] == EMPTY:
+                    count = addPredecessor(board, origin, code, side, pawnless, predecessors, count, transforms,
+                                           kingIndex, knightTargets, kingTargets, rays)
+        else:
+            for d in range(8):
+                if (piece == ROOK and d >= 4) or (piece == BISHOP and d < 4):
+                    continue
+                for i in range(7):
+                    origin = rays[sq, d, i]
+                    if origin < 0 or board[origin] != EMPTY:
+                        break
+                    count = addPredecessor(board, origin, code, side, pawnless, predecessors, count, transforms,
+                                           kingIndex, knightTargets, kingTargets, rays)
+        board[sq] = code
+    return count
+
+'''
+First pass over every index. Impossible positions (overlapping pieces, pawns on the back ranks, the side not to move
+in check) and the duplicates of symmetric positions get status INVALID, checkmates and stalemates are resolved. For the
+others the moves are counted: remaining holds the number of different positions of this table they lead to, and the
+moves into smaller tables set winAt (the fastest win by them), lossAt (the slowest loss by them) or drawn.
+'''
+@njit(cache=True)
+def initializeTable(values, status, remaining, winAt, lossAt, drawn, pieces, count, pawnless, tableKey, kingSquares,
+                    subValues, subOffsets, subPawnless, subFlip, subSlot, materialDigits, transforms, kingIndex,
+                    moves, state, knightTargets, kingTargets, rays, castleMask):
+    board = np.zeros(64, dtype=np.int8)
+    children = np.empty(moves.size, dtype=np.int64)
+    for index in range(values.size):
+        board[:] = EMPTY
+        side = decodeIndex(index, pieces, count, pawnless, kingSquares, board)
+        if side == 0 or boardIndex(board, side, False, pawnless, transforms, kingIndex) != index or \
+                isAttacked(board, findKing(board, -side), side, knightTargets, kingTargets, rays):
+            status[index] = INVALID
+            continue
+        legalMoves = 0
+        childCount = 0
+        moveCount = generateMoves(board, side, 0, -1, moves, knightTargets, kingTargets, rays)
+        for i in range(moveCount):
+            makeMove(board, state, 0, moves[i], castleMask)
+            if not isAttacked(board, findKing(board, side), -side, knightTargets, kingTargets, rays):
+                legalMoves += 1
+                key = materialKey(board, materialDigits)
+                if key == tableKey:
+                    child = boardIndex(board, -side, False, pawnless, transforms, kingIndex)
+                    for j in range(childCount):
+                        if children[j] == child:
+                            break
+                    else:
+                        children[childCount] = child
+                        childCount += 1
+                else:
+                    value = subTableValue(board, -side, key, subValues, subOffsets, subPawnless, subFlip, subSlot,
+                                          transforms, kingIndex)
+                    if value < 0 and (winAt[index] == 0 or -value < winAt[index]):
+                        winAt[index] = -value
+                    elif value == 0:
+                        drawn[index] = True
+                    elif value > 0 and value + 1 > lossAt[index]:
+                        lossAt[index] = value + 1
+            unmakeMove(board, state, 0, moves[i])
+        remaining[index] = childCount
+        if legalMoves == 0:
+            status[index] = RESOLVED
+            if isAttacked(board, findKing(board, side), -side, knightTargets, kingTargets, rays):
+                values[index] = -1  # Checkmate, mated in 0 plies
+
+'''
+Propagate the positions resolved at distance - 1 (frontier) to the positions they can be reached from. For an odd
+distance the frontier is lost, so a move into it wins in distance plies. For an even distance the frontier is won: one
+move less to a position that isn't won yet, and once all moves lead to won positions the position is lost in at least
+distance plies (lossAt).
+'''
+@njit(cache=True)
+def resolveDistance(values, status, remaining, lossAt, frontier, distance, pieces, count, pawnless, kingSquares,
+                    transforms, kingIndex, knightTargets, kingTargets, rays):
+    board = np.zeros(64, dtype=np.int8)
+    predecessors = np.empty(ChessNumba.MAX_MOVES, dtype=np.int64)
+    for n in range(frontier.size):
+        board[:] = EMPTY
+        side = decodeIndex(frontier[n], pieces, count, pawnless, kingSquares, board)
+        predecessorCount = findPredecessors(board, side, pawnless, predecessors, transforms, kingIndex,
+                                            knightTargets, kingTargets, rays)
+        for i in range(predecessorCount):
+            index = predecessors[i]
+            if status[index] != UNRESOLVED:
+                continue
+            if distance % 2 == 1:
+                values[index] = distance
+                status[index] = RESOLVED
+            else:
+                remaining[index] -= 1
+                if remaining[index] == 0 and lossAt[index] < distance:
+                    lossAt[index] = distance
+
+'''
+Piece codes of a material name like "KRvKP": (white pieces, black pieces) without the kings, strongest first
+'''
+def parseMaterial(name):
+    white, separator, black = name.upper().partition("V")
+    if not separator or not white.startswith("K") or not black.startswith("K") or \
+            any(letter not in LETTER_PIECES for letter in white[1:] + black[1:]):
+        raise ValueError("Invalid material '%s', expected e.g. KQvK or KRvKP" % name)
+    pieces = (sorted((LETTER_PIECES[letter] for letter in white[1:]), reverse=True),
+              sorted((LETTER_PIECES[letter] for letter in black[1:]), reverse=True))
+    if 2 + len(pieces[0]) + len(pieces[1]) > MAX_PIECES:
+        raise ValueError("Tables have at most %d pieces" % MAX_PIECES)
+    return pieces
+
+def materialName(white, black):
+    return "K" + "".join(PIECE_LETTERS[piece] for piece in sorted(white, reverse=True)) + "vK" + \
+        "".join(PIECE_LETTERS[piece] for piece in sorted(black, reverse=True))
+
+'''
+The stored form of the material: the stronger side is white. Returns (white, black, flip), flip is True if the colors
+had to be swapped.
+'''
+def canonicalMaterial(white, black):
+    white, black = sorted(white, reverse=True), sorted(black, reverse=True)
+    if black > white:
+        return black, white, True
+    return white, black, False
+
+def keyOfMaterial(white, black):
+    return sum(int(MATERIAL_DIGITS[piece + 6]) for piece in white) + sum(int(MATERIAL_DIGITS[-piece + 6]) for piece in black)
+
+'''
+Materials reachable by one capture and/or promotion
+'''
+def childMaterials(white, black):
+    children = set()
+    for own, other, isWhite in ((white, black, True), (black, white, False)):
+        for i, piece in enumerate(other):  # Captures
+            children.add((tuple(own), tuple(other[:i] + other[i + 1:]), isWhite))
+        for i, piece in enumerate(own):
+            if piece != PAWN:
+                continue
+            for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                promoted = own[:i] + [promotion] + own[i + 1:]
+                children.add((tuple(promoted), tuple(other), isWhite))
+                for j in range(len(other)):  # Capturing promotions
+                    children.add((tuple(promoted), tuple(other[:j] + other[j + 1:]), isWhite))
+    materials = set()
+    for own, other, isWhite in children:
+        materials.add((tuple(sorted(own if isWhite else other, reverse=True)),
+                       tuple(sorted(other if isWhite else own, reverse=True))))
+    return [(list(childWhite), list(childBlack)) for childWhite, childBlack in materials if childWhite or childBlack]
+
+def tablePath(name, directory):
+    return os.path.join(directory, name + ".tb")
+
+'''
+Read a table as (values memory map, number of pieces, pawnless), raises ValueError for a file that isn't a table
+'''
+def loadTable(path):
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError("'%s' is not a tablebase" % path)
+    magic, size, pieces, pawnless = HEADER.unpack(header)
+    if magic != MAGIC or os.path.getsize(path) != HEADER.size + size:
+        raise ValueError("'%s' is not a tablebase" % path)
+    return np.memmap(path, dtype=np.int8, mode="r", offset=HEADER.size, shape=(size,)), pieces, pawnless
+
+'''
+Generate the table of the material (and first all smaller tables it leads to that are missing) into directory
+'''
+def generateTable(name, directory=TABLEBASE_DIRECTORY, out=sys.stdout):
+    white, black, flip = canonicalMaterial(*parseMaterial(name))
+    name = materialName(white, black)
+    path = tablePath(name, directory)
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    subValues, subOffsets, subPawnless, subFlip = [], [], [], []
+    subSlot = -np.ones(MATERIAL_KEYS, dtype=np.int64)
+    offset = 0
+    for childWhite, childBlack in childMaterials(white, black):
+        storedWhite, storedBlack, childFlip = canonicalMaterial(childWhite, childBlack)
+        values, pieces, pawnless = loadTable(generateTable(materialName(storedWhite, storedBlack), directory, out))
+        subSlot[keyOfMaterial(childWhite, childBlack)] = len(subValues)
+        subValues.append(np.asarray(values))
+        subOffsets.append(offset)
+        subPawnless.append(pawnless)
+        subFlip.append(childFlip)
+        offset += values.size
+
+    startTime = time.perf_counter()
+    pieces = np.array([KING, -KING] + white + [-piece for piece in black], dtype=np.int8)
+    count = len(pieces)
+    pawnless = int(PAWN not in white and PAWN not in black)
+    size = tableSize(count, pawnless)
+    values = np.zeros(size, dtype=np.int8)
+    status = np.zeros(size, dtype=np.int8)
+    remaining = np.zeros(size, dtype=np.int8)
+    winAt = np.zeros(size, dtype=np.int8)
+    lossAt = np.zeros(size, dtype=np.int8)
+    drawn = np.zeros(size, dtype=np.bool_)
+    moves = np.zeros(ChessNumba.MAX_MOVES, dtype=np.int32)
+    state = np.zeros((2, 3), dtype=np.int32)
+    state[0, ChessNumba.ENPASSANT_SQUARE] = -1
+    subValues = np.concatenate(subValues) if subValues else np.zeros(1, dtype=np.int8)
+    subOffsets = np.array(subOffsets or [0], dtype=np.int64)
+    subPawnless = np.array(subPawnless or [0], dtype=np.int64)
+    subFlip = np.array(subFlip or [False], dtype=np.bool_)
+    longestSubMate = int(np.abs(subValues.astype(np.int64)).max())
+    initializeTable(values, status, remaining, winAt, lossAt, drawn, pieces, count, pawnless,
+                    keyOfMaterial(white, black), KING_SQUARES, subValues, subOffsets, subPawnless, subFlip, subSlot,
+                    MATERIAL_DIGITS, TRANSFORMS, KING_INDEX, moves, state, KNIGHT_TARGETS, KING_TARGETS, RAYS,
+                    CASTLE_MASK)
+    for distance in range(1, 127):
+        previous = distance - 1 if distance % 2 == 0 else -distance  # Value of the positions resolved at distance - 1
+        frontier = np.flatnonzero(values == previous)
+        if frontier.size == 0 and distance > longestSubMate + 1:  # Nothing can be resolved anymore, the rest is drawn
+            break
+        resolveDistance(values, status, remaining, lossAt, frontier, distance, pieces, count, pawnless, KING_SQUARES,
+                        TRANSFORMS, KING_INDEX, KNIGHT_TARGETS, KING_TARGETS, RAYS)
+        unresolved = status == UNRESOLVED
+        if distance % 2 == 1:  # Won by a move into a smaller table
+            resolved = unresolved & (winAt == distance)
+            values[resolved] = distance
+        else:  # Every move loses, the slowest in distance plies
+            resolved = unresolved & (remaining == 0) & ~drawn & (winAt == 0) & (lossAt == distance)
+            values[resolved] = -distance - 1
+        status[resolved] = RESOLVED
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, size, count, pawnless))
+        file.write(values.tobytes())
+    legal = int((status != INVALID).sum())
+    print("%-7s %9d positions  won %5.1f%%  lost %5.1f%%  longest mate %3d plies  %.1fs" % (name, legal,
+          100 * (values > 0).sum() / legal, 100 * (values < 0).sum() / legal, int(values.max()),
+          time.perf_counter() - startTime), file=out)
+    return path
+
+'''
+The tables of a directory, open them once and probe them from the search:
+
+    tablebase = Tablebase()
+    value = tablebase.probe(gs)  # None if the position isn't covered
+'''
+class Tablebase():
+    def __init__(self, directory=TABLEBASE_DIRECTORY):
+        self.tables = {}  # Material key -> (values, pawnless, flip)
+        self.maxPieces = 0
+        for fileName in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+            if not fileName.endswith(".tb"):
+                continue
+            values, pieces, pawnless = loadTable(os.path.join(directory, fileName))
+            white, black = parseMaterial(fileName[:-3])
+            self.tables[keyOfMaterial(white, black)] = (values, pawnless, False)
+            self.tables.setdefault(keyOfMaterial(black, white), (values, pawnless, True))
+            self.maxPieces = max(self.maxPieces, pieces)
+
+    def __len__(self):
+        return len(self.tables)
+
+    '''
+    Value of the position for the side to move (see the top of the file), or None if it isn't in the tables
+    '''
+
+    def probe(self, gs):
+        if gs.castlingRights or (gs.enpassantPossible != () and self.canCaptureEnpassant(gs)):
+            return None
+        board = ChessNumba.encodePosition(gs)[0]
+        if np.count_nonzero(board) > self.maxPieces:  # The material key only counts up to two pieces of a kind
+            return None
+        key = materialKey(board, MATERIAL_DIGITS)
+        if key == 0:
+            return 0
+        table = self.tables.get(key)
+        if table is None:
+            return None
+        values, pawnless, flip = table
+        return int(values[boardIndex(board, 1 if gs.whiteToMove else -1, flip, pawnless, TRANSFORMS, KING_INDEX)])
+
+    def canCaptureEnpassant(self, gs):
+        row, col = gs.enpassantPossible
+        pawnRow = row + 1 if gs.whiteToMove else row - 1
+        pawn = "wp" if gs.whiteToMove else "bp"
+        return any(0 <= pawnCol <= 7 and gs.board[pawnRow][pawnCol] == pawn for pawnCol in (col - 1, col + 1))
+
+    '''
+    The best move by the tables: the fastest mate when winning, the slowest when losing, otherwise a drawing move.
+    Returns (value, move) or None if the position or one of the positions after it isn't in the tables.
+    '''
+
+    def findBestMove(self, gs):
+        value = self.probe(gs)
+        validMoves = gs.getValidMoves()
+        if value is None or len(validMoves) == 0:
+            return None
+        bestMove, bestRank = None, None
+        for move in validMoves:
+            gs.makeMove(move)
+            childValue = self.probe(gs)
+            gs.undoMove()
+            if childValue is None:
+                return None
+            # Rank the result for the side to move: mating the opponent fast first, being mated soon last
+            rank = (2, childValue) if childValue < 0 else ((1, 0) if childValue == 0 else (0, childValue))
+            if bestRank is None or rank > bestRank:
+                bestMove, bestRank = move, rank
+        gs.getValidMoves()  # Restore the game over flags of the position
+        return value, bestMove
+
+'''
+The tables of the directory, or None (with a message) if there are none
+'''
+def openTablebase(directory=TABLEBASE_DIRECTORY):
+    tablebase = Tablebase(directory)
+    if len(tablebase) == 0:
+        print("No endgame tables in %s, generate them with: python -m Chess.ChessTablebase generate" % directory)
+        return None
+    return tablebase
+
+def describeValue(value):
+    if value is None:
+        return "not in the tables"
+    if value == 0:
+        return "draw"
+    if value > 0:
+        return "win, mate in %d plies" % value
+    return "loss, mated in %d plies" % (-value - 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="generate tables (and the smaller tables they need)")
+    generate.add_argument("materials", nargs="*", default=DEFAULT_TABLES, help="e.g. KQvK KRvKP, default %s" %
+                          " ".join(DEFAULT_TABLES))
+    generate.add_argument("--directory", default=TABLEBASE_DIRECTORY)
+    probe = commands.add_parser("probe", help="print the value and best move of a position")
+    probe.add_argument("--fen", required=True)
+    probe.add_argument("--directory", default=TABLEBASE_DIRECTORY)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        for name in args.materials:
+            try:
+                generateTable(name, args.directory)
+            except ValueError as error:
+                parser.error(str(error))
+        return
+    from Chess import ChessBitboard
+    gs = ChessBitboard.GameState()
+    gs.loadFEN(args.fen)
+    tablebase = Tablebase(args.directory)
+    result = tablebase.findBestMove(gs)
+    print(describeValue(tablebase.probe(gs)))
+    if result is not None:
+        print("Best move: %s" % gs.getSAN(result[1]))
+
+if __name__ == "__main__":
+    main()
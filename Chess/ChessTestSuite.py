@@ -0,0 +1,161 @@
+"""
+Test suite runner: searches the positions of an EPD file with ChessAI on a pool of processes and checks the moves
+against the "bm" (best move) and "am" (avoid move) operations. Every position is searched from empty tables, so the
+results only depend on the position and the engine settings (see ChessSelfPlay). Besides the solved positions it reports
+the time and nodes to solution, from the iteration of the search that found the solution and kept it to the end, and
+the nodes per second:
+
+    python -m Chess.ChessTestSuite                                 # The tactics of tactics.epd
+    python -m Chess.ChessTestSuite suite.epd --engine time=5,hash=64 --workers 4 --jsonl results.jsonl
+
+An EPD line is a FEN without the move counters followed by operations, e.g.
+
+    r3k3/8/8/1N6/8/8/8/4K3 w - - bm Nc7+; id "knight fork";
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Chess import ChessAI
+from Chess import ChessBitboard
+from Chess.ChessSelfPlay import Engine, parseEngineSettings
+
+SUITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tactics.epd")
+EPD_TOKENS = re.compile(r'"[^"]*"|;|[^\s;"]+')
+
+'''
+Split an EPD line into (FEN, operations). The operations are a dict of opcode -> list of operands, the move counters
+come from the hmvc and fmvn operations. A FEN with move counters is accepted as well.
+'''
+def parseEPD(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("Invalid EPD, expected at least 4 fields: " + line)
+    rest = fields.pop() if len(fields) > 4 else ""
+    counters = rest.split(None, 2)
+    if len(counters) >= 2 and counters[0].isdigit() and counters[1].isdigit():  # Full FEN
+        fields += counters[:2]
+        rest = counters[2] if len(counters) > 2 else ""
+    operations = {}
+    opcode = None
+    for token in EPD_TOKENS.findall(rest):
+        if token == ";":
+            opcode = None
+        elif opcode is None:
+            opcode = token
+            operations[opcode] = []
+        else:
+            operations[opcode].append(token[1:-1] if token.startswith('"') else token)
+    if len(fields) == 4:
+        fields += [operations.get("hmvc", ["0"])[0], operations.get("fmvn", ["1"])[0]]
+    return " ".join(fields[:6]), operations
+
+'''
+Read the test positions of an EPD file as dicts with id, fen, bestMoves and avoidMoves (move IDs). Raises ValueError
+for an invalid position or a move that isn't legal in it.
+'''
+def readSuite(path):
+    positions = []
+    with open(path) as file:
+        for lineNumber, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                fen, operations = parseEPD(line)
+                gs = ChessBitboard.GameState()
+                gs.loadFEN(fen)
+                bestMoves = [gs.parseSAN(san).moveID for san in operations.get("bm", [])]
+                avoidMoves = [gs.parseSAN(san).moveID for san in operations.get("am", [])]
+            except ValueError as error:
+                raise ValueError("%s line %d: %s" % (path, lineNumber, error))
+            if not bestMoves and not avoidMoves:
+                raise ValueError("%s line %d: no bm or am operation" % (path, lineNumber))
+            positions.append({"id": operations.get("id", [str(len(positions) + 1)])[0], "fen": fen,
+                              "bestMoves": bestMoves, "avoidMoves": avoidMoves})
+    return positions
+
+def isSolution(move, position):
+    if move is None:
+        return False
+    if position["bestMoves"] and move.moveID not in position["bestMoves"]:
+        return False
+    return move.moveID not in position["avoidMoves"]
+
+'''
+Search one position, runs in a worker process. The solution counts from the first iteration after which every
+iteration chose a right move. Returns the result as a dict of plain values.
+'''
+def solvePosition(index, position, engineSpec):
+    gs = ChessBitboard.GameState()
+    gs.loadFEN(position["fen"])
+    engine = Engine(engineSpec)
+    move = engine.findMove(gs)
+    stats = ChessAI.searchStats
+    solvedAt = None
+    for depth, score, nodes, seconds, iterationMove in stats.iterations:
+        if not isSolution(iterationMove, position):
+            solvedAt = None
+        elif solvedAt is None:
+            solvedAt = (depth, nodes, seconds)
+    solved = isSolution(move, position)
+    return {"index": index, "id": position["id"], "fen": position["fen"],
+            "move": gs.getSAN(move) if move is not None else None, "solved": solved,
+            "depth": stats.depth, "nodes": stats.nodes, "time": round(stats.elapsed, 6),
+            "nps": round(stats.getNodesPerSecond()),
+            "solutionDepth": solvedAt[0] if solved and solvedAt else None,
+            "solutionNodes": solvedAt[1] if solved and solvedAt else None,
+            "solutionTime": round(solvedAt[2], 6) if solved and solvedAt else None}
+
+'''
+Run the suite and print a line per position and the totals. Returns the results in the order of the file.
+'''
+def runSuite(path=SUITE_PATH, engineSpec="time=1", workers=None, jsonlPath=None, out=sys.stdout):
+    positions = readSuite(path)
+    results = [None] * len(positions)
+    startTime = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(solvePosition, index, position, engineSpec) for index, position in enumerate(positions)]
+        for future in futures:  # In file order, so the output is the same for every run
+            result = future.result()
+            results[result["index"]] = result
+            print("%-24s %-8s %-7s depth %2d  %9d nodes  %7.2fs  %7.0f nps  solution %s" % (result["id"][:24],
+                  result["move"], "solved" if result["solved"] else "FAILED", result["depth"], result["nodes"],
+                  result["time"], result["nps"], "depth %d, %d nodes, %.2fs" % (result["solutionDepth"],
+                  result["solutionNodes"], result["solutionTime"]) if result["solved"] else "-"), file=out)
+    elapsed = time.perf_counter() - startTime
+    solved = [result for result in results if result["solved"]]
+    nodes = sum(result["nodes"] for result in results)
+    searchTime = sum(result["time"] for result in results)
+    print("Solved %d of %d, %.2fs and %d nodes to the solutions" % (len(solved), len(results),
+          sum(result["solutionTime"] for result in solved), sum(result["solutionNodes"] for result in solved)),
+          file=out)
+    print("%d nodes in %.2fs of search, %.0f nodes per second, %.2fs wall time" % (nodes, searchTime,
+          nodes / searchTime if searchTime > 0 else 0, elapsed), file=out)
+    if jsonlPath:
+        with open(jsonlPath, "w") as file:
+            for result in results:
+                file.write(json.dumps(result) + "\n")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an EPD test suite with ChessAI")
+    parser.add_argument("suite", nargs="?", default=SUITE_PATH, help="EPD file, default tactics.epd")
+    parser.add_argument("--engine", default="time=1", help="engine settings like ChessSelfPlay, e.g. time=2,hash=64")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--jsonl", help="write the results as JSON lines")
+    args = parser.parse_args()
+    try:
+        if parseEngineSettings(args.engine)["backend"] != "python":
+            raise ValueError("The test suite searches with the python backend")
+        runSuite(args.suite, args.engine, args.workers, args.jsonl)
+    except ValueError as error:
+        parser.error(str(error))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Runs the engine search in a background thread, so the pygame loop keeps handling events and drawing while the AI
+thinks. The search works on a copy of the position and can be cancelled at any time. During the turn of the human the
+worker can ponder: search the position after the expected reply, to answer right away if the reply is played.
+"""
+
+import copy
+import threading
+
+'''
+One search at a time: start() launches it, poll() returns the result once it is done and cancel() stops it. The
+search function is called as searchFunction(gs, stopEvent, ponderhitEvent), ponderhitEvent is None unless pondering.
+'''
+class SearchWorker():
+    def __init__(self):
+        self.thread = None
+        self.stopEvent = None
+        self.ponderhitEvent = None
+        self.ponderMove = None
+        self.positionKey = None
+        self.result = None
+        self.error = None
+
+    def isRunning(self):
+        return self.thread is not None
+
+    '''
+    True while the worker ponders on a reply that hasn't been played yet
+    '''
+
+    def isPondering(self):
+        return self.thread is not None and self.ponderMove is not None and not self.ponderhitEvent.is_set()
+
+    '''
+    Search gs, or with ponderMove the position after it. Returns False if ponderMove isn't a valid move of gs.
+    '''
+
+    def start(self, gs, searchFunction, ponderMove=None):
+        self.cancel()
+        gs = copy.deepcopy(gs)
+        self.ponderhitEvent = None
+        self.ponderMove = None
+        if ponderMove is not None:
+            validMoves = gs.getValidMoves()
+            if ponderMove not in validMoves:
+                return False
+            gs.makeMove(validMoves[validMoves.index(ponderMove)])
+            self.ponderhitEvent = threading.Event()
+            self.ponderMove = ponderMove
+        self.stopEvent = threading.Event()
+        self.positionKey = (gs.zobristKey, len(gs.moveLog))
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self.run, args=(gs, searchFunction, self.stopEvent, self.ponderhitEvent),
+                                       daemon=True)
+        self.thread.start()
+        return True
+
+    '''
+    The human played a move: turn the ponder search into the real search if it was the expected one, drop it otherwise
+    '''
+
+    def playedMove(self, move):
+        if not self.isPondering():
+            return
+        if move == self.ponderMove:
+            self.ponderhitEvent.set()
+        else:
+            self.cancel()
+
+    def run(self, gs, searchFunction, stopEvent, ponderhitEvent):
+        try:
+            result = searchFunction(gs, stopEvent, ponderhitEvent)
+        except Exception as error:
+            self.error = error
+            return
+        if not stopEvent.is_set():
+            self.result = result
+
+    '''
+    Return (True, result) once the search for gs has finished and (False, None) while it is running. A result for
+    another position than the current one of gs is dropped.
+    '''
+
+    def poll(self, gs):
+        if self.thread is None or self.thread.is_alive():
+            return False, None
+        self.thread = None
+        if self.error is not None:
+            raise self.error
+        if self.positionKey != (gs.zobristKey, len(gs.moveLog)):
+            return False, None
+        return True, self.result
+
+    '''
+    Stop the running search and wait for it to unwind, the search functions share module level tables so the next
+    search must not start before that
+    '''
+
+    def cancel(self):
+        if self.thread is None:
+            return
+        self.stopEvent.set()
+        self.thread.join()
+        self.thread = None
+        self.result = None
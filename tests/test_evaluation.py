@@ -0,0 +1,42 @@
+"""
+The NumPy batch evaluation of ChessEvaluation must give the scores of the position evaluations, for the boards after
+every kind of move (captures, castling, en passant, promotions).
+"""
+
+import pytest
+
+from Chess import ChessAI
+from Chess import ChessBitboard
+from Chess import ChessPerft
+from Chess.ChessEvaluation import EVALUATIONS
+
+@pytest.mark.parametrize("evaluation", sorted(EVALUATIONS))
+@pytest.mark.parametrize("name, fen", [(name, fen) for name, fen, counts in ChessPerft.PERFT_SUITE])
+def test_leaf_moves_match_evaluation(monkeypatch, evaluation, name, fen):
+    monkeypatch.setattr(ChessAI, "evaluatePosition", EVALUATIONS[evaluation])
+    gs = ChessBitboard.GameState()
+    gs.loadFEN(fen)
+    for move in gs.getValidMoves():  # The positions one ply deeper as well
+        gs.makeMove(move)
+        validMoves = gs.getValidMoves()
+        scores = ChessAI.evaluateLeafMoves(gs, validMoves)
+        assert len(scores) == len(validMoves)
+        for child, score in zip(validMoves, scores):
+            gs.makeMove(child)
+            assert score == pytest.approx(EVALUATIONS[evaluation](gs)), child.getChessNotation()
+            gs.undoMove()
+        gs.undoMove()
+
+@pytest.mark.parametrize("depth", [2, 3])
+def test_batch_search_matches_sequential(monkeypatch, depth):
+    monkeypatch.setattr(ChessAI, "QUIESCENCE_SEARCH", False)
+    monkeypatch.setattr(ChessAI, "transpositionTable", ChessAI.TranspositionTable(16))
+    results = []
+    for batch in (False, True):
+        monkeypatch.setattr(ChessAI, "BATCH_LEAF_EVALUATION", batch)
+        ChessAI.transpositionTable.clear()
+        gs = ChessBitboard.GameState()
+        gs.loadFEN(ChessPerft.PERFT_SUITE[1][1])
+        ChessAI.findBestMove(gs, depth)
+        results.append(ChessAI.searchStats.score)
+    assert results[0] == results[1]
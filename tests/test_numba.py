@@ -0,0 +1,46 @@
+"""
+The compiled search of ChessNumba: it releases the GIL and stops within an iteration when it is cancelled.
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("numba")
+
+from Chess import ChessBitboard
+from Chess import ChessNumba
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+def newGameState():
+    gs = ChessBitboard.GameState()
+    gs.loadFEN(KIWIPETE)
+    return gs
+
+def test_cancel_interrupts_iteration():
+    ChessNumba.warmUp()
+    stopEvent = threading.Event()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(ChessNumba.findBestMove(newGameState(), maxDepth=64,
+                                                                                    stopEvent=stopEvent)))
+    thread.start()
+    time.sleep(0.5)
+    stopTime = time.perf_counter()
+    stopEvent.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert time.perf_counter() - stopTime < 0.5
+    score, move, nodes = results[0]
+    assert move in newGameState().getValidMoves()
+
+def test_search_releases_gil():
+    ChessNumba.warmUp()
+    ticks = []
+    thread = threading.Thread(target=lambda: ChessNumba.findBestMove(newGameState(), maxDepth=64, maxTime=0.5))
+    thread.start()
+    while thread.is_alive():
+        ticks.append(time.perf_counter())
+        time.sleep(0.001)
+    assert len(ticks) > 50  # Holding the GIL for whole iterations would leave a handful
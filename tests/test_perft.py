@@ -0,0 +1,32 @@
+"""
+The shallow depths of the perft suite on every engine, so a change to the move generators or to make/undo that
+miscounts fails the tests. The full suite and the speed are reported by python -m Chess.ChessPerft.
+"""
+
+import io
+
+import pytest
+
+from Chess import ChessPerft
+
+MAX_NODES = 10000  # Deepest depth of each position that is counted, by expected nodes
+
+CASES = [(name, fen, depth, expected) for name, fen, expectedCounts in ChessPerft.PERFT_SUITE
+         for depth, expected in enumerate(expectedCounts, start=1) if expected <= MAX_NODES]
+
+@pytest.fixture(params=["string", "bitboard", "numba"])
+def engine(request):
+    if request.param == "numba":
+        pytest.importorskip("numba")
+    return request.param
+
+@pytest.mark.parametrize("name, fen, depth, expected", CASES, ids=["%s, depth %d" % (case[0], case[2]) for case in CASES])
+def test_perft(engine, name, fen, depth, expected):
+    gs = ChessPerft.newGameState(engine, fen)
+    assert ChessPerft.countNodes(gs, depth, engine) == expected
+    assert gs.getFEN() == ChessPerft.newGameState(engine, fen).getFEN()  # Make/undo restored the position
+
+def test_suite_report():
+    out = io.StringIO()
+    assert ChessPerft.runSuite("bitboard", maxNodes=1000, out=out)
+    assert out.getvalue().rstrip().endswith("all passed")
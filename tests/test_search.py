@@ -0,0 +1,43 @@
+"""
+Searches of ChessAI at a fixed depth. Principal variation search only changes which windows are searched, so with the
+reductions switched off it has to find the same score as the plain alpha-beta search.
+"""
+
+import pytest
+
+from Chess import ChessAI
+from Chess import ChessBitboard
+
+# White's first ordered move (Qxd4) runs into a back rank mate, the zero windows of the other moves start at -inf
+MATE_FIRST = "4r1k1/5ppp/8/8/3n4/8/5PPP/3Q2K1 w - - 0 1"
+
+def searchScore(fen, depth):
+    ChessAI.transpositionTable = ChessAI.TranspositionTable(16)
+    ChessAI.killerMoves = {}
+    ChessAI.historyTable = {piece: [0] * 64 for piece in ChessAI.historyTable}
+    gs = ChessBitboard.GameState()
+    gs.loadFEN(fen)
+    move = ChessAI.findBestMove(gs, depth)
+    return ChessAI.searchStats.score, move
+
+@pytest.fixture(autouse=True)
+def restoreSettings(monkeypatch):
+    monkeypatch.setattr(ChessAI, "transpositionTable", ChessAI.transpositionTable)
+    monkeypatch.setattr(ChessAI, "killerMoves", ChessAI.killerMoves)
+    monkeypatch.setattr(ChessAI, "historyTable", ChessAI.historyTable)
+    monkeypatch.setattr(ChessAI, "LATE_MOVE_REDUCTIONS", False)
+    monkeypatch.setattr(ChessAI, "NULL_MOVE_PRUNING", False)
+
+@pytest.mark.parametrize("depth", [2, 3, 4])
+def test_pvs_matches_alpha_beta(monkeypatch, depth):
+    monkeypatch.setattr(ChessAI, "PRINCIPAL_VARIATION_SEARCH", False)
+    expectedScore, expectedMove = searchScore(MATE_FIRST, depth)
+    monkeypatch.setattr(ChessAI, "PRINCIPAL_VARIATION_SEARCH", True)
+    score, move = searchScore(MATE_FIRST, depth)
+    assert score == expectedScore
+    assert move.getChessNotation() != "d1d4"
+
+def test_zero_window_needs_finite_bound():
+    assert ChessAI.zeroWindow(-ChessAI.CHECKMATE, 1, True) is None
+    assert ChessAI.zeroWindow(-1, ChessAI.CHECKMATE, False) is None
+    assert ChessAI.zeroWindow(0.5, ChessAI.CHECKMATE, True) == (0.5, 0.5 + ChessAI.ZERO_WINDOW)